@@ -3,12 +3,20 @@ TODO: add docs here, so `help(conu)` looks good
 """
 # docker backend
 from conu.backend.docker.backend import DockerBackend
-from conu.backend.docker.container import DockerContainer, DockerRunBuilder, DockerContainerFS
-from conu.backend.docker.image import DockerImage, S2IDockerImage, DockerImageFS
+from conu.backend.docker.container import (
+    DockerContainer, DockerRunBuilder, DockerRunSpec, DockerContainerFS
+)
+from conu.backend.docker.image import DockerImage, S2IDockerImage, DockerImageFS, S2IBuildResult
+from conu.backend.docker.pull import pull_many, PullProgress, MultiPullProgress
+from conu.backend.docker.pool import ContainerPool, get_container_pool, close_container_pools
+from conu.backend.docker.stats import ResourceSample, ResourceSampler
+from conu.backend.docker.wait import as_completed, wait_all, wait_any
 
 # utils
-from conu.utils.filesystem import Directory
-from conu.utils.probes import Probe, ProbeTimeout, CountExceeded
+from conu.utils.filesystem import Directory, DirectorySet
+from conu.utils.probes import (Probe, ProbeGroup, ProbeTimeout, CountExceeded, ProbeReport,
+                               ExponentialBackoff, FastThenSlow, FixedPause,
+                               get_probe_registry)
 from conu.utils import run_cmd, check_port, get_selinux_status, random_str
 
 # exceptions
@@ -5,6 +5,7 @@ This is backend for docker engine
 from conu.apidefs.backend import Backend
 from conu.backend.docker.container import DockerContainer
 from conu.backend.docker.image import DockerImage
+from conu.backend.docker.session import cleanup, get_session_id
 
 
 # TODO: use docker-py
@@ -16,3 +17,29 @@ class DockerBackend(Backend):
 
     ContainerClass = DockerContainer
     ImageClass = DockerImage
+
+    @staticmethod
+    def get_session_id():
+        """
+        ID of the current session: containers and images created by conu are labeled with it
+
+        :return: str
+        """
+        return get_session_id()
+
+    def cleanup(self, session=None, all_sessions=False, older_than=None, images=True,
+                parallelism=8):
+        """
+        remove containers and images created by conu, e.g. those leaked by crashed test runs
+
+        :param session: str, ID of the session to clean up, defaults to the current session
+        :param all_sessions: bool, clean up all the sessions, including those of other
+                processes which may still be running; session is ignored
+        :param older_than: int, float (seconds) or datetime.timedelta, remove only objects
+                created earlier than this
+        :param images: bool, remove images as well
+        :param parallelism: int, number of objects removed at the same time
+        :return: instance of CleanupSummary
+        """
+        return cleanup(session_id=session, all_sessions=all_sessions, older_than=older_than,
+                       images=images, parallelism=parallelism)
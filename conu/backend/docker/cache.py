@@ -0,0 +1,189 @@
+"""
+process-wide cache of image metadata, so that `docker inspect` is not invoked over and over
+again for the same image, and a persistent cache of s2i builds
+"""
+from __future__ import print_function, unicode_literals
+
+import contextlib
+import fcntl
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import six
+
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class ImageMetadataCache(object):
+    """
+    Cache of `docker image inspect` output keyed by image name and ID; entries expire after
+    `ttl` seconds.
+    """
+    def __init__(self, ttl=60):
+        """
+        :param ttl: int or float, number of seconds an entry is valid, None means forever
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        get metadata of selected image
+
+        :param key: str, image name or ID
+        :return: dict or None if not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored, metadata = entry
+            if self.ttl is not None and monotonic() - stored > self.ttl:
+                logger.debug("cached metadata of %s expired", key)
+                del self._entries[key]
+                return None
+            return metadata
+
+    def put(self, key, metadata):
+        """
+        store metadata of an image under provided key and its ID
+
+        :param key: str, image name or ID
+        :param metadata: dict, output of `docker image inspect`
+        :return: None
+        """
+        now = monotonic()
+        with self._lock:
+            self._entries[key] = (now, metadata)
+            if metadata.get("Id"):
+                self._entries[metadata["Id"]] = (now, metadata)
+
+    def invalidate(self, *keys):
+        """
+        remove images from the cache; all names pointing to the same image ID are removed too
+
+        :param keys: str, image names or IDs
+        :return: None
+        """
+        with self._lock:
+            ids = set(keys)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and entry[1].get("Id"):
+                    ids.add(entry[1]["Id"])
+            for key, (_, metadata) in list(self._entries.items()):
+                if key in ids or metadata.get("Id") in ids:
+                    del self._entries[key]
+
+    def clear(self):
+        """
+        remove all the entries
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+image_metadata_cache = ImageMetadataCache()
+
+
+def get_image_metadata_cache():
+    return image_metadata_cache
+
+
+class S2IBuildCache(object):
+    """
+    Persistent mapping of s2i build inputs (source tree checksum, builder image ID, arguments)
+    to the ID of the image which was built from them. It's stored as a JSON file which is
+    replaced atomically; updates are serialized by an exclusive lock of `<path>.lock`, so
+    concurrent test runs don't lose each other's entries.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: str, path to the JSON file, defaults to
+                $XDG_CACHE_HOME/conu/s2i-builds.json
+        """
+        if path is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or \
+                os.path.join(os.path.expanduser("~"), ".cache")
+            path = os.path.join(cache_home, "conu", "s2i-builds.json")
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with io.open(self.path) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError) as ex:
+            logger.debug("s2i build cache %s can't be read: %s", self.path, ex)
+            return {}
+
+    def get(self, key):
+        """
+        get ID of an image built from inputs identified by key
+
+        :param key: str
+        :return: str or None
+        """
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, image_id):
+        """
+        record ID of an image built from inputs identified by key
+
+        :param key: str
+        :param image_id: str
+        :return: None
+        """
+        with self._locked():
+            entries = self._load()
+            entries[key] = image_id
+            # write atomically so that concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                            prefix=".s2i-builds")
+            try:
+                with io.open(fd, "w") as f:
+                    f.write(six.text_type(json.dumps(entries, indent=2, sort_keys=True)))
+                os.rename(tmp_path, self.path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        hold the lock of the cache file, it excludes other threads and other processes
+        """
+        directory = os.path.dirname(self.path)
+        with self._lock:
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+            # the cache file itself is replaced on every write, so a separate file is locked
+            with io.open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+s2i_build_cache = None
+
+
+def get_s2i_build_cache():
+    global s2i_build_cache
+    if s2i_build_cache is None:
+        s2i_build_cache = S2IBuildCache()
+    return s2i_build_cache
@@ -5,11 +5,18 @@ from __future__ import print_function, unicode_literals
 
 import docker
 
+from conu.utils.instrumentation import InstrumentedClient
+
 client = None
 
 
 def get_client():
+    """
+    provide the docker API client; its calls are reported to instrumentation hooks
+
+    :return: instance of InstrumentedClient wrapping docker.APIClient
+    """
     global client
     if client is None:
-        client = docker.APIClient(version="auto")
+        client = InstrumentedClient(docker.APIClient(version="auto"))
     return client
@@ -3,20 +3,30 @@ Implementation of a docker container
 """
 from __future__ import print_function, unicode_literals
 
+import collections
 import functools
 import logging
+import os
+import tempfile
 
+import six
 from docker.errors import NotFound
 
 from conu.apidefs.container import Container
 from conu.apidefs.filesystem import Filesystem
 from conu.backend.docker.client import get_client
+from conu.backend.docker.session import session_labels
+from conu.backend.docker.stats import parse_stats
 from conu.exceptions import ConuException
-from conu.utils import check_port, run_cmd
+from conu.utils import check_port, random_str, run_cmd
+from conu.utils.capabilities import has_binary
 from conu.utils.probes import Probe
 
 logger = logging.getLogger(__name__)
 
+# repository of images created by DockerContainer.snapshot
+SNAPSHOT_REPOSITORY = "conu-snapshot"
+
 
 class DockerRunBuilder(object):
     """
@@ -47,6 +57,194 @@ class DockerRunBuilder(object):
             [self.image_name] + self.arguments
 
 
+def _pairs(value):
+    """ dict (or iterable of pairs) -> sorted tuple of (key, value) tuples """
+    if not value:
+        return ()
+    if isinstance(value, dict):
+        value = value.items()
+    return tuple(sorted((six.text_type(k), six.text_type(v)) for k, v in value))
+
+
+def _ports(value):
+    """ {container_port: host_port or None} or [container_port] -> tuple of pairs """
+    if not value:
+        return ()
+    if isinstance(value, dict):
+        value = value.items()
+    result = []
+    for port in value:
+        if not isinstance(port, (tuple, list)):
+            port = (port, None)
+        container_port, host_port = port
+        result.append((six.text_type(container_port),
+                       None if host_port is None else six.text_type(host_port)))
+    return tuple(result)
+
+
+def _volumes(value):
+    """ {host_path: container_path} or [(host, container[, mode])] -> tuple of triples """
+    if not value:
+        return ()
+    if isinstance(value, dict):
+        value = value.items()
+    result = []
+    for volume in value:
+        host, container = volume[0], volume[1]
+        mode = volume[2] if len(volume) > 2 else None
+        result.append((host, container, mode))
+    return tuple(result)
+
+
+class DockerRunSpec(collections.namedtuple("DockerRunSpec", [
+        "command", "name", "ports", "volumes", "env", "labels", "memory", "cpus",
+        "network", "user", "workdir", "entrypoint", "additional_opts"])):
+    """
+    Immutable description of a container to run. It renders either to arguments of
+    `docker run` (`to_cli_options`, `to_builder`) or to keyword arguments of docker-py's
+    `create_container` (`to_create_kwargs`). Use `replace` to derive specs, e.g. when
+    launching many containers which differ only in name:
+
+    ::
+
+        spec = DockerRunSpec(command=["sleep", "infinity"], ports={8080: None},
+                             env={"DEBUG": "1"}, memory="256m")
+        containers = [image.run_via_api(spec.replace(name="worker-%d" % i)) for i in range(8)]
+    """
+    __slots__ = ()
+
+    def __new__(cls, command=None, name=None, ports=None, volumes=None, env=None, labels=None,
+                memory=None, cpus=None, network=None, user=None, workdir=None, entrypoint=None,
+                additional_opts=None):
+        """
+        :param command: list of str, command to run in the container
+        :param name: str, name of the container
+        :param ports: dict {container port: host port or None} or list of container ports,
+                container port can specify protocol, e.g. "53/udp"
+        :param volumes: dict {host path: container path} or list of tuples
+                (host path, container path[, mode])
+        :param env: dict, environment variables
+        :param labels: dict
+        :param memory: str or int, memory limit, e.g. "512m"
+        :param cpus: float, number of CPUs
+        :param network: str, network to connect the container to
+        :param user: str, user to run the command as
+        :param workdir: str, working directory
+        :param entrypoint: str
+        :param additional_opts: list of str, extra options for `docker run`, they are not
+                mapped to API calls
+        """
+        return super(DockerRunSpec, cls).__new__(
+            cls, tuple(command or ()), name, _ports(ports), _volumes(volumes), _pairs(env),
+            _pairs(labels), memory, cpus, network, user, workdir, entrypoint,
+            tuple(additional_opts or ()))
+
+    def replace(self, **kwargs):
+        """
+        create a new spec with selected fields changed
+
+        :param kwargs: fields of the spec, same as arguments of the constructor
+        :return: instance of DockerRunSpec
+        """
+        fields = self._asdict()
+        fields.update(kwargs)
+        return DockerRunSpec(**fields)
+
+    def to_cli_options(self):
+        """
+        render the spec as options of `docker run`
+
+        :return: list of str
+        """
+        options = []
+        if self.name:
+            options += ["--name", self.name]
+        for container_port, host_port in self.ports:
+            options += ["-p", container_port if host_port is None
+                        else "%s:%s" % (host_port, container_port)]
+        for host, container, mode in self.volumes:
+            options += ["-v", ":".join(x for x in (host, container, mode) if x)]
+        for env in self.env:
+            options += ["-e", "%s=%s" % env]
+        for label in self.labels:
+            options += ["--label", "%s=%s" % label]
+        if self.memory is not None:
+            options += ["--memory", six.text_type(self.memory)]
+        if self.cpus is not None:
+            options += ["--cpus", six.text_type(self.cpus)]
+        if self.network:
+            options += ["--network", self.network]
+        if self.user:
+            options += ["--user", self.user]
+        if self.workdir:
+            options += ["--workdir", self.workdir]
+        if self.entrypoint:
+            options += ["--entrypoint", self.entrypoint]
+        return options + list(self.additional_opts)
+
+    def to_builder(self):
+        """
+        render the spec as DockerRunBuilder, so it can be used with `run_via_binary`
+
+        :return: instance of DockerRunBuilder
+        """
+        return DockerRunBuilder(command=list(self.command), additional_opts=self.to_cli_options())
+
+    def to_create_kwargs(self, client=None):
+        """
+        render the spec as keyword arguments of `docker.APIClient.create_container`
+
+        :param client: instance of docker.APIClient used to create host config,
+                defaults to conu's client
+        :return: dict
+        """
+        if self.additional_opts:
+            raise ConuException("additional_opts can't be mapped to an API call: %s"
+                                % (self.additional_opts, ))
+        client = client or get_client()
+        ports, port_bindings = [], {}
+        for container_port, host_port in self.ports:
+            port, _, protocol = container_port.partition("/")
+            ports.append((int(port), protocol) if protocol else int(port))
+            port_bindings[container_port] = host_port and (
+                tuple(host_port.rsplit(":", 1)) if ":" in host_port else int(host_port))
+        host_config = {}
+        if port_bindings:
+            host_config["port_bindings"] = port_bindings
+        if self.volumes:
+            host_config["binds"] = [":".join(x for x in v if x) for v in self.volumes]
+        if self.memory is not None:
+            host_config["mem_limit"] = self.memory
+        if self.cpus is not None:
+            host_config["nano_cpus"] = int(self.cpus * 1e9)
+        if self.network:
+            host_config["network_mode"] = self.network
+        kwargs = {
+            "command": list(self.command) or None,
+            "name": self.name,
+            "ports": ports or None,
+            "volumes": [v[1] for v in self.volumes] or None,
+            "environment": dict(self.env) or None,
+            "labels": dict(self.labels) or None,
+            "user": self.user,
+            "working_dir": self.workdir,
+            "entrypoint": self.entrypoint,
+            "host_config": client.create_host_config(**host_config),
+        }
+        return dict((k, v) for k, v in kwargs.items() if v is not None)
+
+
+class ContainerSnapshot(collections.namedtuple("ContainerSnapshot", [
+        "container_id", "name", "image_id", "host_config", "checkpoint", "volumes"])):
+    """
+    State of a container created by DockerContainer.snapshot: either an image committed
+    from the container (image_id, host_config) with content of its anonymous volumes
+    (volumes: dict, path in the container -> tar archive on host), or a name of a CRIU
+    checkpoint (checkpoint).
+    """
+    __slots__ = ()
+
+
 class DockerContainerFS(Filesystem):
     def __init__(self, container, mount_point=None):
         """
@@ -57,6 +255,8 @@ class DockerContainerFS(Filesystem):
         self.container = container  # convenience
 
     def __enter__(self):
+        if not has_binary("atomic"):
+            raise ConuException("atomic executable is not available, it's needed for mounting")
         cmd = ["atomic", "mount", self.container.get_id(), self.mount_point]
         logger.debug(cmd)
         run_cmd(cmd)
@@ -277,6 +477,18 @@ class DockerContainer(Container):
         """
         return self.d.logs(self.get_id(), stream=follow, follow=follow)
 
+    def stats(self, stream=True):
+        """
+        get resource usage of this container
+
+        :param stream: bool, provide iterator of samples, the daemon sends one about every
+                second while the container is running
+        :return: instance of ResourceSample or iterator of them
+        """
+        if not stream:
+            return parse_stats(self.d.stats(self.get_id(), stream=False))
+        return (parse_stats(s) for s in self.d.stats(self.get_id(), decode=True, stream=True))
+
     def stop(self):
         """
         stop this container
@@ -306,6 +518,126 @@ class DockerContainer(Container):
         """
         self.d.remove_container(self.get_id(), v=volumes, force=force)
 
+    def _writable_mounts(self, metadata):
+        """
+        :return: tuple (destinations of anonymous volumes, destinations of other writable
+                mounts: bind mounts and named volumes)
+        """
+        host_config = metadata["HostConfig"]
+        named = set(b.split(":")[1] for b in host_config.get("Binds") or [] if ":" in b)
+        named.update(m.get("Target") for m in host_config.get("Mounts") or [])
+        anonymous, shared = [], []
+        for m in metadata.get("Mounts") or []:
+            if m.get("Type") == "volume" and m["Destination"] not in named:
+                anonymous.append(m["Destination"])
+            elif m.get("RW"):
+                shared.append(m["Destination"])
+        return anonymous, shared
+
+    def snapshot(self, checkpoint=False):
+        """
+        capture state of this container, so it can be brought back using `restore`; this is
+        meant for containers with services which take long to initialize: prepare the
+        container once, snapshot it and restore it between tests instead of starting a new one
+
+        By default, the filesystem of the container is committed into an image and content
+        of its anonymous volumes (e.g. declared by VOLUME in Dockerfile) is archived on host;
+        restoring starts a new container from the image with the volumes filled from the
+        archives. With checkpoint=True, the container's processes are checkpointed using
+        CRIU: this needs docker daemon with experimental features enabled and CRIU
+        installed, but processes don't need to boot again after restore; volumes are not
+        captured, so such containers can't have writable volumes.
+
+        Writable bind mounts and named volumes are shared with the host or other containers,
+        containers with them can't be snapshotted.
+
+        :param checkpoint: bool, create a CRIU checkpoint instead of committing an image
+        :return: instance of ContainerSnapshot
+        """
+        metadata = self.get_metadata(refresh=True)
+        name = metadata["Name"].lstrip("/")
+        anonymous, shared = self._writable_mounts(metadata)
+        if shared:
+            raise ConuException("Container %s has writable bind mounts or named volumes (%s), "
+                                "they can't be snapshotted." % (name, ", ".join(shared)))
+        if checkpoint:
+            if anonymous:
+                raise ConuException("Volumes of container %s (%s) can't be checkpointed."
+                                    % (name, ", ".join(anonymous)))
+            if not self.d.info().get("ExperimentalBuild"):
+                raise ConuException("Checkpoints are supported only by docker daemon "
+                                    "with experimental features enabled.")
+            checkpoint_name = "conu-%s" % random_str()
+            run_cmd(["docker", "checkpoint", "create", "--leave-running",
+                     self.get_id(), checkpoint_name])
+            return ContainerSnapshot(self.get_id(), name, None, None, checkpoint_name, {})
+        changes = ['LABEL "%s"="%s"' % label for label in sorted(session_labels().items())]
+        response = self.d.commit(self.get_id(), repository=SNAPSHOT_REPOSITORY,
+                                 tag=random_str(), message="snapshot of %s" % name,
+                                 changes=changes)
+        logger.debug("container %s committed as %s", self, response["Id"])
+        volumes = {}
+        try:
+            for destination in anonymous:
+                stream, _ = self.d.get_archive(self.get_id(), destination)
+                fd, path = tempfile.mkstemp(prefix="conu-snapshot-", suffix=".tar")
+                volumes[destination] = path
+                with os.fdopen(fd, "wb") as archive:
+                    for chunk in stream:
+                        archive.write(chunk)
+                logger.debug("volume %s of %s archived in %s", destination, self, path)
+        except Exception:
+            self.delete_snapshot(ContainerSnapshot(self.get_id(), name, response["Id"],
+                                                   None, None, volumes))
+            raise
+        return ContainerSnapshot(self.get_id(), name, response["Id"],
+                                 metadata["HostConfig"], None, volumes)
+
+    def restore(self, snapshot):
+        """
+        bring this container back to the state captured by `snapshot`: a container restored
+        from an image replaces this one (with the same name and host configuration), so
+        the ID of this container changes
+
+        :param snapshot: instance of ContainerSnapshot
+        :return: None
+        """
+        if snapshot.checkpoint:
+            if snapshot.container_id != self.get_id():
+                raise ConuException("Checkpoint %s belongs to a different container."
+                                    % snapshot.checkpoint)
+            if self.is_running():
+                self.kill()
+            run_cmd(["docker", "start", "--checkpoint", snapshot.checkpoint, self.get_id()])
+        else:
+            self.delete(force=True, volumes=True)
+            response = self.d.create_container(snapshot.image_id, name=snapshot.name,
+                                               host_config=snapshot.host_config)
+            self._id = response["Id"]
+            self.popen_instance = None
+            for destination, path in sorted(snapshot.volumes.items()):
+                with open(path, "rb") as archive:
+                    self.d.put_archive(self._id, os.path.dirname(destination), archive)
+            self.start()
+        self._metadata = None
+
+    def delete_snapshot(self, snapshot):
+        """
+        remove image or checkpoint created by `snapshot` and archives of volumes
+
+        :param snapshot: instance of ContainerSnapshot
+        :return: None
+        """
+        if snapshot.checkpoint:
+            run_cmd(["docker", "checkpoint", "rm", snapshot.container_id, snapshot.checkpoint])
+        else:
+            self.d.remove_image(snapshot.image_id, force=True)
+        for path in snapshot.volumes.values():
+            try:
+                os.unlink(path)
+            except OSError as ex:
+                logger.warning("can't remove archive %s: %r", path, ex)
+
     def mount(self, mount_point=None):
         """
         mount container filesystem
@@ -4,20 +4,86 @@ Utilities related to manipulate docker images.
 """
 from __future__ import print_function, unicode_literals
 
+import collections
+import copy
+import hashlib
+import json
 import logging
 import os
-import shutil
+import re
 import subprocess
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from docker.errors import APIError, NotFound
 
 from conu.apidefs.filesystem import Filesystem
 from conu.apidefs.image import Image, S2Image
+from conu.backend.docker.cache import get_image_metadata_cache, get_s2i_build_cache
 from conu.backend.docker.client import get_client
-from conu.backend.docker.container import DockerContainer, DockerRunBuilder
+from conu.backend.docker.container import DockerContainer, DockerRunBuilder, DockerRunSpec
+from conu.backend.docker.pull import PullProgress
+from conu.backend.docker.session import label_options, session_labels
 from conu.exceptions import ConuException
-from conu.utils import run_cmd
+from conu.utils import monotonic, run_cmd
+from conu.utils.capabilities import has_binary, s2i_supports_labels
+from conu.utils.runner import get_command_runner
+from conu.utils.archive import (
+    ArchiveWriter, CHUNK_SIZE, compute_tree_checksum, read_chunks, verify_checksum,
+    write_checksum_file
+)
 
 logger = logging.getLogger(__name__)
 
+# fingerprint of configuration of containers created by DockerImage.run_or_reuse
+CONFIG_LABEL = "io.github.conu.config"
+
+
+def _to_builder(run_command_instance):
+    """
+    provide a copy of DockerRunBuilder (or render DockerRunSpec) which can be modified
+    without affecting the caller
+
+    :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec or None
+    :return: instance of DockerRunBuilder
+    """
+    if run_command_instance is None:
+        return DockerRunBuilder()
+    if isinstance(run_command_instance, DockerRunSpec):
+        return run_command_instance.to_builder()
+    if not isinstance(run_command_instance, DockerRunBuilder):
+        raise ConuException("run_command_instance needs to be an instance of DockerRunBuilder "
+                            "or DockerRunSpec")
+    builder = copy.copy(run_command_instance)
+    builder.options = list(run_command_instance.options)
+    return builder
+
+
+def with_session_labels(run_command_instance):
+    """
+    provide a copy of DockerRunBuilder which labels the container with the current session
+
+    :param run_command_instance: instance of DockerRunBuilder
+    :return: instance of DockerRunBuilder
+    """
+    labeled = _to_builder(run_command_instance)
+    labeled.options += label_options(session_labels())
+    return labeled
+
+
+def split_image_reference(reference):
+    """
+    split image reference into name and tag, "latest" is implied when tag is not specified
+
+    :param reference: str, e.g. "fedora:27" or "localhost:5000/fedora"
+    :return: tuple, (name, tag)
+    """
+    name, _, tag = reference.rpartition(":")
+    if not name or "/" in tag:  # no tag, a colon may belong to registry's port
+        return reference, "latest"
+    return name, tag
+
 
 class DockerImageFS(Filesystem):
     def __init__(self, image, mount_point=None):
@@ -29,6 +95,8 @@ class DockerImageFS(Filesystem):
         self.image = image
 
     def __enter__(self):
+        if not has_binary("atomic"):
+            raise ConuException("atomic executable is not available, it's needed for mounting")
         # FIXME: I'm not sure about this, is doing docker save/export better?
         run_cmd(["atomic", "mount", self.image.get_full_name(), self.mount_point])
         return super(DockerImageFS, self).__enter__()
@@ -76,14 +144,56 @@ class DockerImage(Image):
             self._id = self.get_metadata(refresh=False)["Id"]
         return self._id
 
-    def pull(self):
+    def pull(self, progress_callback=None, progress=None, skip_present=False):
         """
         pull this image
 
-        :return: None
+        :param progress_callback: callable, invoked with an instance of PullProgress every time
+                docker reports progress of the pull
+        :param progress: instance of PullProgress to update, a new one is created when not set
+        :param skip_present: bool, don't pull the image if it's already present locally and its
+                digest matches the one in the registry
+        :return: instance of PullProgress
+        """
+        progress = progress or PullProgress(self.get_full_name())
+        if skip_present and self.is_up_to_date():
+            logger.info("image %s is up to date, skipping pull", self)
+            progress.skipped = True
+            progress.finish()
+            return progress
+        try:
+            for o in self.d.pull(repository=self.name, tag=self.tag, stream=True, decode=True):
+                logger.debug(o)
+                progress.update(o)
+                if progress_callback:
+                    progress_callback(progress)
+        finally:
+            progress.finish()
+            # the name may point to a different image now
+            self._forget_metadata()
+        logger.info("pulled %s: %d bytes in %.2f seconds",
+                    self, progress.downloaded_bytes, progress.elapsed)
+        return progress
+
+    def is_up_to_date(self):
+        """
+        check whether this image is present locally and has the same digest as the image
+        in the registry; False is returned if the registry can't be queried
+
+        :return: bool
         """
-        for o in self.d.pull(repository=self.name, tag=self.tag, stream=True):
-            logger.debug(o)
+        try:
+            local_metadata = self.d.inspect_image(self.get_full_name())
+        except NotFound:
+            return False
+        try:
+            # available since docker-py 3.0
+            distribution = self.d.inspect_distribution(self.get_full_name())
+        except (AttributeError, APIError) as ex:
+            logger.debug("can't obtain digest of %s from registry: %s", self, ex)
+            return False
+        digest = distribution["Descriptor"]["digest"]
+        return any(d.endswith("@" + digest) for d in local_metadata.get("RepoDigests") or [])
 
     def tag_image(self, repository=None, tag=None):
         """
@@ -98,7 +208,9 @@ class DockerImage(Image):
         r = repository or self.name
         t = "latest" if not tag else tag
         self.d.tag(image=self.get_full_name(), repository=r, tag=t)
-        return DockerImage(r, tag=t)
+        new_image = DockerImage(r, tag=t)
+        get_image_metadata_cache().invalidate(new_image.get_full_name())
+        return new_image
 
     def inspect(self, refresh=True):
         """
@@ -111,7 +223,8 @@ class DockerImage(Image):
 
     def get_metadata(self, refresh=True):
         """
-        return cached metadata by default
+        return cached metadata by default; when refresh is False, metadata are also looked up
+        in the process-wide cache shared by all DockerImage instances
 
         :param refresh: bool, update the metadata with up to date content
         :return: dict
@@ -120,9 +233,40 @@ class DockerImage(Image):
             ident = self._id or self.get_full_name()
             if not ident:
                 raise ConuException("This image does not have a valid identifier.")
-            self._metadata = self.d.inspect_image(ident)
+            cache = get_image_metadata_cache()
+            metadata = None if refresh else cache.get(ident)
+            if metadata is None:
+                metadata = self.d.inspect_image(ident)
+                cache.put(ident, metadata)
+            self._metadata = metadata
         return self._metadata
 
+    def _forget_metadata(self):
+        """
+        drop all cached metadata of this image, both in this instance and process-wide
+
+        :return: None
+        """
+        keys = [self.get_full_name()]
+        if self._id:
+            keys.append(self._id)
+        get_image_metadata_cache().invalidate(*keys)
+        self._id = None
+        self._metadata = None
+
+    def ensure_present(self):
+        """
+        pull the image if it's not present locally; cached metadata are used when available
+        so this is cheap to call repeatedly
+
+        :return: None
+        """
+        try:
+            self.get_metadata(refresh=False)
+        except NotFound:
+            logger.info("image %s is not present, pulling it", self)
+            self.pull()
+
     def rmi(self, force=False, via_name=False):
         """
         remove this image
@@ -132,6 +276,7 @@ class DockerImage(Image):
         :return: None
         """
         self.d.remove_image(self.get_full_name() if via_name else self.get_id(), force=force)
+        self._forget_metadata()
 
     def mount(self, mount_point=None):
         """
@@ -142,6 +287,70 @@ class DockerImage(Image):
         """
         return DockerImageFS(self, mount_point=mount_point)
 
+    def save_to_file(self, file_path, compress=False, parallel=True, checksum=True,
+                     chunk_size=CHUNK_SIZE):
+        """
+        save this image into a tarball (`docker save`); the content is streamed from the
+        daemon in chunks, so the image is never loaded into memory as a whole
+
+        :param file_path: str, path to the file
+        :param compress: bool, compress the tarball with gzip
+        :param parallel: bool, compress using multiple threads when `pigz` is available
+        :param checksum: bool, store sha256 checksum of the file into `<file_path>.sha256`
+        :param chunk_size: int, size of a chunk in bytes
+        :return: str, sha256 checksum of the file
+        """
+        logger.info("saving image %s to %s", self, file_path)
+        stream = self.d.get_image(self.get_full_name(), chunk_size=chunk_size)
+        with ArchiveWriter(file_path, compress=compress, parallel=parallel) as writer:
+            for chunk in stream:
+                writer.write(chunk)
+        if checksum:
+            write_checksum_file(file_path, writer.checksum)
+        return writer.checksum
+
+    @classmethod
+    def load_from_file(cls, file_path, verify=True, require_checksum=False,
+                       chunk_size=CHUNK_SIZE):
+        """
+        load image from a tarball created by `docker save` (or save_to_file), compressed
+        tarballs are supported as well; the file is streamed to the daemon in chunks
+
+        :param file_path: str, path to the file
+        :param verify: bool, verify the file against `<file_path>.sha256` if it exists,
+                raises ConuException if the checksum doesn't match
+        :param require_checksum: bool, raise ConuException if `<file_path>.sha256` is
+                missing, only applies when verify is set
+        :param chunk_size: int, size of a chunk in bytes
+        :return: instance of DockerImage, the first image in the tarball
+        """
+        if verify:
+            verify_checksum(file_path, chunk_size=chunk_size, required=require_checksum)
+        logger.info("loading image from %s", file_path)
+        d = get_client()
+        loaded = []
+        with open(file_path, "rb") as fd:
+            response = d.load_image(read_chunks(fd, chunk_size))
+            for o in response or []:
+                logger.debug(o)
+                if "error" in o:
+                    raise ConuException("failed to load %s: %s" % (file_path, o["error"]))
+                line = o.get("stream", "").strip()
+                if line.startswith("Loaded image: "):
+                    loaded.append(line[len("Loaded image: "):])
+                elif line.startswith("Loaded image ID: "):
+                    loaded.append(line[len("Loaded image ID: "):])
+        if not loaded:
+            raise ConuException("no image was loaded from %s" % file_path)
+        get_image_metadata_cache().invalidate(*loaded)
+        reference = loaded[0]
+        if reference.startswith("sha256:"):
+            image = cls(reference)
+            image._id = reference
+            return image
+        name, tag = split_image_reference(reference)
+        return cls(name, tag=tag)
+
     def run_via_binary(self, run_command_instance=None, *args, **kwargs):
         """
         create container using provided image and run it in background;
@@ -149,21 +358,28 @@ class DockerImage(Image):
         binary
 
         :param image: instance of Image
-        :param run_command_instance: instance of DockerRunBuilder
+        :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec, it's not
+                modified, so it can be reused for many containers
         :return: instance of DockerContainer
         """
         logger.info("run container via binary in background")
-        run_command_instance = run_command_instance or DockerRunBuilder()
-        if not isinstance(run_command_instance, DockerRunBuilder):
-            raise ConuException("run_command_instance needs to be an instance of DockerRunBuilder")
-        run_command_instance.image_name = self.get_id()
-        run_command_instance.options += ["-d"]
-        popen_instance = subprocess.Popen(run_command_instance.build(), stdout=subprocess.PIPE)
-        stdout = popen_instance.communicate()[0].strip().decode("utf-8")
-        if popen_instance.returncode > 0:
-            raise ConuException("Container exited with an error: %s" % popen_instance.returncode)
+        return self._run_detached(with_session_labels(run_command_instance))
+
+    def _run_detached(self, builder):
+        """
+        run `docker run -d` with the builder, which is modified
+
+        :param builder: instance of DockerRunBuilder
+        :return: instance of DockerContainer
+        """
+        builder.image_name = self.get_id()
+        builder.options += ["-d"]
+        result = get_command_runner().run(builder.build(), check=False)
+        if result.returncode > 0:
+            raise ConuException("Container exited with an error: %s, %s"
+                                % (result.returncode, result.stderr.decode("utf-8").strip()))
         # no error, stdout is the container id
-        return DockerContainer(self, stdout)
+        return DockerContainer(self, result.stdout.strip().decode("utf-8"))
 
     def run_via_binary_in_foreground(
             self, run_command_instance=None, popen_params=None, container_name=None):
@@ -180,24 +396,110 @@ class DockerImage(Image):
         Please consult the documentation for subprocess python module for best practices on
         how you should work with instance of Popen
 
-        :param run_command_instance: instance of DockerRunBuilder
+        :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec
         :param popen_params: dict, keyword arguments passed to Popen constructor
         :param container_name: str, pretty container identifier
         :return: instance of DockerContainer
         """
         logger.info("run container via binary in foreground")
-        run_command_instance = run_command_instance or DockerRunBuilder()
-        if not isinstance(run_command_instance, DockerRunBuilder):
-            raise ConuException("run_command_instance needs to be an instance of DockerRunBuilder")
         popen_params = popen_params or {}
-        run_command_instance.image_name = self.get_id()
+        builder = with_session_labels(run_command_instance)
+        builder.image_name = self.get_id()
         if container_name:
-            run_command_instance.options += ["--name", container_name]
-        logger.debug("command = %s", str(run_command_instance))
-        popen_instance = subprocess.Popen(run_command_instance.build(), **popen_params)
+            builder.options += ["--name", container_name]
+        logger.debug("command = %s", str(builder))
+        popen_instance = get_command_runner().popen(builder.build(), **popen_params)
         container_id = None
         return DockerContainer(self, container_id, popen_instance=popen_instance, name=container_name)
 
+    def create(self, container_params=None):
+        """
+        create container using docker API, the container is not started
+
+        :param container_params: instance of DockerRunSpec
+        :return: instance of DockerContainer
+        """
+        spec = container_params or DockerRunSpec()
+        if not isinstance(spec, DockerRunSpec):
+            raise ConuException("container_params needs to be an instance of DockerRunSpec")
+        spec = spec.replace(labels=dict(session_labels(), **dict(spec.labels)))
+        response = get_client().create_container(self.get_id(), **spec.to_create_kwargs())
+        for warning in response.get("Warnings") or []:
+            logger.warning(warning)
+        return DockerContainer(self, response["Id"], name=spec.name)
+
+    def run_via_api(self, container_params=None):
+        """
+        create container using docker API and start it in background
+
+        :param container_params: instance of DockerRunSpec
+        :return: instance of DockerContainer
+        """
+        logger.info("run container via API in background")
+        container = self.create(container_params)
+        container.start()
+        return container
+
+    def _run_fingerprint(self, run_command_instance):
+        config = {
+            "image": self.get_id(),
+            "global_options": run_command_instance.global_options,
+            "command": run_command_instance.command,
+            "options": run_command_instance.options,
+            "arguments": run_command_instance.arguments,
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+    def run_or_reuse(self, run_command_instance=None, name=None):
+        """
+        run container in background via binary unless a container with the same name is
+        already running with the same image and options, in which case it is reused; a
+        container with the same name but different configuration (or a stopped one) is
+        replaced -- handy for iterative development when you rerun your tests often
+
+        The configuration is fingerprinted into label io.github.conu.config of the container.
+        The container is not labeled with the session, so it's not removed when the session
+        ends or by the reaper of dead sessions.
+
+        :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec
+        :param name: str, name of the container
+        :return: instance of DockerContainer
+        """
+        if not name:
+            raise ConuException("run_or_reuse needs a name of the container")
+        run_command_instance = _to_builder(run_command_instance)
+        fingerprint = self._run_fingerprint(run_command_instance)
+        d = get_client()
+        try:
+            metadata = d.inspect_container(name)
+        except NotFound:
+            metadata = None
+        if metadata is not None:
+            labels = metadata["Config"].get("Labels") or {}
+            if metadata["State"]["Running"] and labels.get(CONFIG_LABEL) == fingerprint:
+                logger.info("reusing container %s", name)
+                return DockerContainer(self, metadata["Id"], name=name)
+            logger.info("container %s is stopped or its configuration changed, replacing it",
+                        name)
+            d.remove_container(metadata["Id"], v=True, force=True)
+        run_command_instance.options += ["--name", name,
+                                         "--label", "%s=%s" % (CONFIG_LABEL, fingerprint)]
+        container = self._run_detached(run_command_instance)
+        container.name = name
+        return container
+
+
+class S2IBuildResult(collections.namedtuple(
+        "S2IBuildResult", ["builder", "image", "duration", "log_path", "error"])):
+    """
+    Result of a single build done by S2IDockerImage.extend_many: builder image, the new image
+    (None if the build failed), duration of the build in seconds, path to the build log and
+    the exception if the build failed.
+    """
+    __slots__ = ()
+
+
 class S2IDockerImage(DockerImage, S2Image):
     def __init__(self, repository, tag="latest"):
         """
@@ -206,26 +508,15 @@ class S2IDockerImage(DockerImage, S2Image):
         :param tag: str, tag of the image, when not specified, "latest" is implied
         """
         super(S2IDockerImage, self).__init__(repository, tag=tag)
-        self._s2i_exists = None
 
     @property
     def s2i_exists(self):
-        if self._s2i_exists is None:
-            try:
-                self._s2i_exists = bool(shutil.which("s2i"))  # py3 only
-            except AttributeError:
-                with open(os.devnull, "w") as fd:
-                    try:
-                        rc = subprocess.call(["s2i", "version"], stdout=fd, stderr=fd)
-                    except OSError:
-                        self._s2i_exists = False
-                    else:
-                        if rc != 0:
-                            logger.error("`s2i version` exited with a non-zero return code, please"
-                                         " check your s2i binary if it's okay")
-                            # FIXME: I dunno, raise an error? Or leap of faith?
-                        self._s2i_exists = True
-        return self._s2i_exists
+        """
+        is s2i binary available? It's checked once per process.
+
+        :return: bool
+        """
+        return has_binary("s2i")
 
     def _s2i_command(self, args):
         """
@@ -239,7 +530,8 @@ class S2IDockerImage(DockerImage, S2Image):
                                 "(https://github.com/openshift/source-to-image)")
         return ["s2i"] + args
 
-    def extend(self, source, new_image_name, s2i_args=None):
+    def extend(self, source, new_image_name, s2i_args=None, incremental=False, cache=False,
+               output_file=None):
         """
         extend this s2i-enabled image using provided source, raises ConuException if
         `s2i build` fails
@@ -247,17 +539,133 @@ class S2IDockerImage(DockerImage, S2Image):
         :param source: str, source used to extend the image, can be path or url
         :param new_image_name: str, name of the new, extended image
         :param s2i_args: list of str, additional options and arguments provided to `s2i build`
+        :param incremental: bool, perform an incremental build (`s2i build --incremental`)
+                which reuses artifacts of a previous image with the same name if it exists
+        :param cache: bool, skip the build if an image was already built from the same
+                source tree (a local directory), builder image and arguments, and it's still
+                present; the cache is stored persistently, see S2IBuildCache; images built
+                with cache are shared by sessions, so they are not labeled with the session;
+                other images are labeled only if s2i supports `s2i build --label`
+        :param output_file: str, path to a file where output of `s2i build` is written,
+                when not set, the output is not redirected
         :return: S2Image instance
         """
-        s2i_args = s2i_args or []
-        c = self._s2i_command(["build"] + s2i_args + [source, self.get_full_name()])
+        s2i_args = list(s2i_args or [])
+        cache_key = None
+        if cache and new_image_name:
+            cache_key = self._build_cache_key(source, s2i_args)
+            if cache_key and self._use_cached_build(cache_key, new_image_name):
+                return S2IDockerImage(new_image_name)
+        if incremental and new_image_name:
+            if self._image_exists(new_image_name):
+                s2i_args.append("--incremental")
+            else:
+                logger.info("image %s doesn't exist yet, can't build incrementally",
+                            new_image_name)
+        labels = []
+        if not cache_key:
+            if s2i_supports_labels():
+                labels = label_options(session_labels())
+            else:
+                logger.info("s2i doesn't support --label, image %s won't be labeled with the "
+                            "session", new_image_name)
+        c = self._s2i_command(["build"] + labels + s2i_args + [source, self.get_full_name()])
         if new_image_name:
             c.append(new_image_name)
         try:
-            run_cmd(c)
+            if output_file:
+                with open(output_file, "wb") as fd:
+                    run_cmd(c, stdout=fd, stderr=subprocess.STDOUT)
+            else:
+                run_cmd(c)
         except subprocess.CalledProcessError as ex:
             raise ConuException("s2i build failed: %s" % ex)
-        return S2IDockerImage(new_image_name)
+        new_image = S2IDockerImage(new_image_name)
+        get_image_metadata_cache().invalidate(new_image_name, new_image.get_full_name())
+        if cache_key:
+            get_s2i_build_cache().put(cache_key, self.d.inspect_image(new_image_name)["Id"])
+        return new_image
+
+    @staticmethod
+    def extend_many(builds, source, s2i_args=None, parallelism=4, log_dir=None, **kwargs):
+        """
+        extend multiple s2i images with the same source concurrently (a build matrix); output
+        of every build is written into its own log file; a failed build doesn't stop the
+        others, check `error` attribute of the results
+
+        :param builds: list of tuples (S2IDockerImage instance, str: name of the new image)
+        :param source: str, source used to extend the images, can be path or url
+        :param s2i_args: list of str, additional options and arguments provided to `s2i build`
+        :param parallelism: int, maximum number of builds running at the same time
+        :param log_dir: str, directory for the log files, a temporary one is created if not set
+        :param kwargs: keyword arguments passed to `extend`, e.g. incremental or cache
+        :return: list of S2IBuildResult, in the same order as builds
+        """
+        log_dir = log_dir or tempfile.mkdtemp(prefix="conu-s2i-")
+
+        def _build(builder, new_image_name):
+            log_path = os.path.join(log_dir, re.sub(r"[^\w.-]", "_", new_image_name) + ".log")
+            logger.info("building %s from %s, log: %s", new_image_name, builder, log_path)
+            start = monotonic()
+            new_image, error = None, None
+            try:
+                new_image = builder.extend(source, new_image_name, s2i_args=s2i_args,
+                                           output_file=log_path, **kwargs)
+            except ConuException as ex:
+                logger.error("build of %s failed, see %s", new_image_name, log_path)
+                error = ex
+            return S2IBuildResult(builder, new_image, monotonic() - start, log_path, error)
+
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = [executor.submit(_build, b, n) for b, n in builds]
+            return [f.result() for f in futures]
+
+    def _image_exists(self, reference):
+        try:
+            self.d.inspect_image(reference)
+        except NotFound:
+            return False
+        return True
+
+    def _build_cache_key(self, source, s2i_args):
+        """
+        compute key identifying inputs of an s2i build
+
+        :param source: str, path or url
+        :param s2i_args: list of str
+        :return: str or None if the source is not a local directory
+        """
+        if not os.path.isdir(source):
+            logger.debug("source %s is not a local directory, not caching the build", source)
+            return None
+        h = hashlib.sha256()
+        for part in [compute_tree_checksum(source), self.get_id()] + s2i_args:
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _use_cached_build(self, cache_key, new_image_name):
+        """
+        tag the image built previously from the same inputs as new_image_name
+
+        :param cache_key: str
+        :param new_image_name: str
+        :return: bool, True if the cached image can be used
+        """
+        image_id = get_s2i_build_cache().get(cache_key)
+        if not image_id or not self._image_exists(image_id):
+            return False
+        try:
+            current_id = self.d.inspect_image(new_image_name)["Id"]
+        except NotFound:
+            current_id = None
+        if current_id != image_id:
+            name, tag = split_image_reference(new_image_name)
+            self.d.tag(image=image_id, repository=name, tag=tag)
+            get_image_metadata_cache().invalidate(new_image_name)
+        logger.info("image %s is up to date with its source, skipping s2i build",
+                    new_image_name)
+        return True
 
     def usage(self):
         """
@@ -267,9 +675,7 @@ class S2IDockerImage(DockerImage, S2Image):
         """
         c = self._s2i_command(["usage", self.get_full_name()])
         with open(os.devnull, "w") as fd:
-            process = subprocess.Popen(c, stdout=fd, stderr=subprocess.PIPE)
-            _, output = process.communicate()
-            retcode = process.poll()
-        if retcode:
-            raise ConuException("`s2i usage` failed: %s" % output)
-        return output.decode("utf-8").strip()
+            result = get_command_runner().run(c, check=False, stdout=fd)
+        if result.returncode:
+            raise ConuException("`s2i usage` failed: %s" % result.stderr)
+        return result.stderr.decode("utf-8").strip()
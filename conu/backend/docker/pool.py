@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of pre-started containers which can be leased by tests.
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import contextlib
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from conu.exceptions import ConuException
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class ContainerPool(object):
+    """
+    Keep up to `size` containers of an image started in the background and lease them to
+    callers. Once a container is released, it's reset according to the `reset` strategy
+    asynchronously, so leasing a container is instant as long as there is an idle one: pick
+    size larger than the number of containers you lease at the same time.
+
+    ::
+
+        pool = ContainerPool(image, DockerRunBuilder(command=["sleep", "infinity"]), size=4)
+        try:
+            with pool.leased() as container:
+                container.execute(["ls", "/"])
+        finally:
+            pool.close()
+    """
+    # remove the released container and start a new one
+    RECREATE = "recreate"
+    # restart the released container and put it back to the pool
+    RESTART = "restart"
+    # snapshot a new container once it's prepared, restore the snapshot on release
+    RESTORE = "restore"
+
+    def __init__(self, image, run_command_instance=None, size=2, reset=RECREATE,
+                 prepare_fnc=None, create_fnc=None, parallelism=None):
+        """
+        :param image: instance of DockerImage
+        :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec used to
+                start containers
+        :param size: int, number of containers managed by the pool, both idle and leased
+        :param reset: ContainerPool.RECREATE, ContainerPool.RESTART, ContainerPool.RESTORE
+                or a callable which accepts the released container and puts it into a clean
+                state
+        :param prepare_fnc: callable, invoked with every new or reset container before it's
+                leased, e.g. to wait for a service to start
+        :param create_fnc: callable without arguments which creates and starts a container,
+                defaults to `image.run_via_binary(run_command_instance)`
+        :param parallelism: int, number of containers created or reset at the same time,
+                defaults to size
+        """
+        self.image = image
+        self.run_command_instance = run_command_instance
+        self.size = size
+        self.reset = reset
+        self.prepare_fnc = prepare_fnc
+        self.create_fnc = create_fnc or self._run_container
+        self._idle = collections.deque()
+        self._leased = set()
+        self._snapshots = {}  # container -> ContainerSnapshot, used by RESTORE
+        self._pending = 0
+        self._closed = False
+        # failures are not kept with idle containers: they would be counted as available
+        self._last_error = None
+        self._failures = 0
+        self._lock = threading.Lock()
+        # notified when a container becomes idle or preparing one fails
+        self._changed = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=parallelism or size)
+        self._replenish()
+
+    def __repr__(self):
+        return "ContainerPool(image=%s, size=%s)" % (self.image, self.size)
+
+    def _run_container(self):
+        return self.image.run_via_binary(self.run_command_instance)
+
+    def _replenish(self):
+        with self._lock:
+            self._replenish_locked()
+
+    def _replenish_locked(self):
+        if self._closed:
+            return
+        missing = self.size - len(self._idle) - self._pending - len(self._leased)
+        for _ in range(missing):
+            self._pending += 1
+            self._executor.submit(self._fill, None)
+
+    def _fill(self, container):
+        """
+        create a new container or reset a released one and make it available
+
+        :param container: instance of DockerContainer to reset or None to create a new one
+        :return: None
+        """
+        try:
+            if container is None:
+                container = self.create_fnc()
+                logger.debug("pool %s: created container %s", self, container)
+            elif self.reset == self.RESTART:
+                container.stop()
+                container.start()
+            elif self.reset == self.RESTORE:
+                container.restore(self._snapshots[container])
+            else:
+                self.reset(container)
+            if self.prepare_fnc:
+                self.prepare_fnc(container)
+            if self.reset == self.RESTORE and container not in self._snapshots:
+                self._snapshots[container] = container.snapshot()
+        except Exception as ex:
+            logger.error("pool %s: failed to prepare a container: %r", self, ex)
+            if container is not None:
+                self._remove(container)
+            with self._lock:
+                self._pending -= 1
+                self._last_error = ex
+                self._failures += 1
+                # wake up callers waiting for a container
+                self._changed.notify_all()
+            return
+        with self._lock:
+            self._pending -= 1
+            closed = self._closed
+            if not closed:
+                self._idle.append(container)
+                self._changed.notify()
+        if closed:
+            self._remove(container)
+
+    def _remove(self, container):
+        try:
+            container.delete(force=True)
+            snapshot = self._snapshots.pop(container, None)
+            if snapshot is not None:
+                container.delete_snapshot(snapshot)
+        except Exception as ex:
+            logger.warning("failed to remove container %s: %r", container, ex)
+
+    def lease(self, timeout=None):
+        """
+        get a running container from the pool, it's yours until you release it; raises
+        ConuException when no container is available in time, or when preparing containers
+        failed while waiting and no other container is being prepared
+
+        :param timeout: int or float, seconds to wait for a container, None means forever
+        :return: instance of DockerContainer
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._lock:
+            if self._closed:
+                raise ConuException("The pool is closed.")
+            # containers which failed earlier are attempted again
+            self._replenish_locked()
+            failures = self._failures
+            while not self._idle:
+                if self._closed:
+                    raise ConuException("The pool is closed.")
+                if self._failures > failures and not self._pending:
+                    raise ConuException("Failed to prepare a container: %r"
+                                        % (self._last_error, ))
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise ConuException("No container was available in %s seconds, "
+                                        "last error: %r" % (timeout, self._last_error))
+                self._changed.wait(remaining)
+            container = self._idle.popleft()
+            self._leased.add(container)
+        return container
+
+    def release(self, container):
+        """
+        return leased container to the pool: it's reset in the background
+
+        :param container: instance of DockerContainer
+        :return: None
+        """
+        with self._lock:
+            if container not in self._leased:
+                raise ConuException("Container %s is not leased from the pool." % container)
+            self._leased.remove(container)
+            if self._closed:
+                recycle = False
+            elif self.reset == self.RECREATE:
+                recycle = False
+            else:
+                recycle = True
+                self._pending += 1
+        if recycle:
+            self._executor.submit(self._fill, container)
+        elif self._closed:
+            self._remove(container)
+        else:
+            self._executor.submit(self._remove, container)
+            self._replenish()
+
+    @contextlib.contextmanager
+    def leased(self, timeout=None):
+        """
+        context manager which leases a container and releases it at the end of the block
+
+        :param timeout: int or float, seconds to wait for a container, None means forever
+        :return: instance of DockerContainer
+        """
+        container = self.lease(timeout=timeout)
+        try:
+            yield container
+        finally:
+            self.release(container)
+
+    def close(self):
+        """
+        stop replenishing the pool and remove all containers which are not leased, leased
+        containers are removed once they are released
+
+        :return: None
+        """
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for container in idle:
+            self._remove(container)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_container_pool(image, run_command_instance=None, **kwargs):
+    """
+    get a process-wide pool for selected image and run options, create it if needed
+
+    :param image: instance of DockerImage
+    :param run_command_instance: instance of DockerRunBuilder or DockerRunSpec
+    :param kwargs: keyword arguments passed to ContainerPool constructor when it's created
+    :return: instance of ContainerPool
+    """
+    key = (image.get_full_name(), str(run_command_instance))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ContainerPool(image, run_command_instance, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_container_pools():
+    """
+    close all pools created by get_container_pool
+
+    :return: None
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Structured progress of `docker pull` and pulling of multiple images at once.
+"""
+from __future__ import print_function, unicode_literals
+
+import json
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from conu.exceptions import ConuException
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class LayerProgress(object):
+    """
+    Progress of a single layer: this object is shared by all the pulls which contain the layer
+    """
+    def __init__(self, layer_id):
+        """
+        :param layer_id: str, short ID of the layer as reported by docker
+        """
+        self.layer_id = layer_id
+        self.status = None
+        self.current = 0
+        self.total = None
+        # the layer was already present locally
+        self.cached = False
+        self.done = False
+
+    def __repr__(self):
+        return "LayerProgress(id=%s, status=%s, %s/%s)" % (
+            self.layer_id, self.status, self.current, self.total)
+
+    def update(self, event):
+        """
+        process a single event from the `docker pull` stream related to this layer
+
+        :param event: dict
+        :return: None
+        """
+        status = event.get("status", "")
+        self.status = status
+        detail = event.get("progressDetail") or {}
+        if status == "Downloading":
+            self.current = detail.get("current", self.current)
+            self.total = detail.get("total", self.total)
+        elif status == "Download complete":
+            if self.total is not None:
+                self.current = self.total
+        elif status == "Already exists":
+            self.cached = True
+            self.done = True
+        elif status == "Pull complete":
+            self.done = True
+
+
+class PullProgress(object):
+    """
+    Structured progress of pulling a single image, it is updated with events from `docker pull`
+    """
+    def __init__(self, image_name, layers=None, lock=None):
+        """
+        :param image_name: str, image which is being pulled
+        :param layers: dict, layer ID -> LayerProgress; can be shared by multiple pulls so
+                        that layers which are shared among images are accounted only once
+        :param lock: threading.Lock guarding `layers`, has to be shared together with them
+        """
+        self.image_name = image_name
+        self.layers = layers if layers is not None else {}
+        # IDs of layers which belong to this image
+        self.layer_ids = []
+        self.status = None
+        self.digest = None
+        # the image was already present locally, no pull was done
+        self.skipped = False
+        self.started = monotonic()
+        self.finished = None
+        self._lock = lock or threading.Lock()
+
+    def __repr__(self):
+        return "PullProgress(image=%s, layers=%d, downloaded=%d)" % (
+            self.image_name, len(self.layer_ids), self.downloaded_bytes)
+
+    def update(self, event):
+        """
+        process a single event from the `docker pull` stream, raises ConuException
+        when docker reports an error
+
+        :param event: dict, str or bytes (the raw JSON line)
+        :return: None
+        """
+        if not isinstance(event, dict):
+            if isinstance(event, bytes):
+                event = event.decode("utf-8")
+            event = json.loads(event)
+        if "error" in event:
+            raise ConuException("pull of %s failed: %s" % (self.image_name, event["error"]))
+        status = event.get("status", "")
+        layer_id = event.get("id")
+        # layer events look like {"status": "Downloading", "id": "abc", "progressDetail": {..}}
+        if layer_id and event.get("progressDetail") is not None:
+            with self._lock:
+                layer = self.layers.setdefault(layer_id, LayerProgress(layer_id))
+                if layer_id not in self.layer_ids:
+                    self.layer_ids.append(layer_id)
+                # a shared layer is updated by events of all the pulls which contain it
+                layer.update(event)
+        elif status.startswith("Digest: "):
+            self.digest = status[len("Digest: "):]
+        else:
+            self.status = status
+
+    def finish(self):
+        self.finished = monotonic()
+
+    @property
+    def elapsed(self):
+        """
+        number of seconds spent pulling
+
+        :return: float
+        """
+        return (self.finished or monotonic()) - self.started
+
+    @property
+    def downloaded_bytes(self):
+        """
+        number of bytes downloaded so far
+
+        :return: int
+        """
+        with self._lock:
+            return sum(self.layers[i].current for i in self.layer_ids
+                       if not self.layers[i].cached)
+
+    @property
+    def total_bytes(self):
+        """
+        size of all layers which need to be downloaded, None if it is not known yet
+
+        :return: int or None
+        """
+        with self._lock:
+            totals = [self.layers[i].total for i in self.layer_ids
+                      if not self.layers[i].cached]
+        if any(t is None for t in totals):
+            return None
+        return sum(totals)
+
+    @property
+    def throughput(self):
+        """
+        average download speed in bytes per second
+
+        :return: float
+        """
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return self.downloaded_bytes / float(elapsed)
+
+
+class MultiPullProgress(object):
+    """
+    Aggregated progress of multiple pulls running concurrently.
+    """
+    def __init__(self):
+        # layers shared by all the pulls and the lock which guards them
+        self.layers = {}
+        self._lock = threading.Lock()
+        self.pulls = []
+        self.started = monotonic()
+
+    def add(self, image_name):
+        """
+        create progress object for another image
+
+        :param image_name: str
+        :return: instance of PullProgress
+        """
+        p = PullProgress(image_name, layers=self.layers, lock=self._lock)
+        self.pulls.append(p)
+        return p
+
+    @property
+    def downloaded_bytes(self):
+        """
+        number of bytes downloaded so far, each layer is counted once
+
+        :return: int
+        """
+        with self._lock:
+            return sum(l.current for l in self.layers.values() if not l.cached)
+
+    @property
+    def throughput(self):
+        """
+        average download speed of all the pulls in bytes per second
+
+        :return: float
+        """
+        elapsed = monotonic() - self.started
+        if not elapsed:
+            return 0.0
+        return self.downloaded_bytes / float(elapsed)
+
+
+def pull_many(images, parallelism=4, progress_callback=None, skip_present=True):
+    """
+    pull multiple images concurrently; images present in the list multiple times are
+    pulled only once, raises ConuException once all the pulls ended if any of them failed
+
+    :param images: list of DockerImage instances
+    :param parallelism: int, maximum number of pulls running at the same time
+    :param progress_callback: callable, invoked as `progress_callback(pull_progress,
+            multi_pull_progress)` whenever progress of any of the pulls changes
+    :param skip_present: bool, don't pull images which are already present locally with the
+            same digest as in the registry
+    :return: instance of MultiPullProgress
+    """
+    multi = MultiPullProgress()
+    unique = []
+    seen = set()
+    for image in images:
+        if image.get_full_name() not in seen:
+            seen.add(image.get_full_name())
+            unique.append(image)
+
+    def _pull(image):
+        progress = multi.add(image.get_full_name())
+        callback = None
+        if progress_callback:
+            def callback(p):
+                progress_callback(p, multi)
+        return image.pull(progress_callback=callback, progress=progress,
+                          skip_present=skip_present)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [(image, executor.submit(_pull, image)) for image in unique]
+        for image, future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                logger.error("failed to pull %s: %s", image, ex)
+                errors.append((image, ex))
+    if errors:
+        raise ConuException("failed to pull images: %s" %
+                            ", ".join("%s (%s)" % (i, e) for i, e in errors))
+    return multi
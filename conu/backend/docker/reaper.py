@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Removal of containers leaked by test sessions: containers are labeled with an ID of the
+session and PID of the process which created them; once the process is gone, a separate
+reaper process (or the next session on the same host) removes them.
+
+The reaper can be invoked as:
+
+    python -m conu.backend.docker.reaper --pid 1234 --session my-session
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import errno
+import logging
+import os
+import sys
+import time
+
+from conu.backend.docker.client import get_client
+from conu.backend.docker.session import HOST_LABEL, PID_LABEL, cleanup, host_id
+from conu.utils.runner import get_command_runner
+
+logger = logging.getLogger(__name__)
+
+
+def pid_alive(pid):
+    """
+    check if process with selected PID exists
+
+    :param pid: int
+    :return: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
+
+
+def _remove_containers(containers):
+    d = get_client()
+    removed = 0
+    for c in containers:
+        try:
+            d.remove_container(c["Id"], v=True, force=True)
+            removed += 1
+        except Exception as ex:
+            logger.warning("failed to remove container %s: %r", c["Id"], ex)
+    return removed
+
+
+def remove_session_containers(session_id):
+    """
+    remove all containers of selected session
+
+    :param session_id: str
+    :return: int, number of removed containers
+    """
+    return len(cleanup(session_id, images=False).containers)
+
+
+def reap_dead_sessions():
+    """
+    remove containers created on this host, in the same PID namespace, by processes which
+    don't exist anymore
+
+    :return: int, number of removed containers
+    """
+    host = host_id()
+    leaked = []
+    for c in get_client().containers(all=True, filters={"label": PID_LABEL}):
+        labels = c.get("Labels") or {}
+        if labels.get(HOST_LABEL) != host:
+            continue
+        try:
+            pid = int(labels[PID_LABEL])
+        except (KeyError, ValueError):
+            continue
+        if not pid_alive(pid):
+            leaked.append(c)
+    removed = _remove_containers(leaked)
+    if removed:
+        logger.info("removed %d leaked containers", removed)
+    return removed
+
+
+def start_reaper(session_id, pid=None, interval=1):
+    """
+    start a detached process which removes containers of the session once the process
+    with selected PID ends
+
+    :param session_id: str
+    :param pid: int, process to watch, defaults to the current one
+    :param interval: int or float, how often (in seconds) should the reaper check the process
+    :return: instance of Popen
+    """
+    pid = pid or os.getpid()
+    cmd = [sys.executable, "-m", "conu.backend.docker.reaper", "--pid", str(pid),
+           "--session", session_id, "--interval", str(interval)]
+    logger.debug("starting reaper: %s", cmd)
+    with open(os.devnull, "r+") as devnull:
+        # own process group, so that ctrl+c doesn't kill the reaper with the tests
+        return get_command_runner().popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull,
+                                          preexec_fn=os.setsid, close_fds=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove containers of a conu session once "
+                                                 "the process running the session ends.")
+    parser.add_argument("--pid", type=int, required=True, help="process to watch")
+    parser.add_argument("--session", required=True, help="ID of the session")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between checks")
+    args = parser.parse_args(argv)
+    while pid_alive(args.pid):
+        time.sleep(args.interval)
+    remove_session_containers(args.session)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Containers and images created by conu are labeled with an ID of the session which created
+them, so they can be found and removed in bulk.
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import datetime
+import logging
+import os
+import socket
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from docker.errors import NotFound
+
+from conu.backend.docker.client import get_client
+from conu.utils import random_str
+
+logger = logging.getLogger(__name__)
+
+SESSION_LABEL = "io.github.conu.session"
+PID_LABEL = "io.github.conu.pid"
+HOST_LABEL = "io.github.conu.host"
+
+_session_id = "conu-%s" % random_str()
+
+
+def get_session_id():
+    """
+    ID of the current session: every python process has its own unless set_session_id is
+    used
+
+    :return: str
+    """
+    return _session_id
+
+
+def set_session_id(session_id):
+    """
+    set ID of the current session, containers and images created from now on are labeled
+    with it
+
+    :param session_id: str
+    :return: None
+    """
+    global _session_id
+    _session_id = session_id
+
+
+def host_id():
+    """
+    identification of the host and PID namespace of this process; processes which share
+    the hostname but not the PID namespace (e.g. in a container run with --net=host)
+    can't check whether PIDs of each other are alive
+
+    :return: str, e.g. "builder/4026531836", only the hostname if the namespace is unknown
+    """
+    hostname = socket.gethostname()
+    try:
+        # e.g. "pid:[4026531836]"
+        namespace = os.readlink("/proc/self/ns/pid")
+    except OSError:
+        return hostname
+    return "%s/%s" % (hostname, namespace.strip("pid:[]"))
+
+
+def session_labels(session_id=None):
+    """
+    labels which identify containers and images created by this process in selected session
+
+    :param session_id: str, defaults to the current session
+    :return: dict
+    """
+    return {
+        SESSION_LABEL: session_id or get_session_id(),
+        PID_LABEL: str(os.getpid()),
+        HOST_LABEL: host_id(),
+    }
+
+
+def label_options(labels):
+    """
+    convert labels to options of `docker run`
+
+    :param labels: dict
+    :return: list of str
+    """
+    options = []
+    for label in sorted(labels.items()):
+        options += ["--label", "%s=%s" % label]
+    return options
+
+
+class CleanupSummary(collections.namedtuple("CleanupSummary",
+                                            ["containers", "images", "errors"])):
+    """
+    Result of cleanup: IDs of removed containers and images, and list of tuples
+    (ID, exception) for those which could not be removed.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return "removed %d containers and %d images, %d failures" % (
+            len(self.containers), len(self.images), len(self.errors))
+
+
+def _filter_old(items, older_than):
+    if older_than is None:
+        return items
+    if isinstance(older_than, datetime.timedelta):
+        older_than = older_than.total_seconds()
+    threshold = time.time() - older_than
+    return [i for i in items if i.get("Created", 0) < threshold]
+
+
+def cleanup(session_id=None, all_sessions=False, older_than=None, images=True,
+            parallelism=8):
+    """
+    remove containers (and images) created by conu; each kind is obtained with a single
+    filtered list call and removed concurrently
+
+    :param session_id: str, remove only objects of this session, defaults to the current
+            session
+    :param all_sessions: bool, remove objects of all the sessions, including those of
+            other processes which may still be running; session_id is ignored
+    :param older_than: int, float (seconds) or datetime.timedelta, remove only objects
+            created earlier than this
+    :param images: bool, remove images as well
+    :param parallelism: int, number of objects removed at the same time
+    :return: instance of CleanupSummary
+    """
+    d = get_client()
+    if all_sessions:
+        session_id = None
+        label = SESSION_LABEL
+    else:
+        session_id = session_id or get_session_id()
+        label = "%s=%s" % (SESSION_LABEL, session_id)
+    containers = _filter_old(d.containers(all=True, filters={"label": label}), older_than)
+    errors = []
+
+    def _remove(fnc, ident):
+        try:
+            fnc(ident)
+        except NotFound:
+            pass  # removed in the meantime
+        except Exception as ex:
+            logger.warning("failed to remove %s: %r", ident, ex)
+            errors.append((ident, ex))
+            return None
+        return ident
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        removed_containers = list(executor.map(
+            lambda c: _remove(lambda i: d.remove_container(i, v=True, force=True), c["Id"]),
+            containers))
+        removed_images = []
+        if images:
+            to_remove = _filter_old(d.images(filters={"label": label}), older_than)
+            removed_images = list(executor.map(
+                lambda i: _remove(lambda x: d.remove_image(x, force=True), i["Id"]),
+                to_remove))
+    summary = CleanupSummary([c for c in removed_containers if c],
+                             [i for i in removed_images if i], errors)
+    logger.info("cleanup of %s: %s", session_id or "all sessions", summary)
+    return summary
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Resource usage of containers: parsing of the daemon's stats endpoint and sampling of it
+in background.
+"""
+from __future__ import print_function, division, unicode_literals
+
+import array
+import collections
+import logging
+import math
+import threading
+import time
+
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# numeric fields of ResourceSample which are sampled by ResourceSampler
+SAMPLE_FIELDS = ["cpu_percent", "memory_usage", "memory_limit", "block_read", "block_write",
+                 "net_rx", "net_tx", "pids"]
+
+
+class ResourceSample(collections.namedtuple("ResourceSample", ["timestamp"] + SAMPLE_FIELDS)):
+    """
+    Resource usage of a container at a point in time: timestamp (seconds since epoch),
+    cpu_percent (100.0 means one fully used CPU), memory_usage and memory_limit (bytes,
+    page cache excluded), block_read, block_write, net_rx, net_tx (bytes since the
+    container started) and pids (number of processes).
+    """
+    __slots__ = ()
+
+
+class StatsSummary(collections.namedtuple("StatsSummary",
+                                          ["count", "min", "max", "mean", "p50", "p90", "p99"])):
+    """
+    Statistics of a series of values recorded by ResourceSampler.
+    """
+    __slots__ = ()
+
+
+def _cpu_percent(stats):
+    cpu, precpu = stats.get("cpu_stats") or {}, stats.get("precpu_stats") or {}
+    cpu_delta = (cpu.get("cpu_usage", {}).get("total_usage", 0) -
+                 precpu.get("cpu_usage", {}).get("total_usage", 0))
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    if cpu_delta <= 0 or system_delta <= 0 or not precpu.get("system_cpu_usage"):
+        return 0.0
+    online_cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or
+                                                []) or 1
+    return cpu_delta / system_delta * online_cpus * 100.0
+
+
+def _memory_usage(stats):
+    memory = stats.get("memory_stats") or {}
+    usage = memory.get("usage", 0)
+    details = memory.get("stats") or {}
+    # same as `docker stats`: cgroup v1 reports total_inactive_file, v2 inactive_file
+    cache = details.get("total_inactive_file", details.get("inactive_file", 0))
+    return max(usage - cache, 0)
+
+
+def _block_io(stats):
+    read = write = 0
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            read += entry.get("value", 0)
+        elif op == "write":
+            write += entry.get("value", 0)
+    return read, write
+
+
+def parse_stats(stats, timestamp=None):
+    """
+    convert a response of docker's stats endpoint to ResourceSample
+
+    :param stats: dict, decoded response of the endpoint
+    :param timestamp: float, time of the sample, defaults to now
+    :return: instance of ResourceSample
+    """
+    block_read, block_write = _block_io(stats)
+    networks = (stats.get("networks") or {}).values()
+    return ResourceSample(
+        timestamp=time.time() if timestamp is None else timestamp,
+        cpu_percent=_cpu_percent(stats),
+        memory_usage=_memory_usage(stats),
+        memory_limit=(stats.get("memory_stats") or {}).get("limit", 0),
+        block_read=block_read,
+        block_write=block_write,
+        net_rx=sum(n.get("rx_bytes", 0) for n in networks),
+        net_tx=sum(n.get("tx_bytes", 0) for n in networks),
+        pids=(stats.get("pids_stats") or {}).get("current", 0),
+    )
+
+
+def percentile(sorted_values, p):
+    """
+    percentile of sorted values using linear interpolation between closest ranks
+
+    :param sorted_values: sequence of numbers sorted in ascending order
+    :param p: int or float, 0 to 100
+    :return: float
+    """
+    if not sorted_values:
+        raise ValueError("percentile of an empty sequence")
+    k = (len(sorted_values) - 1) * p / 100.0
+    lower, upper = int(math.floor(k)), int(math.ceil(k))
+    if lower == upper:
+        return float(sorted_values[lower])
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(values):
+    """
+    compute statistics of a series of values
+
+    :param values: sequence of numbers, it can't be empty
+    :return: instance of StatsSummary
+    """
+    s = sorted(values)
+    return StatsSummary(len(s), float(s[0]), float(s[-1]), sum(s) / len(s),
+                        percentile(s, 50), percentile(s, 90), percentile(s, 99))
+
+
+class ResourceSampler(object):
+    """
+    Record resource usage of a container in background. Samples are taken from the
+    daemon's stats stream (the daemon refreshes it about once a second) and stored at
+    most once per interval in arrays, one per field of ResourceSample; when max_samples is
+    set, bounded deques are used instead, so the oldest samples are dropped in O(1).
+
+    ::
+
+        with ResourceSampler(container, interval=1) as sampler:
+            run_the_workload()
+        assert sampler.summary()["memory_usage"].max < 50 * 1024 * 1024
+    """
+
+    def __init__(self, container, interval=1.0, max_samples=None):
+        """
+        :param container: instance of DockerContainer
+        :param interval: int or float, minimal number of seconds between two samples
+        :param max_samples: int, keep only this many most recent samples, all by default
+        """
+        self.container = container
+        self.interval = interval
+        self.max_samples = max_samples
+        self.timestamps = self._new_series()
+        self.series = dict((f, self._new_series()) for f in SAMPLE_FIELDS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _new_series(self):
+        if self.max_samples:
+            return collections.deque(maxlen=self.max_samples)
+        return array.array("d")
+
+    def record(self, sample):
+        """
+        store a sample
+
+        :param sample: instance of ResourceSample
+        :return: None
+        """
+        with self._lock:
+            self.timestamps.append(sample.timestamp)
+            for f in SAMPLE_FIELDS:
+                self.series[f].append(getattr(sample, f))
+
+    def _run(self):
+        last = None
+        try:
+            for sample in self.container.stats(stream=True):
+                if self._stop.is_set():
+                    break
+                now = monotonic()
+                if last is None or now - last >= self.interval:
+                    last = now
+                    self.record(sample)
+        except Exception as ex:
+            if not self._stop.is_set():
+                logger.warning("sampling of %s failed: %r", self.container, ex)
+                self.error = ex
+
+    def start(self):
+        """
+        start sampling in a background thread
+
+        :return: None
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampler-%s" % self.container)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        stop sampling; the stats stream is checked only when a new sample arrives, so
+        this can take up to the daemon's refresh period
+
+        :param timeout: int or float, seconds to wait for the sampling thread
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def samples(self):
+        """
+        recorded samples
+
+        :return: list of ResourceSample
+        """
+        with self._lock:
+            return [ResourceSample(t, *values) for t, values in
+                    zip(self.timestamps, zip(*[self.series[f] for f in SAMPLE_FIELDS]))]
+
+    def summary(self):
+        """
+        statistics of recorded samples per field, e.g. summary()["memory_usage"].max
+
+        :return: dict, field -> StatsSummary; empty if nothing was recorded
+        """
+        with self._lock:
+            if not self.timestamps:
+                return {}
+            return dict((f, summarize(values)) for f, values in self.series.items())
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Waiting for many containers to stop at once:
+
+::
+
+    containers = [image.run_via_api(spec.replace(name="job-%d" % i)) for i in range(100)]
+    for container, exit_code in as_completed(containers, timeout=600):
+        print(container.name, exit_code)
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import logging
+import threading
+
+import requests
+from six.moves import queue
+
+from conu.exceptions import ConuException
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# seconds of a single wait request; the wait is repeated until the container stops
+WAIT_CHUNK = 5
+# seconds of a single wait request when there are more containers than parallel waits,
+# so that every container gets its turn
+ROTATE_CHUNK = 1
+
+
+def _exit_code(response):
+    # docker-py >= 3 provides a dict, older versions just the exit code
+    if isinstance(response, dict):
+        return response["StatusCode"]
+    return response
+
+
+def _wait_once(container, chunk):
+    """
+    :return: int, exit code, or None if the container is still running
+    """
+    try:
+        return _exit_code(container.wait(timeout=chunk))
+    except requests.exceptions.ReadTimeout:
+        return None
+    except requests.exceptions.ConnectionError as ex:
+        # read timeouts on unix socket are reported as connection errors
+        if "timed out" in str(ex):
+            return None
+        raise
+
+
+def _wait_many(containers, timeout, parallelism):
+    """
+    generator of (index, exit code) of containers as they stop
+    """
+    deadline = None if timeout is None else monotonic() + timeout
+    chunk = WAIT_CHUNK if len(containers) <= parallelism else ROTATE_CHUNK
+    todo = collections.deque(range(len(containers)))
+    todo_lock = threading.Lock()
+    results = queue.Queue()
+    cancelled = threading.Event()
+
+    def worker():
+        while not cancelled.is_set():
+            with todo_lock:
+                if not todo:
+                    return
+                index = todo.popleft()
+            wait = chunk
+            if deadline is not None:
+                wait = min(wait, deadline - monotonic())
+                if wait <= 0:
+                    results.put((index, None, None))
+                    continue
+            try:
+                exit_code = _wait_once(containers[index], wait)
+            except Exception as ex:
+                results.put((index, None, ex))
+                continue
+            if exit_code is None:
+                with todo_lock:
+                    todo.append(index)
+            else:
+                results.put((index, exit_code, None))
+
+    for _ in range(min(parallelism, len(containers))):
+        t = threading.Thread(target=worker, name="conu-container-wait")
+        t.daemon = True
+        t.start()
+    try:
+        for done in range(len(containers)):
+            index, exit_code, error = results.get()
+            if error is not None:
+                raise error
+            if exit_code is None:
+                raise ConuException("%d containers didn't stop in %s seconds"
+                                    % (len(containers) - done, timeout))
+            yield index, exit_code
+    finally:
+        cancelled.set()
+
+
+def as_completed(containers, timeout=None, parallelism=8):
+    """
+    provide containers as they stop, raises ConuException when timeout is exceeded
+
+    :param containers: list of DockerContainer instances
+    :param timeout: int or float, seconds to wait for all the containers, None means no
+            limit
+    :param parallelism: int, maximum number of wait requests to docker at the same time
+    :return: generator of tuples (container, exit code)
+    """
+    containers = list(containers)
+    for index, exit_code in _wait_many(containers, timeout, parallelism):
+        yield containers[index], exit_code
+
+
+def wait_all(containers, timeout=None, parallelism=8):
+    """
+    block until all the containers stop, raises ConuException when timeout is exceeded
+
+    :param containers: list of DockerContainer instances
+    :param timeout: int or float, seconds, None means no limit
+    :param parallelism: int, maximum number of wait requests to docker at the same time
+    :return: list of int, exit codes in the same order as containers
+    """
+    containers = list(containers)
+    exit_codes = [None] * len(containers)
+    for index, exit_code in _wait_many(containers, timeout, parallelism):
+        exit_codes[index] = exit_code
+    return exit_codes
+
+
+def wait_any(containers, timeout=None, parallelism=8):
+    """
+    block until any of the containers stops, raises ConuException when timeout is exceeded
+    or when there are no containers
+
+    :param containers: list of DockerContainer instances
+    :param timeout: int or float, seconds, None means no limit
+    :param parallelism: int, maximum number of wait requests to docker at the same time
+    :return: tuple (container, exit code) of the first container which stopped
+    """
+    containers = list(containers)
+    if not containers:
+        raise ConuException("no containers to wait for")
+    completed = as_completed(containers, timeout=timeout, parallelism=parallelism)
+    try:
+        return next(completed)
+    finally:
+        completed.close()
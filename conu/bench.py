@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of container startup: launch an image repeatedly and measure how long every
+phase of the container's life takes.
+
+::
+
+    benchmark = StartupBenchmark(image, DockerRunSpec(ports={8080: None}), port=8080,
+                                 http_path="/", runs=20)
+    result = benchmark.run()
+    result.to_json("startup.json")
+    print(result.summary()["ready"].p90)
+
+It can be invoked from command line as well:
+
+::
+
+    python -m conu.bench registry.fedoraproject.org/fedora:27 --runs 10 --log \\
+        --command sleep infinity --json startup.json
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import csv
+import io
+import json
+import logging
+import time
+
+import six
+
+from conu.backend.docker.container import DockerRunSpec
+from conu.backend.docker.image import DockerImage, split_image_reference
+from conu.backend.docker.stats import summarize
+from conu.exceptions import ConuException
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# phases of a container's life, in the order they happen; first_log, port_open and
+# http_ready are measured from the end of the previous phase
+PHASES = ["create", "start", "first_log", "port_open", "http_ready", "stop", "remove"]
+# time from launching the container until it is ready (all the measured phases until
+# http_ready)
+READY = "ready"
+
+VIA_API = "api"
+VIA_BINARY = "binary"
+
+
+def _wait_for(fnc, timeout, pause):
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            if fnc():
+                return
+        except Exception as ex:
+            logger.debug("not ready yet: %r", ex)
+        if monotonic() > deadline:
+            raise ConuException("Timeout exceeded while waiting for %s" % fnc.__name__)
+        time.sleep(pause)
+
+
+class BenchmarkResult(object):
+    """
+    Timings of a benchmark: `runs` is a list of dicts, phase -> seconds (None if the phase
+    was not measured).
+    """
+
+    def __init__(self, image_name, via, runs=None):
+        """
+        :param image_name: str
+        :param via: str, conu.bench.VIA_API or conu.bench.VIA_BINARY
+        :param runs: list of dicts
+        """
+        self.image_name = image_name
+        self.via = via
+        self.runs = runs or []
+
+    def summary(self):
+        """
+        statistics of every measured phase
+
+        :return: dict, phase -> instance of StatsSummary
+        """
+        result = {}
+        for phase in PHASES + [READY]:
+            values = [r[phase] for r in self.runs if r.get(phase) is not None]
+            if values:
+                result[phase] = summarize(values)
+        return result
+
+    def to_dict(self):
+        """
+        :return: dict, JSON-serializable representation of the result
+        """
+        return {
+            "image": self.image_name,
+            "via": self.via,
+            "runs": self.runs,
+            "summary": dict((phase, s._asdict()) for phase, s in self.summary().items()),
+        }
+
+    def to_json(self, path):
+        """
+        write the result including individual runs into a JSON file
+
+        :param path: str
+        :return: None
+        """
+        with io.open(path, "w", encoding="utf-8") as fd:
+            fd.write(six.text_type(json.dumps(self.to_dict(), indent=2, sort_keys=True)))
+
+    def to_csv(self, path, raw=False):
+        """
+        write the summary (a row per phase) or individual runs (a row per run) into a CSV file
+
+        :param path: str
+        :param raw: bool, write individual runs instead of the summary
+        :return: None
+        """
+        if raw:
+            header = PHASES + [READY]
+            rows = [[r.get(p) for p in header] for r in self.runs]
+        else:
+            header = ["phase", "count", "min", "max", "mean", "p50", "p90", "p99"]
+            summary = self.summary()
+            rows = [[p] + list(summary[p]) for p in PHASES + [READY] if p in summary]
+        # csv module on python 2 doesn't support unicode
+        with open(path, "w" if six.PY3 else "wb") as fd:
+            writer = csv.writer(fd)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+class StartupBenchmark(object):
+    """
+    Launch an image repeatedly and record timings of phases of every container: create,
+    start, first_log (first line of logs appeared), port_open, http_ready (HTTP endpoint
+    responds), stop and remove. Readiness phases are measured only when requested.
+    When running via binary, create and start are measured as a single start phase.
+    """
+
+    def __init__(self, image, run_spec=None, runs=10, via=VIA_API, log=False, port=None,
+                 http_path=None, timeout=60, pause=0.05):
+        """
+        :param image: instance of DockerImage
+        :param run_spec: instance of DockerRunSpec
+        :param runs: int, how many times is the image launched
+        :param via: str, conu.bench.VIA_API or conu.bench.VIA_BINARY
+        :param log: bool, measure when the first line of logs appears
+        :param port: int, measure when this port accepts connections
+        :param http_path: str, measure when HTTP GET of this path on `port` returns a status
+                code lower than 500
+        :param timeout: int or float, seconds to wait for every readiness phase
+        :param pause: int or float, seconds between readiness checks
+        """
+        if http_path and not port:
+            raise ConuException("http_path needs a port")
+        if via not in (VIA_API, VIA_BINARY):
+            raise ConuException("via needs to be %s or %s" % (VIA_API, VIA_BINARY))
+        self.image = image
+        self.run_spec = run_spec or DockerRunSpec()
+        self.runs = runs
+        self.via = via
+        self.log = log
+        self.port = port
+        self.http_path = http_path
+        self.timeout = timeout
+        self.pause = pause
+
+    def _launch(self, timings):
+        start = monotonic()
+        if self.via == VIA_BINARY:
+            container = self.image.run_via_binary(self.run_spec)
+            timings["start"] = monotonic() - start
+            return container
+        container = self.image.create(self.run_spec)
+        created = monotonic()
+        timings["create"] = created - start
+        container.start()
+        timings["start"] = monotonic() - created
+        return container
+
+    def _wait_until_ready(self, container, timings):
+        def first_log():
+            return bool(container.logs())
+
+        def port_open():
+            return container.is_port_open(self.port, timeout=self.pause)
+
+        def http_ready():
+            return container.http_request(path=self.http_path, port=self.port).status_code < 500
+
+        checks = [("first_log", first_log, self.log), ("port_open", port_open, self.port),
+                  ("http_ready", http_ready, self.http_path)]
+        for phase, fnc, enabled in checks:
+            if not enabled:
+                continue
+            start = monotonic()
+            _wait_for(fnc, self.timeout, self.pause)
+            timings[phase] = monotonic() - start
+
+    def run_once(self):
+        """
+        launch the image once
+
+        :return: dict, phase -> seconds
+        """
+        timings = dict((phase, None) for phase in PHASES)
+        container = self._launch(timings)
+        try:
+            self._wait_until_ready(container, timings)
+            timings[READY] = sum(timings[p] or 0 for p in PHASES[:PHASES.index("stop")])
+            start = monotonic()
+            container.stop()
+            timings["stop"] = monotonic() - start
+        finally:
+            start = monotonic()
+            container.delete(force=True, volumes=True)
+            timings["remove"] = monotonic() - start
+        return timings
+
+    def run(self):
+        """
+        launch the image `runs` times, one container at a time
+
+        :return: instance of BenchmarkResult
+        """
+        result = BenchmarkResult(self.image.get_full_name(), self.via)
+        for i in range(self.runs):
+            timings = self.run_once()
+            logger.info("run %d/%d: ready in %.3f s", i + 1, self.runs, timings[READY])
+            result.runs.append(timings)
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure startup latency of an image.")
+    parser.add_argument("image", help="image reference, e.g. fedora:27")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--via", choices=[VIA_API, VIA_BINARY], default=VIA_API)
+    parser.add_argument("--log", action="store_true", help="wait for the first log line")
+    parser.add_argument("--port", type=int, help="wait for the port to accept connections")
+    parser.add_argument("--http-path", help="wait for HTTP GET of the path to succeed")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", help="write the result into a JSON file")
+    parser.add_argument("--csv", help="write the summary into a CSV file")
+    parser.add_argument("--command", nargs=argparse.REMAINDER, help="command of the container")
+    args = parser.parse_args(argv)
+
+    image = DockerImage(*split_image_reference(args.image))
+    spec = DockerRunSpec(command=args.command, ports=[args.port] if args.port else None)
+    result = StartupBenchmark(image, spec, runs=args.runs, via=args.via, log=args.log,
+                              port=args.port, http_path=args.http_path,
+                              timeout=args.timeout).run()
+    if args.json:
+        result.to_json(args.json)
+    if args.csv:
+        result.to_csv(args.csv)
+    summary = result.summary()
+    for phase in [p for p in PHASES + [READY] if p in summary]:
+        s = summary[phase]
+        print("%-10s mean %.3f s, p50 %.3f s, p90 %.3f s, max %.3f s"
+              % (phase, s.mean, s.p50, s.p90, s.max))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+pytest plugin providing fixtures for images and containers
+
+Images listed in the configuration are pulled or built in parallel when the test session
+starts (only once when running with pytest-xdist). Containers created by the fixtures are
+labeled with an ID of the session (unique per xdist worker) and removed once the session
+ends; if the test process crashes, a reaper process removes them. The session ID is used
+for all containers and images conu creates during the session.
+
+Configure it in pytest.ini:
+
+::
+
+    [pytest]
+    conu_images =
+        registry.fedoraproject.org/fedora:27
+    conu_builds =
+        punchbag tests/integration/data/punchbag
+
+and use the fixtures:
+
+::
+
+    def test_ls(conu_image, conu_container):
+        image = conu_image("registry.fedoraproject.org/fedora", tag="27")
+        container = conu_container(image, DockerRunBuilder(command=["sleep", "infinity"]))
+        container.execute(["ls", "/"])
+"""
+from __future__ import print_function, unicode_literals
+
+import logging
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from docker.errors import NotFound
+
+from conu.backend.docker.backend import DockerBackend
+from conu.backend.docker.client import get_client
+from conu.backend.docker.image import DockerImage, split_image_reference
+from conu.backend.docker.reaper import reap_dead_sessions, remove_session_containers, start_reaper
+from conu.backend.docker.session import session_labels, set_session_id
+from conu.exceptions import ConuException
+from conu.utils import random_str
+
+logger = logging.getLogger(__name__)
+
+
+def pytest_addoption(parser):
+    parser.addini("conu_images", type="linelist",
+                  help="images to pull at the start of the session if they are missing")
+    parser.addini("conu_builds", type="linelist",
+                  help="images to build at the start of the session if they are missing, "
+                       "one per line: <image name> <path to build context>")
+    parser.addini("conu_parallelism", default="4",
+                  help="number of images pulled or built at the same time")
+    parser.addoption("--conu-keep-containers", action="store_true", default=False,
+                     help="don't remove containers created by conu fixtures")
+
+
+def pytest_configure(config):
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        config._conu_session_id = "conu-%s" % random_str()
+    else:
+        # namespace per xdist worker
+        config._conu_session_id = "%s-%s" % (workerinput["conu_session_id"],
+                                             workerinput["workerid"])
+    set_session_id(config._conu_session_id)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """ pass the session ID from xdist controller to workers """
+    node.workerinput["conu_session_id"] = node.config._conu_session_id
+
+
+def _image_missing(image):
+    try:
+        image.get_metadata(refresh=False)
+    except NotFound:
+        return True
+    return False
+
+
+def _build_image(name, path):
+    logger.info("building image %s from %s", name, path)
+    repository, tag = split_image_reference(name)
+    for o in get_client().build(path=path, tag="%s:%s" % (repository, tag), rm=True,
+                                decode=True, labels=session_labels()):
+        logger.debug(o)
+        if "error" in o:
+            raise ConuException("failed to build %s: %s" % (name, o["error"]))
+
+
+def prepare_images(images, builds, parallelism=4):
+    """
+    pull and build missing images concurrently, raises ConuException once all of them
+    ended if any of them failed
+
+    :param images: list of str, image references to pull
+    :param builds: list of tuples (image name, path to build context)
+    :param parallelism: int, maximum number of pulls and builds running at the same time
+    :return: None
+    """
+    to_pull = []
+    seen = set()
+    for reference in images:
+        image = DockerImage(*split_image_reference(reference))
+        if image.get_full_name() not in seen and _image_missing(image):
+            seen.add(image.get_full_name())
+            to_pull.append(image)
+    to_build = [(name, path) for name, path in builds
+                if _image_missing(DockerImage(*split_image_reference(name)))]
+    if not to_pull and not to_build:
+        return
+    errors = []
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [(image, executor.submit(image.pull, skip_present=False))
+                   for image in to_pull]
+        futures += [(name, executor.submit(_build_image, name, path))
+                    for name, path in to_build]
+        for image, future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                logger.error("failed to prepare image %s: %s", image, ex)
+                errors.append((image, ex))
+    if errors:
+        raise ConuException("failed to prepare images: %s" %
+                            ", ".join("%s (%s)" % (i, e) for i, e in errors))
+
+
+def pytest_sessionstart(session):
+    config = session.config
+    if getattr(config, "workerinput", None) is not None:
+        return  # the xdist controller prepares images
+    images = config.getini("conu_images")
+    builds = [tuple(line.split(None, 1)) for line in config.getini("conu_builds")]
+    if images or builds:
+        prepare_images(images, builds, parallelism=int(config.getini("conu_parallelism")))
+
+
+@pytest.fixture(scope="session")
+def conu_session_id(request):
+    """
+    ID of this test session (unique per xdist worker); containers created by conu fixtures
+    are labeled with it, removed at the end of the session and reaped if the session crashes
+    """
+    session_id = request.config._conu_session_id
+    reap_dead_sessions()
+    reaper = start_reaper(session_id)
+    yield session_id
+    try:
+        if not request.config.getoption("conu_keep_containers"):
+            remove_session_containers(session_id)
+    finally:
+        reaper.terminate()
+        reaper.wait()
+
+
+@pytest.fixture(scope="session")
+def conu_backend():
+    """ instance of DockerBackend """
+    return DockerBackend()
+
+
+@pytest.fixture()
+def conu_image(conu_backend):
+    """
+    factory which provides images and makes sure they are present:
+    `conu_image(repository, tag="latest")`
+    """
+    def _image(repository, tag="latest"):
+        image = conu_backend.ImageClass(repository, tag=tag)
+        image.ensure_present()
+        return image
+    return _image
+
+
+@pytest.fixture()
+def conu_container(request, conu_session_id):
+    """
+    factory which runs containers in background using `run_via_binary`:
+    `conu_container(image, run_command_instance=None)`; containers are removed at the
+    end of the test
+    """
+    containers = []
+
+    def _container(image, run_command_instance=None):
+        # conu labels the container with the session ID
+        container = image.run_via_binary(run_command_instance)
+        containers.append(container)
+        return container
+
+    yield _container
+    if request.config.getoption("conu_keep_containers"):
+        return
+    for container in containers:
+        try:
+            container.delete(force=True, volumes=True)
+        except NotFound:
+            pass
@@ -0,0 +1,4 @@
+"""
+Helpers for testing code which uses conu.
+"""
+from conu.testing.fake_docker import FakeDockerBackend, FakeDockerClient, FakeExecResult
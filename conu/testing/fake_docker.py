@@ -0,0 +1,740 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory stand-in for docker daemon so that code built on top of conu can be tested
+without docker.
+"""
+from __future__ import print_function, unicode_literals
+
+import copy
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import string
+import tarfile
+import threading
+import time
+
+import requests
+import six
+from docker.errors import APIError, NotFound
+from docker.types import HostConfig
+
+from conu.backend.docker import client as docker_client
+from conu.backend.docker import container as docker_container
+from conu.backend.docker.backend import DockerBackend
+from conu.backend.docker.cache import get_image_metadata_cache
+from conu.backend.docker.container import DockerContainer
+from conu.backend.docker.session import session_labels
+from conu.utils import monotonic
+from conu.utils.instrumentation import InstrumentedClient
+
+logger = logging.getLogger(__name__)
+
+
+def _random_id():
+    return "".join(random.choice(string.hexdigits[:16]) for _ in range(64))
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+def _port_key(port):
+    port = str(port)
+    return port if "/" in port else port + "/tcp"
+
+
+class FakeExecResult(object):
+    """ what a command executed in a fake container returns """
+    def __init__(self, exit_code=0, output=b""):
+        """
+        :param exit_code: int
+        :param output: bytes
+        """
+        self.exit_code = exit_code
+        self.output = output
+
+
+def _mounts(config, host_config):
+    """ Mounts section of container metadata: binds, named and anonymous volumes """
+    mounts = []
+    for bind in host_config.get("Binds") or []:
+        parts = bind.split(":")
+        source, destination = parts[0], parts[1]
+        mounts.append({"Type": "bind" if source.startswith("/") else "volume",
+                       "Name": None if source.startswith("/") else source,
+                       "Source": source, "Destination": destination,
+                       "RW": "ro" not in parts[2:]})
+    bound = set(m["Destination"] for m in mounts)
+    for destination in sorted(config.get("Volumes") or {}):
+        if destination not in bound:
+            volume = _random_id()
+            mounts.append({"Type": "volume", "Name": volume,
+                           "Source": "/var/lib/docker/volumes/%s/_data" % volume,
+                           "Destination": destination, "RW": True})
+    return mounts
+
+
+def _label_changes(changes):
+    """ labels set by LABEL instructions of `docker commit --change` """
+    labels = {}
+    for change in changes or []:
+        instruction, _, value = change.partition(" ")
+        if instruction.upper() == "LABEL":
+            key, _, label_value = value.partition("=")
+            labels[key.strip('"')] = label_value.strip('"')
+    return labels
+
+
+def _matches_labels(labels, label_filters):
+    if isinstance(label_filters, six.string_types):
+        label_filters = [label_filters]
+    for label in label_filters or []:
+        key, _, value = label.partition("=")
+        if key not in labels or (value and labels[key] != value):
+            return False
+    return True
+
+
+class _FakeContainer(object):
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.created = int(time.time())
+        self.logs = b""
+        # port key -> number of seconds since start after which the port accepts connections
+        self.port_delays = {}
+        self.started = None
+        # path -> bytes
+        self.files = {}
+        # resource usage reported by stats
+        self.usage = {"cpu_percent": 0.0, "memory_usage": 10 * 1024 * 1024,
+                      "memory_limit": 2 * 1024 ** 3, "block_read": 0, "block_write": 0,
+                      "net_rx": 0, "net_tx": 0, "pids": 1}
+        self.cpu_usage = 0
+        self.system_cpu_usage = 0
+
+    @property
+    def id(self):
+        return self.metadata["Id"]
+
+    @property
+    def state(self):
+        return self.metadata["State"]
+
+
+class FakeDockerClient(object):
+    """
+    Implementation of the subset of docker.APIClient methods which conu uses; everything is
+    kept in memory and state of containers changes instantly.
+
+    Started containers run until they are stopped or killed, or until `exit_container` is
+    called to simulate that the main process ended. Commands executed in containers are
+    processed by `exec_handler`.
+    """
+    api_version = "1.35"
+
+    def __init__(self, exec_handler=None):
+        """
+        :param exec_handler: callable, invoked as `exec_handler(container_metadata, command)`,
+                it should return an instance of FakeExecResult, bytes (output of a successful
+                command) or None
+        """
+        self.exec_handler = exec_handler
+        # how often are stats streamed, in seconds
+        self.stats_interval = 1.0
+        self._images = {}  # id -> metadata
+        self._tags = {}  # "name:tag" -> id
+        # images which can be pulled: "name:tag" -> metadata template
+        self.registry = {}
+        self._containers = {}  # id -> _FakeContainer
+        self._execs = {}
+        self._events = []
+        self._ips = ("172.17.0.%d" % i for i in itertools.count(2))
+        self._host_ports = itertools.count(32768)
+        self._lock = threading.RLock()
+        self._state_changed = threading.Condition(self._lock)
+
+    # helpers for tests
+
+    def add_image(self, repository, tag="latest", config=None):
+        """
+        make an image available locally
+
+        :param repository: str, image name
+        :param tag: str
+        :param config: dict, Config section of the image metadata
+        :return: str, ID of the image
+        """
+        with self._lock:
+            image_id = "sha256:" + _random_id()
+            name = "%s:%s" % (repository, tag)
+            self._images[image_id] = {
+                "Id": image_id,
+                "RepoTags": [name],
+                "RepoDigests": [],
+                "Created": _now(),
+                "Config": copy.deepcopy(config) or {"Cmd": ["/bin/sh"], "Env": [],
+                                                    "Labels": None},
+                "Size": 0,
+                "_created": int(time.time()),
+                "_files": {},
+            }
+            self._tag(image_id, name)
+            return image_id
+
+    def exit_container(self, container, exit_code=0, logs=b""):
+        """
+        simulate that main process of a container ended
+
+        :param container: str, container ID or name
+        :param exit_code: int
+        :param logs: bytes, output the process printed before exiting
+        :return: None
+        """
+        with self._lock:
+            c = self._get_container(container)
+            c.logs += logs
+            self._finish(c, exit_code)
+
+    def write_logs(self, container, data):
+        """
+        simulate output of the main process of a container
+
+        :param container: str, container ID or name
+        :param data: bytes
+        :return: None
+        """
+        with self._lock:
+            self._get_container(container).logs += data
+
+    def set_port_delay(self, container, port, delay):
+        """
+        set how long after start a port of the container starts accepting connections
+
+        :param container: str, container ID or name
+        :param port: int or str, e.g. 8080 or "53/udp"
+        :param delay: float, seconds
+        :return: None
+        """
+        with self._lock:
+            self._get_container(container).port_delays[_port_key(port)] = delay
+
+    def set_usage(self, container, **usage):
+        """
+        set resource usage reported by stats of the container
+
+        :param container: str, container ID or name
+        :param usage: fields of ResourceSample, e.g. cpu_percent=50.0, memory_usage=1024
+        :return: None
+        """
+        with self._lock:
+            self._get_container(container).usage.update(usage)
+
+    def is_port_open(self, host, port):
+        """
+        check if port of a container with provided IP address accepts connections
+
+        :param host: str, IP address
+        :param port: int
+        :return: bool
+        """
+        with self._lock:
+            for c in self._containers.values():
+                if c.metadata["NetworkSettings"]["IPAddress"] != host:
+                    continue
+                key = _port_key(port)
+                if not c.state["Running"] or key not in c.metadata["NetworkSettings"]["Ports"]:
+                    return False
+                return monotonic() - c.started >= c.port_delays.get(key, 0)
+            return False
+
+    # daemon
+
+    def info(self):
+        with self._lock:
+            return {"Containers": len(self._containers), "Images": len(self._images),
+                    "ExperimentalBuild": False, "ServerVersion": "fake"}
+
+    def version(self):
+        return {"ApiVersion": self.api_version, "Version": "fake"}
+
+    # internal helpers
+
+    def _event(self, typ, action, ident, attributes=None):
+        self._events.append({
+            "Type": typ, "Action": action, "status": action, "id": ident,
+            "Actor": {"ID": ident, "Attributes": attributes or {}},
+            "time": int(time.time()), "timeNano": int(time.time() * 1e9),
+        })
+
+    def _tag(self, image_id, name):
+        old_id = self._tags.get(name)
+        if old_id and old_id != image_id and old_id in self._images:
+            self._images[old_id]["RepoTags"].remove(name)
+        self._tags[name] = image_id
+        if name not in self._images[image_id]["RepoTags"]:
+            self._images[image_id]["RepoTags"].append(name)
+
+    def _get_image(self, ident):
+        if isinstance(ident, dict):
+            ident = ident["Id"]
+        image_id = self._tags.get(ident) or self._tags.get("%s:latest" % ident)
+        if image_id is None:
+            for i in self._images:
+                if i == ident or i[len("sha256:"):].startswith(ident) or i.startswith(ident):
+                    image_id = i
+                    break
+        if image_id is None or image_id not in self._images:
+            raise NotFound("No such image: %s" % ident)
+        return self._images[image_id]
+
+    def _get_container(self, ident):
+        if isinstance(ident, dict):
+            ident = ident["Id"]
+        ident = ident.lstrip("/")
+        for c in self._containers.values():
+            if c.id.startswith(ident) or c.metadata["Name"] == "/" + ident:
+                return c
+        raise NotFound("No such container: %s" % ident)
+
+    def _finish(self, c, exit_code):
+        if not c.state["Running"]:
+            return
+        c.state.update({"Status": "exited", "Running": False, "Pid": 0,
+                        "ExitCode": exit_code, "FinishedAt": _now()})
+        self._event("container", "die", c.id, {"exitCode": str(exit_code)})
+        self._state_changed.notify_all()
+        if c.metadata["HostConfig"].get("AutoRemove"):
+            self._remove_container(c)
+
+    def _remove_container(self, c):
+        del self._containers[c.id]
+        self._event("container", "destroy", c.id)
+        self._state_changed.notify_all()
+
+    # images
+
+    def inspect_image(self, image):
+        with self._lock:
+            metadata = copy.deepcopy(self._get_image(image))
+        return dict((k, v) for k, v in metadata.items() if not k.startswith("_"))
+
+    def images(self, name=None, quiet=False, all=False, filters=None):
+        filters = filters or {}
+        with self._lock:
+            images = [i for i in self._images.values()
+                      if (not name or any(t.startswith(name) for t in i["RepoTags"])) and
+                      _matches_labels(i["Config"].get("Labels") or {}, filters.get("label"))]
+            if quiet:
+                return [i["Id"] for i in images]
+            return [{"Id": i["Id"], "RepoTags": list(i["RepoTags"]), "Created": i["_created"],
+                     "Labels": dict(i["Config"].get("Labels") or {}), "Size": i["Size"]}
+                    for i in images]
+
+    def pull(self, repository, tag=None, stream=False, decode=False, **kwargs):
+        tag = tag or "latest"
+        name = "%s:%s" % (repository, tag)
+        with self._lock:
+            if name not in self.registry:
+                events = [{"error": "manifest for %s not found" % name}]
+            else:
+                image_id = self.add_image(repository, tag, config=self.registry[name])
+                self._images[image_id]["RepoDigests"] = ["%s@sha256:%s" % (
+                    repository, image_id[len("sha256:"):])]
+                events = [{"status": "Pulling from %s" % repository, "id": tag},
+                          {"status": "Digest: sha256:%s" % image_id[len("sha256:"):]},
+                          {"status": "Status: Downloaded newer image for %s" % name}]
+                self._event("image", "pull", name)
+        if stream:
+            return iter(events)
+        return "\n".join(six.text_type(e) for e in events)
+
+    def tag(self, image, repository, tag=None, force=False):
+        with self._lock:
+            self._tag(self._get_image(image)["Id"], "%s:%s" % (repository, tag or "latest"))
+            return True
+
+    def remove_image(self, image, force=False, noprune=False):
+        with self._lock:
+            metadata = self._get_image(image)
+            used = [c for c in self._containers.values() if c.metadata["Image"] == metadata["Id"]]
+            if used and not force:
+                raise APIError("conflict: unable to remove image %s, it's being used by "
+                               "container %s" % (image, used[0].id))
+            if image in self._tags and len(metadata["RepoTags"]) > 1:
+                # only untag
+                metadata["RepoTags"].remove(image)
+                del self._tags[image]
+                return
+            for t in metadata["RepoTags"]:
+                self._tags.pop(t, None)
+            del self._images[metadata["Id"]]
+            self._event("image", "delete", metadata["Id"])
+
+    # containers
+
+    def create_host_config(self, *args, **kwargs):
+        return HostConfig(self.api_version, *args, **kwargs)
+
+    def create_container(self, image, command=None, name=None, environment=None, labels=None,
+                         ports=None, host_config=None, detach=False, entrypoint=None,
+                         working_dir=None, user=None, **kwargs):
+        with self._lock:
+            image_metadata = self._get_image(image)
+            if name and any(c.metadata["Name"] == "/" + name for c in self._containers.values()):
+                raise APIError("Conflict. The container name \"/%s\" is already in use" % name)
+            if isinstance(command, six.string_types):
+                command = command.split()
+            if isinstance(environment, dict):
+                environment = ["%s=%s" % x for x in environment.items()]
+            container_id = _random_id()
+            host_config = dict(host_config or {})
+            exposed = [_port_key(p if not isinstance(p, tuple) else "%s/%s" % p)
+                       for p in (ports or [])]
+            config = copy.deepcopy(image_metadata["Config"])
+            config.update({
+                "Image": image,
+                "Cmd": command or config.get("Cmd"),
+                "Env": (config.get("Env") or []) + (environment or []),
+                "Labels": dict(config.get("Labels") or {}, **(labels or {})),
+                "ExposedPorts": dict(config.get("ExposedPorts") or {},
+                                     **dict((p, {}) for p in exposed)),
+                "WorkingDir": working_dir or config.get("WorkingDir", ""),
+                "User": user or config.get("User", ""),
+            })
+            if entrypoint:
+                config["Entrypoint"] = entrypoint
+            metadata = {
+                "Id": container_id,
+                "Name": "/" + (name or "fake_" + container_id[:12]),
+                "Created": _now(),
+                "Image": image_metadata["Id"],
+                "Config": config,
+                "HostConfig": host_config,
+                "State": {"Status": "created", "Running": False, "Paused": False,
+                          "Restarting": False, "Dead": False, "Pid": 0, "ExitCode": 0,
+                          "StartedAt": "0001-01-01T00:00:00Z",
+                          "FinishedAt": "0001-01-01T00:00:00Z"},
+                "NetworkSettings": {"IPAddress": "", "Ports": {}, "Networks": {}},
+                "Mounts": _mounts(config, host_config),
+            }
+            self._containers[container_id] = _FakeContainer(metadata)
+            self._containers[container_id].files = dict(image_metadata["_files"])
+            self._event("container", "create", container_id, {"image": image})
+            return {"Id": container_id, "Warnings": None}
+
+    def inspect_container(self, container):
+        with self._lock:
+            return copy.deepcopy(self._get_container(container).metadata)
+
+    def containers(self, quiet=False, all=False, filters=None, **kwargs):
+        filters = filters or {}
+        result = []
+        with self._lock:
+            for c in self._containers.values():
+                m = c.metadata
+                if not all and not c.state["Running"]:
+                    continue
+                if "status" in filters and c.state["Status"] != filters["status"]:
+                    continue
+                if "name" in filters and filters["name"] not in m["Name"]:
+                    continue
+                if "id" in filters and not c.id.startswith(filters["id"]):
+                    continue
+                container_labels = m["Config"]["Labels"] or {}
+                if not _matches_labels(container_labels, filters.get("label")):
+                    continue
+                result.append({"Id": c.id, "Names": [m["Name"]], "Image": m["Config"]["Image"],
+                               "ImageID": m["Image"], "Command": " ".join(m["Config"]["Cmd"] or []),
+                               "Created": c.created, "State": c.state["Status"],
+                               "Status": c.state["Status"], "Labels": dict(container_labels)})
+        if quiet:
+            return [{"Id": r["Id"]} for r in result]
+        return result
+
+    def start(self, container, *args, **kwargs):
+        with self._lock:
+            c = self._get_container(container)
+            if c.state["Running"]:
+                return
+            ip = next(self._ips)
+            ports = {}
+            bindings = c.metadata["HostConfig"].get("PortBindings") or {}
+            for p in c.metadata["Config"]["ExposedPorts"]:
+                if p in bindings:
+                    ports[p] = [{"HostIp": b.get("HostIp") or "0.0.0.0",
+                                 "HostPort": b.get("HostPort") or str(next(self._host_ports))}
+                                for b in bindings[p]]
+                else:
+                    ports[p] = None
+            c.metadata["NetworkSettings"] = {
+                "IPAddress": ip, "Ports": ports,
+                "Networks": {"bridge": {"IPAddress": ip, "GlobalIPv6Address": ""}},
+            }
+            c.state.update({"Status": "running", "Running": True, "Pid": random.randint(2, 32768),
+                            "ExitCode": 0, "StartedAt": _now()})
+            c.started = monotonic()
+            self._event("container", "start", c.id)
+            self._state_changed.notify_all()
+
+    def restart(self, container, timeout=10):
+        with self._lock:
+            self.stop(container, timeout=timeout)
+            self.start(container)
+
+    def stop(self, container, timeout=None):
+        with self._lock:
+            c = self._get_container(container)
+            self._finish(c, 0)
+            self._event("container", "stop", c.id)
+
+    def kill(self, container, signal=None):
+        with self._lock:
+            c = self._get_container(container)
+            if not c.state["Running"]:
+                raise APIError("Cannot kill container %s: it is not running" % c.id)
+            self._event("container", "kill", c.id, {"signal": str(signal or "SIGKILL")})
+            self._finish(c, 137)
+
+    def commit(self, container, repository=None, tag=None, message=None, author=None,
+               pause=True, changes=None, conf=None):
+        with self._lock:
+            c = self._get_container(container)
+            config = copy.deepcopy(c.metadata["Config"])
+            config.update(conf or {})
+            config["Labels"] = dict(config.get("Labels") or {}, **_label_changes(changes))
+            image_id = self.add_image(repository or "<none>", tag or "latest", config=config)
+            image = self._images[image_id]
+            # content of volumes is not committed
+            volumes = [m["Destination"].rstrip("/") + "/" for m in c.metadata["Mounts"]]
+            image["_files"] = dict((p, content) for p, content in c.files.items()
+                                   if not any(p.startswith(v) for v in volumes))
+            self._event("container", "commit", c.id)
+            return {"Id": image_id}
+
+    def remove_container(self, container, v=False, link=False, force=False):
+        with self._lock:
+            c = self._get_container(container)
+            if c.state["Running"]:
+                if not force:
+                    raise APIError("You cannot remove a running container %s. Stop the "
+                                   "container before attempting removal or force remove" % c.id)
+                self._finish(c, 137)
+                if c.id not in self._containers:  # auto-removed
+                    return
+            self._remove_container(c)
+
+    def wait(self, container, timeout=None, condition=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._lock:
+            c = self._get_container(container)
+            while c.state["Running"] or c.state["Status"] == "created":
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise requests.exceptions.ReadTimeout(
+                        "waiting for container %s timed out" % c.id)
+                self._state_changed.wait(remaining)
+            return {"StatusCode": c.state["ExitCode"], "Error": None}
+
+    def logs(self, container, stdout=True, stderr=True, stream=False, timestamps=False,
+             tail="all", since=None, follow=None, until=None):
+        with self._lock:
+            logs = self._get_container(container).logs
+        if stream:
+            return iter(logs.splitlines(True))
+        return logs
+
+    # exec
+
+    def exec_create(self, container, cmd, **kwargs):
+        with self._lock:
+            c = self._get_container(container)
+            if not c.state["Running"]:
+                raise APIError("Container %s is not running" % c.id)
+            exec_id = _random_id()
+            self._execs[exec_id] = {"ID": exec_id, "ContainerID": c.id, "Running": False,
+                                    "ExitCode": None, "ProcessConfig": {"arguments": cmd}}
+            return {"Id": exec_id}
+
+    def exec_start(self, exec_id, detach=False, tty=False, stream=False, socket=False,
+                   demux=False):
+        if isinstance(exec_id, dict):
+            exec_id = exec_id["Id"]
+        with self._lock:
+            e = self._execs[exec_id]
+            metadata = copy.deepcopy(self._containers[e["ContainerID"]].metadata)
+        result = None
+        if self.exec_handler:
+            result = self.exec_handler(metadata, e["ProcessConfig"]["arguments"])
+        if not isinstance(result, FakeExecResult):
+            result = FakeExecResult(output=result or b"")
+        e["ExitCode"] = result.exit_code
+        if stream:
+            return iter([result.output])
+        return result.output
+
+    def exec_inspect(self, exec_id):
+        if isinstance(exec_id, dict):
+            exec_id = exec_id["Id"]
+        with self._lock:
+            return copy.deepcopy(self._execs[exec_id])
+
+    # stats
+
+    def _stats(self, c):
+        u = c.usage
+        precpu = {"cpu_usage": {"total_usage": c.cpu_usage},
+                  "system_cpu_usage": c.system_cpu_usage, "online_cpus": 1}
+        c.system_cpu_usage += 10 ** 9
+        c.cpu_usage += int(u["cpu_percent"] / 100.0 * 10 ** 9)
+        return {
+            "read": _now(),
+            "cpu_stats": {"cpu_usage": {"total_usage": c.cpu_usage},
+                          "system_cpu_usage": c.system_cpu_usage, "online_cpus": 1},
+            "precpu_stats": precpu,
+            "memory_stats": {"usage": u["memory_usage"], "limit": u["memory_limit"],
+                             "stats": {"inactive_file": 0}},
+            "blkio_stats": {"io_service_bytes_recursive": [
+                {"major": 8, "minor": 0, "op": "read", "value": u["block_read"]},
+                {"major": 8, "minor": 0, "op": "write", "value": u["block_write"]}]},
+            "networks": {"eth0": {"rx_bytes": u["net_rx"], "tx_bytes": u["net_tx"]}},
+            "pids_stats": {"current": u["pids"] if c.state["Running"] else 0},
+        }
+
+    def stats(self, container, decode=None, stream=True, one_shot=None):
+        with self._lock:
+            c = self._get_container(container)
+            if not stream:
+                return self._stats(c)
+
+        def _stream():
+            # ends once the container is stopped
+            while True:
+                with self._lock:
+                    if not c.state["Running"]:
+                        return
+                    response = self._stats(c)
+                yield response if decode else json.dumps(response).encode("utf-8")
+                time.sleep(self.stats_interval)
+        return _stream()
+
+    # archives
+
+    def put_archive(self, container, path, data):
+        with self._lock:
+            c = self._get_container(container)
+            if not isinstance(data, bytes):
+                data = b"".join(data)
+            with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                for member in tar.getmembers():
+                    if member.isfile():
+                        p = os.path.normpath(os.path.join(path, member.name))
+                        c.files[p] = tar.extractfile(member).read()
+            return True
+
+    def get_archive(self, container, path, chunk_size=None, encode_stream=False):
+        with self._lock:
+            c = self._get_container(container)
+            path = os.path.normpath(path)
+            files = dict((p, content) for p, content in c.files.items()
+                         if p == path or p.startswith(path.rstrip("/") + "/"))
+        if not files:
+            raise NotFound("Could not find the file %s in container %s" % (path, container))
+        buf = io.BytesIO()
+        base = os.path.dirname(path)
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            for p, content in sorted(files.items()):
+                info = tarfile.TarInfo(os.path.relpath(p, base))
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        stat = {"name": os.path.basename(path), "size": len(files.get(path, b"")),
+                "mode": 0o644 if path in files else 0o40000755}
+        return iter([buf.getvalue()]), stat
+
+    # events
+
+    def events(self, since=None, until=None, filters=None, decode=None):
+        """ events which happened so far, the stream does not block waiting for new ones """
+        with self._lock:
+            events = list(self._events)
+        result = []
+        for e in events:
+            if since is not None and e["time"] < since:
+                continue
+            if until is not None and e["time"] > until:
+                continue
+            if filters:
+                if "type" in filters and e["Type"] != filters["type"]:
+                    continue
+                if "container" in filters and not e["id"].startswith(filters["container"]):
+                    continue
+                if "event" in filters and e["Action"] != filters["event"]:
+                    continue
+            result.append(e)
+        if decode:
+            return iter(result)
+        return iter(json.dumps(e).encode("utf-8") for e in result)
+
+
+class FakeDockerBackend(DockerBackend):
+    """
+    Docker backend which talks to an in-memory FakeDockerClient instead of docker daemon;
+    use it as a context manager: the fake client replaces the real one for all DockerImage
+    and DockerContainer instances created inside the block and port checks are answered by
+    the fake as well.
+
+    ::
+
+        with FakeDockerBackend() as backend:
+            backend.client.add_image("fedora", "27")
+            image = backend.ImageClass("fedora", tag="27")
+            container = backend.create_container(image, command=["sleep", "infinity"],
+                                                 ports=[8080])
+            container.start()
+            container.wait_for_port(8080)
+
+    Please bear in mind that methods which execute binaries (such as run_via_binary,
+    copy_to or mount) are not served by the fake.
+    """
+    def __init__(self, exec_handler=None, **kwargs):
+        """
+        :param exec_handler: callable, see FakeDockerClient
+        :param kwargs: keyword arguments passed to DockerBackend constructor
+        """
+        super(FakeDockerBackend, self).__init__(**kwargs)
+        self.client = FakeDockerClient(exec_handler=exec_handler)
+        self._original_client = None
+        self._original_check_port = None
+
+    def __enter__(self):
+        self._original_client = docker_client.client
+        self._original_check_port = docker_container.check_port
+        # instrumented like the real client
+        docker_client.client = InstrumentedClient(self.client)
+        docker_container.check_port = self._check_port
+        get_image_metadata_cache().clear()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        docker_client.client = self._original_client
+        docker_container.check_port = self._original_check_port
+        get_image_metadata_cache().clear()
+
+    def _check_port(self, port, host, timeout=10):
+        return self.client.is_port_open(host, port)
+
+    def create_container(self, image, **kwargs):
+        """
+        create a container in the fake daemon, it's labeled with the current session
+
+        :param image: instance of DockerImage
+        :param kwargs: keyword arguments passed to FakeDockerClient.create_container
+        :return: instance of DockerContainer
+        """
+        kwargs["labels"] = dict(session_labels(), **(kwargs.get("labels") or {}))
+        response = self.client.create_container(image.get_id(), **kwargs)
+        return DockerContainer(image, response["Id"], name=kwargs.get("name"))
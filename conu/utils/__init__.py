@@ -5,11 +5,14 @@ import logging
 import random
 import socket
 import string
-import subprocess
+import time
 
 
 logger = logging.getLogger(__name__)
 
+# time.monotonic is not available on python 2, fall back to wall clock there
+monotonic = getattr(time, "monotonic", time.time)
+
 
 def check_port(port, host, timeout=10):
     """
@@ -36,17 +39,18 @@ def check_port(port, host, timeout=10):
         sock.close()
 
 
-def get_selinux_status():
+def get_selinux_status(refresh=False):
     """
-    get SELinux status of host
+    get SELinux status of host; it's probed once per process
 
-    :return: string, one of Enforced, Permissive, Disabled
+    :param refresh: bool, probe the status again
+    :return: string, one of Enforcing, Permissive, Disabled
     """
-    # alternatively, we could read directly from /sys/fs/selinux/{enforce,status}, but status is
-    # empty (why?) and enforce doesn't tell whether SELinux is disabled or not
-    o = run_cmd(["getenforce"], return_output=True).strip()  # libselinux-utils
-    logger.debug("SELinux is %r", o)
-    return o
+    # imported here because the module depends on this one
+    from conu.utils import capabilities
+    if refresh:
+        capabilities.refresh("selinux")
+    return capabilities.selinux_status()
 
 
 def is_selinux_disabled():
@@ -68,19 +72,29 @@ def random_str(size=10):
     return ''.join(random.choice(string.ascii_lowercase) for _ in range(size))
 
 
-def run_cmd(cmd, return_output=False, **kwargs):
+def run_cmd(cmd, return_output=False, timeout=None, **kwargs):
     """
     run provided command on host system using the same user as you invoked this code, raises
-    subprocess.CalledProcessError if it fails
+    subprocess.CalledProcessError if it fails; error output of the command is passed
+    through unless stderr is set, e.g. with `stderr=conu.utils.runner.CAPTURE` the end of
+    the error output is available as the stderr attribute of the exception
 
     :param cmd: list of str
     :param return_output: bool, return output of the command
-    :param kwargs: pass keyword arguments to subprocess.check_* functions; for more info,
-            please check `help(subprocess.Popen)`
+    :param timeout: int or float, kill the command and raise CommandTimeout if it doesn't
+            finish in this many seconds
+    :param kwargs: pass keyword arguments to CommandRunner.run and subprocess.Popen;
+            for more info, please check `help(subprocess.Popen)`
     :return: None or str
     """
-    logger.debug("command: %s" % cmd)
+    # imported here because the module depends on this one
+    from conu.utils.runner import CAPTURE, get_command_runner
     if return_output:
-        return subprocess.check_output(cmd, **kwargs).decode("utf-8")
+        kwargs.setdefault("stdout", CAPTURE)
+        kwargs.setdefault("max_output", None)
     else:
-        subprocess.check_call(cmd, **kwargs)
+        kwargs.setdefault("stdout", None)
+    kwargs.setdefault("stderr", None)
+    result = get_command_runner().run(cmd, timeout=timeout, **kwargs)
+    if return_output:
+        return result.stdout.decode("utf-8")
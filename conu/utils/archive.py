@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming helpers for (possibly compressed) archives with checksums.
+"""
+from __future__ import print_function, unicode_literals
+
+import gzip
+import hashlib
+import io
+import logging
+import os
+import stat
+import subprocess
+import threading
+
+from conu.exceptions import ConuException
+from conu.utils.capabilities import binary_path
+from conu.utils.runner import get_command_runner
+
+logger = logging.getLogger(__name__)
+
+# size of a chunk which is read or written at once
+CHUNK_SIZE = 2 * 1024 * 1024
+CHECKSUM_SUFFIX = ".sha256"
+# suffix of files which are being written, they are renamed once they are complete
+PARTIAL_SUFFIX = ".part"
+
+
+def read_chunks(fd, chunk_size=CHUNK_SIZE):
+    """
+    iterate over content of a file object in chunks of fixed size
+
+    :param fd: file object opened in binary mode
+    :param chunk_size: int, size of a chunk in bytes
+    :return: generator of bytes
+    """
+    while True:
+        chunk = fd.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def compute_checksum(path, chunk_size=CHUNK_SIZE):
+    """
+    compute sha256 checksum of a file without loading it into memory
+
+    :param path: str, path to the file
+    :param chunk_size: int, size of a chunk in bytes
+    :return: str, hex digest
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in read_chunks(fd, chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_checksum_file(path, checksum):
+    """
+    store checksum of a file next to it in the format of `sha256sum`
+
+    :param path: str, path to the file
+    :param checksum: str, hex digest
+    :return: str, path to the checksum file
+    """
+    checksum_path = path + CHECKSUM_SUFFIX
+    partial_path = checksum_path + PARTIAL_SUFFIX
+    try:
+        with io.open(partial_path, "w") as fd:
+            fd.write("%s  %s\n" % (checksum, path.rsplit("/", 1)[-1]))
+        os.rename(partial_path, checksum_path)
+    except Exception:
+        _remove_quietly(partial_path)
+        raise
+    return checksum_path
+
+
+def _remove_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def verify_checksum(path, chunk_size=CHUNK_SIZE, required=False):
+    """
+    verify file against checksum stored next to it, raises ConuException if the checksum
+    does not match
+
+    :param path: str, path to the file
+    :param chunk_size: int, size of a chunk in bytes
+    :param required: bool, raise ConuException if there is no checksum file
+    :return: bool, False if there is no checksum file, True if the checksum is correct
+    """
+    try:
+        with io.open(path + CHECKSUM_SUFFIX) as fd:
+            expected = fd.read().split()[0]
+    except (IOError, OSError):
+        if required:
+            raise ConuException("can't verify %s, checksum file %s is missing"
+                                % (path, path + CHECKSUM_SUFFIX))
+        logger.debug("no checksum file for %s", path)
+        return False
+    actual = compute_checksum(path, chunk_size=chunk_size)
+    if actual != expected:
+        raise ConuException("checksum of %s doesn't match: expected %s, got %s"
+                            % (path, expected, actual))
+    return True
+
+
+class _HashingWriter(object):
+    """ file-like object which computes sha256 of all the written data """
+    def __init__(self, fd):
+        self.fd = fd
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        self.fd.write(data)
+
+    def flush(self):
+        self.fd.flush()
+
+
+class ArchiveWriter(object):
+    """
+    Write an archive to a file chunk by chunk, optionally compress it with gzip and compute
+    checksum of the written file. When parallel compression is requested and `pigz` is
+    available, it is used to compress using multiple CPU cores.
+
+    The data is written into `<path>.part` which is renamed to `path` once the archive is
+    complete, so `path` never contains a truncated archive; the partial file is removed
+    when writing fails.
+
+    ::
+
+        with ArchiveWriter("/tmp/image.tar.gz", compress=True) as w:
+            for chunk in stream:
+                w.write(chunk)
+        print(w.checksum)
+    """
+    def __init__(self, path, compress=False, parallel=True, threads=None):
+        """
+        :param path: str, path to the file
+        :param compress: bool, compress the content with gzip
+        :param parallel: bool, compress using multiple threads if `pigz` is available
+        :param threads: int, number of compression threads, defaults to the number of CPUs
+        """
+        self.path = path
+        self.partial_path = path + PARTIAL_SUFFIX
+        self.compress = compress
+        self.parallel = parallel
+        self.threads = threads
+        self.checksum = None
+        self._fd = None
+        self._writer = None
+        self._target = None
+        self._pigz = None
+        self._pigz_reader = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def open(self):
+        self._fd = open(self.partial_path, "wb")
+        self._writer = _HashingWriter(self._fd)
+        if not self.compress:
+            self._target = self._writer
+            return
+        pigz = binary_path("pigz") if self.parallel else None
+        if pigz:
+            cmd = [pigz, "-c"]
+            if self.threads:
+                cmd += ["-p", str(self.threads)]
+            logger.debug("compressing %s using %s", self.path, cmd)
+            self._pigz = get_command_runner().popen(cmd, stdin=subprocess.PIPE,
+                                                    stdout=subprocess.PIPE)
+            self._pigz_reader = threading.Thread(target=self._copy_pigz_output)
+            self._pigz_reader.daemon = True
+            self._pigz_reader.start()
+            self._target = self._pigz.stdin
+        else:
+            self._target = gzip.GzipFile(fileobj=self._writer, mode="wb")
+
+    def _copy_pigz_output(self):
+        for chunk in read_chunks(self._pigz.stdout):
+            self._writer.write(chunk)
+
+    def write(self, chunk):
+        """
+        write a chunk of data
+
+        :param chunk: bytes
+        :return: None
+        """
+        self._target.write(chunk)
+
+    def close(self):
+        """
+        flush everything to the file, compute the checksum and move the file to its final
+        path; the partial file is removed if anything fails
+
+        :return: None
+        """
+        if self._fd is None:
+            return
+        try:
+            try:
+                if self._pigz:
+                    self._pigz.stdin.close()
+                    self._pigz_reader.join()
+                    if self._pigz.wait():
+                        raise ConuException("pigz failed with return code %s"
+                                            % self._pigz.returncode)
+                elif self.compress:
+                    self._target.close()
+                self._writer.flush()
+            finally:
+                self._fd.close()
+                self._fd = None
+            os.rename(self.partial_path, self.path)
+        except Exception:
+            _remove_quietly(self.partial_path)
+            raise
+        self.checksum = self._writer.hash.hexdigest()
+
+    def abort(self):
+        """
+        stop writing and remove the partial file, `path` is left untouched
+
+        :return: None
+        """
+        if self._fd is None:
+            return
+        try:
+            if self._pigz:
+                self._pigz.kill()
+                try:
+                    self._pigz.stdin.close()
+                except (IOError, OSError):
+                    pass
+                self._pigz_reader.join()
+                self._pigz.wait()
+        finally:
+            self._fd.close()
+            self._fd = None
+            _remove_quietly(self.partial_path)
+
+
+def compute_tree_checksum(path, chunk_size=CHUNK_SIZE):
+    """
+    compute sha256 checksum of a directory tree: relative paths, permission bits, symlink
+    targets and content of all files are included, so any change in the tree changes
+    the checksum; symlinks to directories are not followed
+
+    :param path: str, path to the directory
+    :param chunk_size: int, size of a chunk in bytes
+    :return: str, hex digest
+    """
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files + dirs):
+            p = os.path.join(root, name)
+            rel_path = os.path.relpath(p, path)
+            st = os.lstat(p)
+            h.update(("%s\0%o\0" % (rel_path, st.st_mode)).encode("utf-8"))
+            if stat.S_ISLNK(st.st_mode):
+                h.update(os.readlink(p).encode("utf-8"))
+            elif stat.S_ISREG(st.st_mode):
+                with open(p, "rb") as fd:
+                    for chunk in read_chunks(fd, chunk_size):
+                        h.update(chunk)
+            h.update(b"\0")
+    return h.hexdigest()
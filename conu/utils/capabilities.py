@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Capabilities of the host: SELinux state, available binaries, their features and version
+of docker API.
+They are probed once per process and cached; call refresh() when the host changes, e.g.
+after installing a binary.
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import logging
+import os
+import shutil
+import threading
+
+from conu.utils.runner import get_command_runner
+
+logger = logging.getLogger(__name__)
+
+SELINUXFS = "/sys/fs/selinux"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _memoized(key, fnc):
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+    value = fnc()
+    with _cache_lock:
+        return _cache.setdefault(key, value)
+
+
+def refresh(*keys):
+    """
+    forget probed capabilities, so they are probed again when needed
+
+    :param keys: str, forget only these, e.g. "selinux", "binary:s2i", "docker_api_version";
+            all when not specified
+    :return: None
+    """
+    with _cache_lock:
+        if not keys:
+            _cache.clear()
+        for key in keys:
+            _cache.pop(key, None)
+
+
+def find_executable(name):
+    """
+    locate executable in $PATH, the result is not cached
+
+    :param name: str, name of the executable
+    :return: str, path to the executable or None
+    """
+    try:
+        return shutil.which(name)
+    except AttributeError:  # python 2
+        from distutils.spawn import find_executable as _find_executable
+        return _find_executable(name)
+
+
+def binary_path(name):
+    """
+    path to the executable in $PATH, cached per process
+
+    :param name: str, name of the executable, e.g. "s2i", "atomic" or "setfacl"
+    :return: str or None if it's not available
+    """
+    return _memoized("binary:%s" % name, lambda: find_executable(name))
+
+
+def has_binary(name):
+    """
+    check if executable is present in $PATH, cached per process
+
+    :param name: str, name of the executable
+    :return: bool
+    """
+    return binary_path(name) is not None
+
+
+def s2i_supports_labels():
+    """
+    check if `s2i build` accepts the --label option (not all the releases do), cached per
+    process
+
+    :return: bool
+    """
+    def _probe():
+        try:
+            result = get_command_runner().run([binary_path("s2i"), "build", "--help"],
+                                              check=False)
+        except OSError as ex:
+            logger.debug("can't run s2i: %s", ex)
+            return False
+        return b"--label" in result.stdout
+    if not has_binary("s2i"):
+        return False
+    return _memoized("s2i_labels", _probe)
+
+
+def _probe_selinux_status():
+    enforce = os.path.join(SELINUXFS, "enforce")
+    try:
+        with io.open(enforce, "r") as fd:
+            value = fd.read().strip()
+    except (IOError, OSError):
+        if os.path.isdir(SELINUXFS) or not has_binary("getenforce"):
+            # selinuxfs is not mounted: SELinux is disabled
+            return "Disabled"
+        # fall back to the utility, e.g. in a container with /sys/fs/selinux hidden
+        from conu.utils import run_cmd  # the module depends on this one
+        return run_cmd(["getenforce"], return_output=True).strip()
+    return "Enforcing" if value == "1" else "Permissive"
+
+
+def selinux_status():
+    """
+    SELinux status of the host read from selinuxfs (no process is spawned), cached per
+    process
+
+    :return: str, one of Enforcing, Permissive, Disabled
+    """
+    status = _memoized("selinux", _probe_selinux_status)
+    logger.debug("SELinux is %r", status)
+    return status
+
+
+def docker_api_version():
+    """
+    version of API of the docker daemon, cached per process
+
+    :return: str, e.g. "1.35"
+    """
+    def _probe():
+        from conu.backend.docker.client import get_client  # avoid importing docker eagerly
+        return get_client().version()["ApiVersion"]
+    return _memoized("docker_api_version", _probe)
@@ -1,19 +1,70 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, unicode_literals
 
+import collections
+import errno
 import logging
 import os
 import shutil
 import pwd
+import tempfile
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from conu.exceptions import ConuException
-from conu.utils import run_cmd, is_selinux_disabled
+from conu.utils import run_cmd, is_selinux_disabled, random_str, xattrs
 
 import six
 
 
 logger = logging.getLogger(__name__)
 
+# directories removed in background are renamed to this prefix first
+TRASH_PREFIX = ".conu-trash-"
+# image of the helper container which removes files the current user can't remove,
+# e.g. those created by a container running as a different user
+CLEANUP_IMAGE = "registry.fedoraproject.org/fedora-minimal"
+
+
+def _set_selinux_context(paths, context=None, user=None, role=None, type_=None,
+                         range_=None):
+    """
+    set SELinux context or its fields of all the paths through extended attributes;
+    those which can't be labeled this way are labeled by a single chcon invocation
+    """
+    if not context and not any([user, role, type_, range_]):
+        return
+    logger.debug("setting SELinux context of %s", paths)
+    remaining = [p for p in paths if not xattrs.set_selinux_context(
+        p, context, selinux_user=user, selinux_role=role, selinux_type=type_,
+        selinux_range=range_)]
+    if not remaining:
+        return
+    if context:
+        run_cmd(["chcon", context] + remaining)
+        return
+    # chcon [OPTION]... [-u USER] [-r ROLE] [-l RANGE] [-t TYPE] FILE...
+    c = ["chcon"]
+    for option, value in [("-u", user), ("-r", role), ("-l", range_), ("-t", type_)]:
+        if value:
+            c += [option, value]
+    run_cmd(c + remaining)
+
+
+def _add_facl_rules(paths, rules):
+    """
+    apply ACL rules on all the paths through extended attributes; those where it's not
+    possible are handled by a single setfacl invocation
+    """
+    # we are not using pylibacl b/c it's only for python 2
+    if not rules:
+        return
+    logger.debug("adding ACLs %s to %s", rules, paths)
+    remaining = [p for p in paths if not xattrs.apply_acl_rules(p, rules)]
+    if remaining:
+        run_cmd(["setfacl", "-m", ",".join(rules)] + remaining)
+
 
 class Directory(object):
     """
@@ -101,15 +152,34 @@ class Directory(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.clean()
 
-    def clean(self):
+    @classmethod
+    def initialize_many(cls, directories, parallelism=4):
+        """
+        create and configure many directories at once, see DirectorySet
+
+        :param directories: list of Directory instances or dict, see DirectorySet
+        :param parallelism: int, number of directories removed at the same time on cleanup
+        :return: instance of DirectorySet, already initialized
+        """
+        directory_set = DirectorySet(directories, parallelism=parallelism)
+        directory_set.initialize()
+        return directory_set
+
+    def clean(self, background=False):
         """
         remove the directory we operated on
 
+        :param background: bool, rename the directory aside, so the path can be reused right
+                away, and remove it in background using TreeRemover
         :return: None
         """
         if self._initialized:
-            logger.info("brace yourselves, removing %r", self.path)
-            shutil.rmtree(self.path)
+            if background:
+                logger.info("removing %r in background", self.path)
+                get_tree_remover().remove(self.path)
+            else:
+                logger.info("brace yourselves, removing %r", self.path)
+                shutil.rmtree(self.path)
 
     def initialize(self):
         """
@@ -135,25 +205,13 @@ class Directory(object):
 
     def _set_selinux_context(self):
         """
-        set SELinux context or fields using chcon program
+        set SELinux context or fields through extended attributes, using chcon program
+        when that's not possible
 
         :return: None
         """
-        # FIXME: do this using python API if possible
-        if self.selinux_context:
-            logger.debug("setting SELinux context of %s to %s", self.path, self.selinux_context)
-            run_cmd(["chcon", self.selinux_context, self.path])
-        if any([self.selinux_user, self.selinux_role, self.selinux_type, self.selinux_range]):
-            logger.debug("setting SELinux fields of %s", self.path, self.selinux_context)
-            # chcon [OPTION]... [-u USER] [-r ROLE] [-l RANGE] [-t TYPE] FILE...
-            pairs = [("-u", self.selinux_user), ("-r", self.selinux_role),
-                     ("-l", self.selinux_range), ("-t", self.selinux_type)]
-            c = ["chcon"]
-            for p in pairs:
-                if p[1]:
-                    c += p
-            c += [self.path]
-            run_cmd(c)
+        _set_selinux_context([self.path], self.selinux_context, self.selinux_user,
+                             self.selinux_role, self.selinux_type, self.selinux_range)
 
     def _set_ownership(self):
         """
@@ -182,15 +240,12 @@ class Directory(object):
 
     def _add_facl_rules(self):
         """
-        apply ACL rules on the directory using setfacl program
+        apply ACL rules on the directory through extended attributes, using setfacl program
+        when that's not possible
 
         :return: None
         """
-        # we are not using pylibacl b/c it's only for python 2
-        if self.facl_rules:
-            logger.debug("adding ACLs %s to %s", self.facl_rules, self.path)
-            r = ",".join(self.facl_rules)
-            run_cmd(["setfacl", "-m", r, self.path])
+        _add_facl_rules([self.path], self.facl_rules)
 
     def __repr__(self):
         return "Directory(path=%s)" % (self.path, )
@@ -201,3 +256,327 @@ class Directory(object):
     def __str__(self):
         # we could be possible initialize here, but... it's tricky
         return str(self.path)
+
+
+class DirectorySet(object):
+    """
+    Many directories provisioned together, e.g. volumes of a multi-container deployment:
+
+    ::
+
+        with DirectorySet({"db": {"mode": 0o0700, "user_owner": 26},
+                           "db/log": {"facl_rules": ["u:26:rwx"]},
+                           "www": {"selinux_type": "container_file_t"}},
+                          root="/srv/volumes") as volumes:
+            db_path = volumes["db"].path
+
+    Directories sharing ACL rules or SELinux labels are configured at once: in case the
+    labels can't be set through extended attributes, a single setfacl or chcon
+    invocation covers all of them. Directories are removed in parallel when cleaning up.
+    With tmpfs=True, a tmpfs filesystem is mounted on the root (this requires root
+    privileges): the directories never hit the disk and unmounting removes them instantly.
+    """
+
+    def __init__(self, directories, root=None, tmpfs=False, tmpfs_size=None, parallelism=4):
+        """
+        :param directories: list of Directory instances, or dict: path -> dict of keyword
+                arguments of Directory (other than path); relative paths are relative to root
+        :param root: str, directory containing the set, a temporary directory is created
+                when tmpfs is requested and root is not specified; with tmpfs, the root
+                is removed after unmounting only if it didn't exist before
+        :param tmpfs: bool, mount tmpfs on root
+        :param tmpfs_size: str, size limit of the tmpfs, e.g. "512m"
+        :param parallelism: int, number of directories removed at the same time
+        """
+        # the root was created by this set, so it's removed with it
+        self._created_root = False
+        if tmpfs and root is None:
+            root = tempfile.mkdtemp(prefix="conu-volumes-")
+            self._created_root = True
+        self.root = root
+        self.tmpfs = tmpfs
+        self.tmpfs_size = tmpfs_size
+        self.parallelism = parallelism
+        self._mounted = False
+        self.directories = collections.OrderedDict()
+        if isinstance(directories, dict):
+            for path in sorted(directories):
+                kwargs = directories[path] or {}
+                if root is not None:
+                    path = os.path.join(root, path)
+                self.directories[path] = Directory(path, **kwargs)
+        else:
+            for d in directories:
+                self.directories[d.path] = d
+
+    def __getitem__(self, path):
+        """
+        :param path: str, path as specified in the constructor
+        :return: instance of Directory
+        """
+        if path in self.directories:
+            return self.directories[path]
+        return self.directories[os.path.join(self.root or "", path)]
+
+    def __iter__(self):
+        return iter(self.directories.values())
+
+    def __len__(self):
+        return len(self.directories)
+
+    def __enter__(self):
+        self.initialize()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.clean()
+
+    def _mount_tmpfs(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+            self._created_root = True
+        options = ["-o", "size=%s" % self.tmpfs_size] if self.tmpfs_size else []
+        logger.info("mounting tmpfs on %s", self.root)
+        run_cmd(["mount", "-t", "tmpfs"] + options + ["tmpfs", self.root])
+        self._mounted = True
+
+    def initialize(self):
+        """
+        create all the directories and configure them
+
+        :return: None
+        """
+        if self.tmpfs and not self._mounted:
+            self._mount_tmpfs()
+        pending = [d for d in self.directories.values() if not d._initialized]
+        # parents first
+        pending.sort(key=lambda d: os.path.normpath(d.path).count(os.sep))
+        logger.info("initializing %d directories", len(pending))
+        for d in pending:
+            if not os.path.exists(d.path):
+                if d.mode is not None:
+                    os.makedirs(d.path, mode=d.mode)
+                else:
+                    os.makedirs(d.path)
+            d._set_mode()
+
+        acl_groups = collections.OrderedDict()
+        selinux_groups = collections.OrderedDict()
+        for d in pending:
+            if d.facl_rules:
+                acl_groups.setdefault(tuple(d.facl_rules), []).append(d.path)
+            labels = (d.selinux_context, d.selinux_user, d.selinux_role, d.selinux_type,
+                      d.selinux_range)
+            if any(labels):
+                selinux_groups.setdefault(labels, []).append(d.path)
+        for rules, paths in acl_groups.items():
+            _add_facl_rules(paths, list(rules))
+        for labels, paths in selinux_groups.items():
+            _set_selinux_context(paths, *labels)
+
+        for d in pending:
+            d._set_ownership()
+            d._initialized = True
+        logger.info("initialized")
+
+    def _top_level(self):
+        """ initialized directories which are not nested in other directories of the set """
+        paths = set(os.path.normpath(d.path) for d in self.directories.values()
+                    if d._initialized)
+
+        def nested(path):
+            parent = os.path.dirname(path)
+            while parent != path:
+                if parent in paths:
+                    return True
+                path, parent = parent, os.path.dirname(parent)
+            return False
+        return [d for d in self.directories.values()
+                if d._initialized and not nested(os.path.normpath(d.path))]
+
+    def clean(self, background=False):
+        """
+        remove all the directories, in parallel
+
+        :param background: bool, don't wait for the directories to be removed, see
+                Directory.clean
+        :return: None
+        """
+        if self._mounted:
+            logger.info("unmounting tmpfs from %s", self.root)
+            run_cmd(["umount", self.root])
+            self._mounted = False
+            if self._created_root:
+                os.rmdir(self.root)
+                self._created_root = False
+        else:
+            top = self._top_level()
+            if top:
+                with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+                    for future in [executor.submit(d.clean, background) for d in top]:
+                        future.result()
+        for d in self.directories.values():
+            d._initialized = False
+
+    def __repr__(self):
+        return "DirectorySet(root=%s, directories=%d)" % (self.root, len(self.directories))
+
+
+def _entries(path):
+    """ list of (path, is_dir) of directory entries, symlinks are not followed """
+    if hasattr(os, "scandir"):
+        return [(e.path, e.is_dir(follow_symlinks=False)) for e in os.scandir(path)]
+    # python 2
+    result = []
+    for name in os.listdir(path):
+        p = os.path.join(path, name)
+        result.append((p, os.path.isdir(p) and not os.path.islink(p)))
+    return result
+
+
+def _is_denied(ex):
+    return getattr(ex, "errno", None) in (errno.EACCES, errno.EPERM)
+
+
+class _Removal(object):
+    """ state of removal of a single tree """
+
+    def __init__(self, path):
+        self.path = path
+        self.future = Future()
+        self.pending = 0
+        self.directories = []
+        self.denied = []
+        self.error = None
+        self.lock = threading.Lock()
+
+
+class TreeRemover(object):
+    """
+    Remove large directory trees fast: the tree is renamed aside right away and its
+    subdirectories are removed concurrently by a pool of threads. Files the current user
+    is not permitted to remove (e.g. created by a container running as a different user)
+    are removed by a helper container.
+    """
+
+    def __init__(self, parallelism=8, cleanup_image=CLEANUP_IMAGE):
+        """
+        :param parallelism: int, number of threads removing files
+        :param cleanup_image: str, image of the helper container, None means that
+                permission errors are not handled
+        """
+        self.parallelism = parallelism
+        self.cleanup_image = cleanup_image
+        self._executor = ThreadPoolExecutor(max_workers=parallelism)
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def remove(self, path):
+        """
+        rename the directory aside and remove it in background
+
+        :param path: str, directory to remove
+        :return: instance of concurrent.futures.Future, its result is None once the
+                directory is removed
+        """
+        path = os.path.abspath(path)
+        trash = os.path.join(os.path.dirname(path), "%s%s-%s" % (
+            TRASH_PREFIX, os.path.basename(path), random_str()))
+        os.rename(path, trash)
+        logger.debug("removing %s as %s", path, trash)
+        removal = _Removal(trash)
+        with self._lock:
+            self._futures.add(removal.future)
+        removal.future.add_done_callback(self._removed)
+        self._schedule(removal, trash)
+        return removal.future
+
+    def _removed(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        if future.exception() is not None:
+            logger.warning("removal of a directory failed: %r", future.exception())
+
+    def wait(self):
+        """
+        wait until all directories removed in background are gone
+
+        :return: None
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for f in futures:
+            f.exception()
+
+    def _schedule(self, removal, directory):
+        with removal.lock:
+            removal.pending += 1
+            removal.directories.append(directory)
+        self._executor.submit(self._remove_directory, removal, directory)
+
+    def _remove_directory(self, removal, directory):
+        try:
+            for path, is_dir in _entries(directory):
+                if is_dir:
+                    self._schedule(removal, path)
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError as ex:
+                    if not _is_denied(ex):
+                        raise
+                    removal.denied.append(path)
+        except OSError as ex:
+            if _is_denied(ex):
+                removal.denied.append(directory)
+            else:
+                removal.error = removal.error or ex
+        with removal.lock:
+            removal.pending -= 1
+            finished = removal.pending == 0
+        if finished:
+            try:
+                self._finish(removal)
+            except Exception as ex:
+                removal.future.set_exception(ex)
+            else:
+                removal.future.set_result(None)
+
+    def _finish(self, removal):
+        if removal.error is not None:
+            raise removal.error
+        if removal.denied:
+            logger.info("%d entries in %s can't be removed by current user",
+                        len(removal.denied), removal.path)
+            self._remove_in_container(removal.path)
+        # deepest directories first
+        for directory in sorted(removal.directories, key=len, reverse=True):
+            try:
+                os.rmdir(directory)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+
+    def _remove_in_container(self, path):
+        if not self.cleanup_image:
+            raise ConuException("Permission denied while removing %s" % path)
+        run_cmd(["docker", "run", "--rm", "--security-opt", "label=disable",
+                 "-v", "%s:/conu-trash" % path, self.cleanup_image,
+                 "find", "/conu-trash", "-mindepth", "1", "-delete"])
+
+
+_tree_remover = None
+_tree_remover_lock = threading.Lock()
+
+
+def get_tree_remover():
+    """
+    provide process-wide TreeRemover used by Directory.clean
+
+    :return: instance of TreeRemover
+    """
+    global _tree_remover
+    with _tree_remover_lock:
+        if _tree_remover is None:
+            _tree_remover = TreeRemover()
+        return _tree_remover
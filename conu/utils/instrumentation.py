@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of calls conu makes to container engines: every call of the docker API
+client and every command executed by `run_cmd` is timed and reported to registered hooks.
+Nothing is measured while no hook is registered.
+
+::
+
+    histogram = HistogramHook()
+    register_hook(histogram)
+    run_the_tests()
+    for row in histogram.report():
+        print(row)
+"""
+from __future__ import print_function, division, unicode_literals
+
+import atexit
+import bisect
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+import six
+
+from conu.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# kinds of instrumented calls
+DOCKER_API = "docker"
+COMMAND = "cmd"
+
+_hooks = []
+_hooks_lock = threading.Lock()
+# serializing decoded responses to get their size can take longer than the call itself
+_measure_decoded = False
+
+
+class CallEvent(collections.namedtuple("CallEvent", [
+        "kind", "name", "start", "duration", "request_size", "response_size", "error"])):
+    """
+    A single instrumented call: kind (conu.utils.instrumentation.DOCKER_API or COMMAND),
+    name (method of the API client or the executable), start (seconds since epoch),
+    duration (seconds), request_size and response_size (bytes, None when unknown) and
+    error (the raised exception or None).
+    """
+    __slots__ = ()
+
+
+def register_hook(hook):
+    """
+    start reporting calls to the hook
+
+    :param hook: callable which accepts an instance of CallEvent
+    :return: None
+    """
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def unregister_hook(hook):
+    """
+    stop reporting calls to the hook; hooks which buffer events (they have a flush method,
+    e.g. SpanHook) are flushed
+
+    :param hook: callable registered by register_hook
+    :return: None
+    """
+    with _hooks_lock:
+        if hook not in _hooks:
+            return
+        _hooks.remove(hook)
+    _flush(hook)
+
+
+def _flush(hook):
+    flush = getattr(hook, "flush", None)
+    if flush is None:
+        return
+    try:
+        flush()
+    except Exception as ex:
+        logger.warning("flushing instrumentation hook %s failed: %r", hook, ex)
+
+
+@atexit.register
+def _flush_hooks():
+    """ don't lose events buffered by hooks which are still registered at exit """
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        _flush(hook)
+
+
+def measure_decoded_payloads(enabled=True):
+    """
+    report sizes of decoded docker API requests and responses (dicts and lists, e.g.
+    output of inspect calls) as the length of their JSON serialization; it's off by
+    default since the serialization can take longer than the call itself
+
+    :param enabled: bool
+    :return: None
+    """
+    global _measure_decoded
+    _measure_decoded = enabled
+
+
+def _payload_size(payload):
+    if isinstance(payload, (bytes, six.text_type)):
+        return len(payload)
+    if _measure_decoded and isinstance(payload, (dict, list, tuple)):
+        try:
+            return len(json.dumps(payload, default=str))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def emit(event):
+    """
+    report the event to all registered hooks, a failing hook doesn't affect the others
+
+    :param event: instance of CallEvent
+    :return: None
+    """
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception as ex:
+            logger.warning("instrumentation hook %s failed: %r", hook, ex)
+
+
+@contextlib.contextmanager
+def measure(kind, name, request_size=None):
+    """
+    context manager which reports the block as a call to the hooks; it provides a dict
+    where the block can store "response_size", or "response" which is sized once the
+    duration is measured
+
+    :param kind: str, e.g. conu.utils.instrumentation.COMMAND
+    :param name: str
+    :param request_size: int, size of the request in bytes
+    :return: dict
+    """
+    info = {}
+    if not _hooks:
+        yield info
+        return
+    start, started = time.time(), monotonic()
+    error = None
+    try:
+        yield info
+    except Exception as ex:
+        error = ex
+        raise
+    finally:
+        duration = monotonic() - started
+        response_size = info.get("response_size")
+        if "response" in info:
+            response_size = _payload_size(info["response"])
+        emit(CallEvent(kind, name, start, duration, request_size, response_size, error))
+
+
+class InstrumentedClient(object):
+    """
+    Proxy of docker API client which reports every method call to the hooks. Calls which
+    return streams are measured until the stream is returned, not until it's consumed.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: instance of docker.APIClient
+        """
+        self.wrapped_client = client
+
+    def __repr__(self):
+        return "InstrumentedClient(%r)" % (self.wrapped_client, )
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped_client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            if not _hooks:
+                return attr(*args, **kwargs)
+            request_size = None
+            for arg in list(args) + list(kwargs.values()):
+                size = _payload_size(arg)
+                if size and size > (request_size or 0):
+                    request_size = size
+            with measure(DOCKER_API, name, request_size=request_size) as info:
+                result = attr(*args, **kwargs)
+                info["response"] = result
+            return result
+        return wrapper
+
+
+def unwrap_client(client):
+    """
+    provide the client wrapped by InstrumentedClient
+
+    :param client: instance of InstrumentedClient or a docker API client
+    :return: docker API client
+    """
+    return getattr(client, "wrapped_client", client)
+
+
+class LoggingHook(object):
+    """
+    Log every call.
+    """
+
+    def __init__(self, log=None, level=logging.DEBUG):
+        """
+        :param log: instance of logging.Logger, defaults to logger of this module
+        :param level: int, logging level
+        """
+        self.log = log or logger
+        self.level = level
+
+    def __call__(self, event):
+        self.log.log(self.level, "%s %s took %.4f s%s", event.kind, event.name, event.duration,
+                     " and failed: %r" % (event.error, ) if event.error else "")
+
+
+# upper bounds of histogram buckets in seconds: 100 µs to ~100 s, 4 buckets per decade
+BUCKETS = [1e-4 * 10 ** (i / 4.0) for i in range(25)]
+
+
+class _Histogram(object):
+    __slots__ = ("count", "errors", "total", "max", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = self.errors = self.bytes = 0
+        self.total = self.max = 0.0
+        # the last bucket collects values larger than BUCKETS[-1]
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, event):
+        self.count += 1
+        self.total += event.duration
+        self.max = max(self.max, event.duration)
+        self.bytes += (event.request_size or 0) + (event.response_size or 0)
+        if event.error is not None:
+            self.errors += 1
+        self.buckets[bisect.bisect_left(BUCKETS, event.duration)] += 1
+
+    def percentile(self, p):
+        """ upper bound of the bucket containing the percentile """
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+
+HistogramRow = collections.namedtuple("HistogramRow", [
+    "kind", "name", "count", "errors", "total", "mean", "p50", "p99", "max", "bytes"])
+
+
+class HistogramHook(object):
+    """
+    Aggregate calls in memory: counts, errors, transferred bytes and a histogram of
+    durations per kind and name of the call. Percentiles are approximated by upper bounds
+    of histogram buckets (4 buckets per decade).
+    """
+
+    def __init__(self):
+        self._histograms = collections.defaultdict(_Histogram)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._histograms[(event.kind, event.name)].add(event)
+
+    def reset(self):
+        """
+        forget all recorded calls
+
+        :return: None
+        """
+        with self._lock:
+            self._histograms.clear()
+
+    def report(self):
+        """
+        statistics of recorded calls, those which took the most time in total first
+
+        :return: list of HistogramRow
+        """
+        with self._lock:
+            rows = [HistogramRow(kind, name, h.count, h.errors, h.total, h.total / h.count,
+                                 h.percentile(50), h.percentile(99), h.max, h.bytes)
+                    for (kind, name), h in self._histograms.items()]
+        return sorted(rows, key=lambda r: r.total, reverse=True)
+
+
+class InMemorySpanExporter(object):
+    """
+    Collector stand-in which keeps exported spans in memory.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def __call__(self, spans):
+        self.spans.extend(spans)
+
+
+class OTLPHttpSpanExporter(object):
+    """
+    Send spans to an OpenTelemetry collector using OTLP/HTTP with JSON encoding.
+    """
+
+    def __init__(self, endpoint="http://localhost:4318/v1/traces", service_name="conu",
+                 timeout=5):
+        """
+        :param endpoint: str, URL of the collector's traces endpoint
+        :param service_name: str, value of service.name resource attribute
+        :param timeout: int or float, seconds
+        """
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def __call__(self, spans):
+        import requests  # only this exporter needs it
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name",
+                                         "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "conu"}, "spans": spans}],
+        }]}
+        response = requests.post(self.endpoint, data=json.dumps(body),
+                                 headers={"Content-Type": "application/json"},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+
+
+def _random_hex(size):
+    return "".join("%02x" % six.indexbytes(os.urandom(size), i) for i in range(size))
+
+
+class SpanHook(object):
+    """
+    Convert calls to spans in OpenTelemetry (OTLP JSON) format and pass them in batches to
+    an exporter: a callable which accepts a list of spans, e.g. OTLPHttpSpanExporter or
+    InMemorySpanExporter. All spans share a trace ID unless a new trace is started.
+    """
+
+    def __init__(self, exporter, batch_size=64):
+        """
+        :param exporter: callable which accepts a list of dicts
+        :param batch_size: int, number of spans exported at once
+        """
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.trace_id = _random_hex(16)
+        self._batch = []
+        self._lock = threading.Lock()
+
+    def start_trace(self):
+        """
+        use a new trace ID for following spans, e.g. one per test
+
+        :return: str, the trace ID
+        """
+        self.flush()
+        self.trace_id = _random_hex(16)
+        return self.trace_id
+
+    def __call__(self, event):
+        attributes = [{"key": "conu.kind", "value": {"stringValue": event.kind}}]
+        for key, size in (("conu.request_size", event.request_size),
+                          ("conu.response_size", event.response_size)):
+            if size is not None:
+                attributes.append({"key": key, "value": {"intValue": str(size)}})
+        status = {"code": 1}  # OK
+        if event.error is not None:
+            status = {"code": 2, "message": repr(event.error)}  # ERROR
+        span = {
+            "traceId": self.trace_id,
+            "spanId": _random_hex(8),
+            "name": "%s %s" % (event.kind, event.name),
+            "kind": 3,  # client
+            "startTimeUnixNano": str(int(event.start * 1e9)),
+            "endTimeUnixNano": str(int((event.start + event.duration) * 1e9)),
+            "attributes": attributes,
+            "status": status,
+        }
+        with self._lock:
+            self._batch.append(span)
+            full = len(self._batch) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        export spans which were not exported yet
+
+        :return: None
+        """
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self.exporter(batch)
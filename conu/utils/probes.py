@@ -1,12 +1,272 @@
+import collections
+import heapq
+import itertools
+import random
+import threading
 import time
 import logging
 
 from multiprocessing import Process, Queue
 
+from six.moves import queue
+from six.moves.queue import Empty
+
 from conu.exceptions import ConuException
+from conu.utils import monotonic
 
 logger = logging.getLogger(__name__)
 
+# seconds a probe tries when timeout is not specified
+DEFAULT_TIMEOUT = 1
+# the final attempt of a probe is started when this multiple of the duration of the
+# previous attempt remains until timeout
+FINAL_ATTEMPT_MARGIN = 1.5
+
+
+class ProbeAttempt(collections.namedtuple("ProbeAttempt", [
+        "number", "start", "startup", "duration", "result", "exception"])):
+    """
+    A single call of the probed function: number (starting with 1), start (seconds since
+    epoch when the function was called), startup (seconds between scheduling the call and
+    the call itself, e.g. starting the process which calls the function), duration (seconds
+    the function took), result (its return value, False when it raised an expected
+    exception) and exception (repr of the raised exception or None).
+    """
+    __slots__ = ()
+
+
+class ProbeReport(object):
+    """
+    Timings of a single Probe run: every attempt and the total time.
+    """
+
+    def __init__(self, name, start=None):
+        """
+        :param name: str, name of the probed function
+        :param start: float, seconds since epoch, defaults to now
+        """
+        self.name = name
+        self.start = time.time() if start is None else start
+        self._started = monotonic()
+        self.attempts = []
+        self.duration = None
+        self.success = None
+        self.error = None
+
+    def add_attempt(self, start, startup, duration, result, exception=None):
+        """
+        :return: instance of ProbeAttempt
+        """
+        attempt = ProbeAttempt(len(self.attempts) + 1, start, startup, duration, result,
+                               exception)
+        self.attempts.append(attempt)
+        return attempt
+
+    def finish(self, success, error=None):
+        """
+        record the end of the run
+
+        :param success: bool, did the probed function return the expected value?
+        :param error: str, repr of the exception which ended the probe
+        :return: None
+        """
+        self.duration = monotonic() - self._started
+        self.success = success
+        self.error = error
+
+    @property
+    def function_time(self):
+        """ seconds spent in the probed function """
+        return sum(a.duration for a in self.attempts)
+
+    @property
+    def startup_time(self):
+        """ seconds between scheduling calls of the function and the calls """
+        return sum(a.startup for a in self.attempts)
+
+    @property
+    def wait_time(self):
+        """ seconds spent neither starting processes nor in the function, mostly pauses """
+        if self.duration is None:
+            return None
+        return max(self.duration - self.function_time - self.startup_time, 0.0)
+
+    def __repr__(self):
+        return "ProbeReport(name=%s, attempts=%d, duration=%s, success=%s)" % (
+            self.name, len(self.attempts), self.duration, self.success)
+
+
+class ProbeRegistry(object):
+    """
+    Reports of finished probe runs, e.g. to find the slowest probes of a test session:
+
+    ::
+
+        for report in get_probe_registry().slowest(5):
+            print(report.name, report.duration, len(report.attempts))
+    """
+
+    def __init__(self, max_reports=10000):
+        """
+        :param max_reports: int, number of the most recent reports which are kept
+        """
+        self._reports = collections.deque(maxlen=max_reports)
+        self._lock = threading.Lock()
+
+    def record(self, report):
+        """
+        :param report: instance of ProbeReport
+        :return: None
+        """
+        with self._lock:
+            self._reports.append(report)
+
+    def reports(self):
+        """
+        :return: list of ProbeReport, the oldest first
+        """
+        with self._lock:
+            return list(self._reports)
+
+    def slowest(self, count=10):
+        """
+        :param count: int, number of reports to provide
+        :return: list of ProbeReport, the slowest first
+        """
+        return sorted(self.reports(), key=lambda r: r.duration, reverse=True)[:count]
+
+    def summary(self):
+        """
+        aggregate reports per probed function
+
+        :return: dict, name -> dict with keys runs, failures, attempts, total and max
+                (seconds)
+        """
+        result = {}
+        for report in self.reports():
+            s = result.setdefault(report.name, {"runs": 0, "failures": 0, "attempts": 0,
+                                                "total": 0.0, "max": 0.0})
+            s["runs"] += 1
+            s["failures"] += 0 if report.success else 1
+            s["attempts"] += len(report.attempts)
+            s["total"] += report.duration
+            s["max"] = max(s["max"], report.duration)
+        return result
+
+    def clear(self):
+        """
+        forget all reports
+
+        :return: None
+        """
+        with self._lock:
+            self._reports.clear()
+
+
+_registry = ProbeRegistry()
+
+
+def get_probe_registry():
+    """
+    provide process-wide ProbeRegistry where all finished probe runs are recorded
+
+    :return: instance of ProbeRegistry
+    """
+    return _registry
+
+
+class Schedule(object):
+    """
+    Delays between attempts of a Probe. The delay is randomized by +-jitter (a fraction of
+    the delay), so that many probes started at once don't hit the service at the same
+    moments.
+    """
+
+    def __init__(self, jitter=0.0):
+        """
+        :param jitter: float, 0.0 to 1.0, e.g. 0.2 means that the delay is randomly
+                shortened or prolonged by up to 20 %
+        """
+        self.jitter = jitter
+
+    def _delay(self, attempt):
+        raise NotImplementedError()
+
+    def delay(self, attempt):
+        """
+        :param attempt: int, number of the attempt which just failed, starting with 1
+        :return: float, seconds to wait before the next attempt
+        """
+        d = self._delay(attempt)
+        if self.jitter:
+            d *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(d, 0.0)
+
+
+class FixedPause(Schedule):
+    """
+    The same delay between all attempts.
+    """
+
+    def __init__(self, pause=1, jitter=0.0):
+        """
+        :param pause: int or float, seconds
+        :param jitter: float, see Schedule
+        """
+        super(FixedPause, self).__init__(jitter)
+        self.pause = pause
+
+    def _delay(self, attempt):
+        return self.pause
+
+
+class ExponentialBackoff(Schedule):
+    """
+    Delay growing exponentially with every attempt up to a cap: initial, initial * factor,
+    initial * factor ** 2, ...
+    """
+
+    def __init__(self, initial=0.1, factor=2.0, cap=5.0, jitter=0.2):
+        """
+        :param initial: float, seconds to wait after the first attempt
+        :param factor: float, multiplier of the delay
+        :param cap: float, maximum delay in seconds, even with jitter
+        :param jitter: float, see Schedule
+        """
+        super(ExponentialBackoff, self).__init__(jitter)
+        self.initial = initial
+        self.factor = factor
+        self.cap = cap
+
+    def _delay(self, attempt):
+        # limit the exponent so that the computation doesn't overflow
+        return min(self.cap, self.initial * self.factor ** min(attempt - 1, 64))
+
+    def delay(self, attempt):
+        return min(super(ExponentialBackoff, self).delay(attempt), self.cap)
+
+
+class FastThenSlow(Schedule):
+    """
+    Short delays during first attempts, for services which start quickly, long delays
+    afterwards, so slow services are not polled too often.
+    """
+
+    def __init__(self, fast=0.1, slow=1.0, fast_attempts=10, jitter=0.0):
+        """
+        :param fast: float, seconds between the first fast_attempts attempts
+        :param slow: float, seconds between following attempts
+        :param fast_attempts: int, number of attempts with the short delay
+        :param jitter: float, see Schedule
+        """
+        super(FastThenSlow, self).__init__(jitter)
+        self.fast = fast
+        self.slow = slow
+        self.fast_attempts = fast_attempts
+
+    def _delay(self, attempt):
+        return self.fast if attempt < self.fast_attempts else self.slow
+
 
 class Probe(object):
     """
@@ -15,129 +275,556 @@ class Probe(object):
 
     """
     def __init__(self,
-                 timeout=1,
+                 timeout=None,
                  pause=1,
                  count=-1,
                  expected_exceptions=(),
                  expected_retval=True,
                  fnc=bool,
+                 schedule=None,
                  **kwargs):
         """
         :param timeout:              Number of seconds spent on trying. Set timeout to -1 for infinite run.
+                                         Defaults to DEFAULT_TIMEOUT, or to the deadline of ProbeGroup.
         :param pause:                Number of seconds waited between multiple function result checks
         :param count:                Maximum number of tries, defaults to infinite, represented by -1
         :param expected_exceptions:  When one of expected_exception is raised, probe ignores it and tries to run function again.
                                          To ignore multiple exceptions use parenthesized tuple.
         :param expected_retval:      When expected_retval is recieved, probe ends successfully
         :param fnc:                  Function which run is checked by probe
+        :param schedule:             Instance of Schedule providing delays between function result checks,
+                                         e.g. ExponentialBackoff; overrides pause. The last check is moved
+                                         earlier if it would not finish before timeout otherwise.
         """
-        self.timeout = timeout
+        # was the timeout set explicitly? ProbeGroup applies its deadline otherwise
+        self.timeout_set = timeout is not None
+        self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
         self.pause = pause
+        self.schedule = schedule or FixedPause(pause)
         self.count = count
         self.expected_exceptions = expected_exceptions
         self.fnc = fnc
         self.kwargs = kwargs
         self.expected_retval = expected_retval
-        self.process = None
-        self.queue = None
+        # state of the run in background, see ProbeScheduler
+        self._background = None
+        # ProbeReport of the last run
+        self.report = None
 
     def run(self):
-        if self.process and self.process.is_alive():
+        """
+        call the function until it returns the expected value; timings are stored in
+        `report` attribute and the probe registry
+
+        :return: True
+        """
+        if self.is_alive():
             raise RuntimeError("One instance of Probe can only be probing once at any given time")
         return self._run()
 
     def run_in_background(self):
-        if self.process and self.process.is_alive():
+        """
+        start probing in background using the shared ProbeScheduler, the function is called
+        in a thread of the scheduler; use join() to wait for the result
+
+        :return: None
+        """
+        if self.is_alive():
             raise RuntimeError("One instance of Probe can only be probing once at any given time")
-        self.queue = Queue()
-        self.process = Process(target=self._run)
-        return self.process.start()
+        self._background = get_probe_scheduler().submit(self)
 
     def terminate(self):
-        if not self.process:
+        """
+        stop probing in background; a call of the function which is in progress is not
+        interrupted, its result is ignored
+
+        :return: None
+        """
+        if not self._background:
             return
-        self.process.terminate()
+        self._background.finish(terminated=True)
 
     def join(self):
-        if not self.process:
+        """
+        wait until probing in background ends, raise the exception which ended it, e.g.
+        ProbeTimeout
+
+        :return: None
+        """
+        run = self._background
+        if not run:
             return
-        self.process.join()
-        if self.queue and not self.queue.empty():
-            result = self.queue.get()
-            if isinstance(result, Exception):
-                raise result
+        run.done.wait()
+        if self.report is not run.report:
+            self.report = run.report
+            get_probe_registry().record(run.report)
+        if run.error is not None:
+            raise run.error
 
     def is_alive(self):
-        if not self.process:
-            return False
-        return self.process.is_alive()
-
-    def _wrapper(self, q, start):
         """
-        _wrapper checks return status of Probe.fnc and provides the result for process managing
+        is the probe running in background?
 
-        :param q:     Queue for function results
-        :param start: Time of function run (used for logging)
-        :return:      Return value or Exception
+        :return: bool
         """
+        if not self._background:
+            return False
+        return not self._background.done.is_set()
+
+    def _fnc_name(self):
         try:
-            func_name = self.fnc.__name__
+            return self.fnc.__name__
         except AttributeError:
-            func_name = str(self.fnc)
+            return str(self.fnc)
+
+    def _call(self, start):
+        """
+        call the function once
+
+        :param start: Monotonic time of the probe start (used for logging)
+        :return:      tuple (return value or Exception, repr of expected exception, time of
+                      the call, monotonic time of the call, duration)
+        """
         logger.debug("Running \"%s\" with parameters: \"%s\":\t%s/%s"
-                     % (func_name, str(self.kwargs), round(time.time() - start), self.timeout))
+                     % (self._fnc_name(), str(self.kwargs), round(monotonic() - start),
+                        self.timeout))
+        called, called_monotonic = time.time(), monotonic()
+        exception = None
         try:
-            q.put(self.fnc(**self.kwargs))
-        except self.expected_exceptions:
-            q.put(False)
+            result = self.fnc(**self.kwargs)
+        except self.expected_exceptions as e:
+            result, exception = False, repr(e)
         except Exception as e:
-            q.put(e)
+            result, exception = e, repr(e)
+        return result, exception, called, called_monotonic, monotonic() - called_monotonic
+
+    def _wrapper(self, q, start):
+        """
+        _wrapper checks return status of Probe.fnc and provides the result for process managing
+
+        :param q:     Queue for function results
+        :param start: Monotonic time of the probe start (used for logging)
+        :return:      None, result of _call is put in the queue
+        """
+        q.put(self._call(start))
+
+    def _next_delay(self, tries, deadline, cost):
+        """
+        delay before the next attempt; the final attempt is started early enough to finish
+        before the deadline
+
+        :param tries: int, number of attempts made
+        :param deadline: float, monotonic time, None means no deadline
+        :param cost: float, seconds the last attempt took including its startup
+        :return: float, or None when the deadline was reached
+        """
+        delay = self.schedule.delay(tries)
+        if deadline is not None:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            delay = max(min(delay, remaining - cost * FINAL_ATTEMPT_MARGIN), 0.0)
+        return delay
+
+    def _start_attempt(self, fnc_queue, start):
+        p = Process(target=self._wrapper, args=(fnc_queue, start))
+        spawned = monotonic()
+        p.start()
+        return p, spawned
+
+    def _wait_for_attempt(self, p, fnc_queue, deadline):
+        """
+        wait for result of the attempt running in process p
+
+        :return: tuple provided by _wrapper, or None if the deadline was reached
+        """
+        while True:
+            wait = 1.0
+            if deadline is not None:
+                wait = min(wait, deadline - monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                return fnc_queue.get(timeout=wait)
+            except Empty:
+                if p.is_alive():
+                    continue
+            # the process may have ended right after the result was put in the queue
+            try:
+                return fnc_queue.get(timeout=0.1)
+            except Empty:
+                error = "process of the attempt ended with code %s" % p.exitcode
+                return False, error, time.time(), monotonic(), 0.0
+
+    def _finish(self, report, error=None):
+        report.finish(error is None, repr(error) if error is not None else None)
+        self.report = report
+        get_probe_registry().record(report)
+        if error is not None:
+            raise error
 
     def _run(self):
-        start = time.time()
+        start = monotonic()
+        deadline = None if self.timeout == -1 else start + self.timeout
+        report = ProbeReport(self._fnc_name())
         fnc_queue = Queue()
         logger.debug("starting probe")
-        p = Process(target=self._wrapper, args=(fnc_queue, start))
-        p.start()
-        logger.debug("first process started: pid=%s", p.pid)
-        tries = 1
-        while (tries <= self.count or self.count == -1) and \
-                (self.timeout == -1 or time.time() - start <= self.timeout):
-            if p.is_alive():
-                logger.debug("pausing for %s before next try", self.pause)
-                time.sleep(self.pause)
-            elif not fnc_queue.empty():
-                result = fnc_queue.get()
-                if isinstance(result, Exception):
-                    # TODO: use result's traceback
-                    if self.queue:
-                        self.queue.put(result)
-                    else:
-                        raise result
-                elif not (result == self.expected_retval):
-                    logger.info("waiting for process to end...")
-                    p.join()
-                    logger.debug("process ended, about to start another one")
-                    p = Process(target=self._wrapper, args=(fnc_queue, start))
-                    p.start()
-                    tries += 1
-                    logger.debug("attempt no. %s started, pid: %s", tries, p.pid)
-                else:
-                    return True
-            else:
+        tries = 0
+        timed_out = False
+        while self.count == -1 or tries < self.count:
+            tries += 1
+            p, spawned = self._start_attempt(fnc_queue, start)
+            logger.debug("attempt no. %s started, pid: %s", tries, p.pid)
+            outcome = self._wait_for_attempt(p, fnc_queue, deadline)
+            if outcome is None:
+                p.terminate()
+                p.join()
+                timed_out = True
+                break
+            p.join()
+            result, exception, called, called_monotonic, duration = outcome
+            startup = max(called_monotonic - spawned, 0.0)
+            report.add_attempt(called, startup, duration,
+                               None if isinstance(result, Exception) else result, exception)
+            if isinstance(result, Exception):
+                # TODO: use result's traceback
+                return self._finish(report, result)
+            if result == self.expected_retval:
+                self._finish(report)
                 return True
+            if self.count != -1 and tries >= self.count:
+                break
+            delay = self._next_delay(tries, deadline, startup + duration)
+            if delay is None:
+                timed_out = True
+                break
+            logger.debug("pausing for %s before next try", delay)
+            time.sleep(delay)
+        if timed_out:
+            e = ProbeTimeout("Timeout exceeded.")
         else:
-            p.terminate()
-            p.join()
-            if -1 < self.count < tries:
-                e = CountExceeded
+            e = CountExceeded("Maximum number of tries exceeded.")
+        logger.warning("probe is unsuccessful: %s", e)
+        self._finish(report, e)
+
+
+class _BackgroundRun(object):
+    """ state of a probe running in background """
+
+    def __init__(self, probe):
+        self.probe = probe
+        self.report = ProbeReport(probe._fnc_name())
+        self.start = monotonic()
+        self.deadline = None if probe.timeout == -1 else self.start + probe.timeout
+        self.tries = 0
+        self.error = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def finish(self, error=None, terminated=False):
+        """
+        end the run unless it has ended already
+
+        :return: bool, True if the run was ended by this call
+        """
+        with self.lock:
+            if self.done.is_set():
+                return False
+            if terminated:
+                self.report.finish(False, "terminated")
+            else:
+                self.report.finish(error is None, repr(error) if error is not None else None)
+                if error is not None:
+                    logger.warning("probe is unsuccessful: %s", error)
+            self.error = error
+            self.done.set()
+        return True
+
+
+class ProbeScheduler(object):
+    """
+    Runs probes in background: a single thread keeps timers of all the probes (when their
+    next attempt is due and when they time out) in a heap and sleeps until the nearest
+    one; attempts are executed by a pool of worker threads which grows up to max_workers.
+    Thousands of probes can wait at once with no cost; only attempts in progress occupy
+    threads.
+    """
+
+    def __init__(self, max_workers=32):
+        """
+        :param max_workers: int, maximum number of attempts in progress at the same time
+        """
+        self.max_workers = max_workers
+        self._timers = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._work = queue.Queue()
+        self._workers = 0
+        self._idle = 0
+        self._backlog = 0
+
+    def submit(self, probe):
+        """
+        start probing in background
+
+        :param probe: instance of Probe
+        :return: state of the run: it provides `done` (threading.Event), `error` and `report`
+        """
+        run = _BackgroundRun(probe)
+        if probe.count == 0:
+            run.finish(CountExceeded("Maximum number of tries exceeded."))
+            return run
+        self._call_later(0, self._dispatch, run, monotonic())
+        if run.deadline is not None:
+            self._call_later(probe.timeout, self._expire, run)
+        return run
+
+    def _call_later(self, delay, fnc, *args):
+        with self._cond:
+            heapq.heappush(self._timers, (monotonic() + delay, next(self._sequence), fnc, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="conu-probe-scheduler")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = monotonic()
+                    if self._timers and self._timers[0][0] <= now:
+                        break
+                    self._cond.wait(self._timers[0][0] - now if self._timers else None)
+                _, _, fnc, args = heapq.heappop(self._timers)
+            try:
+                fnc(*args)
+            except Exception as ex:
+                logger.error("probe scheduler callback failed: %r", ex)
+
+    def _expire(self, run):
+        run.finish(ProbeTimeout("Timeout exceeded."))
+
+    def _dispatch(self, run, scheduled):
+        if run.done.is_set():
+            return
+        # every queued attempt is reserved for an idle worker, a new worker, or the first
+        # worker which finishes its attempt
+        with self._cond:
+            start_worker = False
+            if self._idle:
+                self._idle -= 1
+            elif self._workers < self.max_workers:
+                self._workers += 1
+                start_worker = True
             else:
-                e = ProbeTimeout("Timeout exceeded.")
-            logger.warning("probe is unsuccessful: %s", e)
-            if self.queue:
-                self.queue.put(e)
+                self._backlog += 1
+        self._work.put((run, scheduled))
+        if start_worker:
+            t = threading.Thread(target=self._worker, name="conu-probe-worker")
+            t.daemon = True
+            t.start()
+
+    def _worker(self):
+        while True:
+            run, scheduled = self._work.get()
+            try:
+                self._attempt(run, scheduled)
+            except Exception as ex:
+                run.finish(ex)
+            with self._cond:
+                if self._backlog:
+                    self._backlog -= 1
+                else:
+                    self._idle += 1
+
+    def _attempt(self, run, scheduled):
+        if run.done.is_set():
+            return
+        probe = run.probe
+        run.tries += 1
+        result, exception, called, called_monotonic, duration = probe._call(run.start)
+        if run.done.is_set():
+            # terminated or timed out in the meantime
+            return
+        startup = max(called_monotonic - scheduled, 0.0)
+        run.report.add_attempt(called, startup, duration,
+                               None if isinstance(result, Exception) else result, exception)
+        if isinstance(result, Exception):
+            run.finish(result)
+        elif result == probe.expected_retval:
+            run.finish()
+        elif probe.count != -1 and run.tries >= probe.count:
+            run.finish(CountExceeded("Maximum number of tries exceeded."))
+        else:
+            delay = probe._next_delay(run.tries, run.deadline, startup + duration)
+            if delay is None:
+                run.finish(ProbeTimeout("Timeout exceeded."))
             else:
-                raise e
+                self._call_later(delay, self._dispatch, run, monotonic() + delay)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_probe_scheduler():
+    """
+    provide process-wide ProbeScheduler used by Probe.run_in_background
+
+    :return: instance of ProbeScheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ProbeScheduler()
+        return _scheduler
+
+
+class ProbeGroup(object):
+    """
+    Several conditions checked under one shared deadline. Conditions are Probe instances,
+    their arguments (fnc, pause, count, expected_retval...) are respected. Probes without
+    an explicit timeout run until the deadline of the group, explicit timeouts still apply
+    but are shortened so that no probe runs past the deadline:
+
+    ::
+
+        ProbeGroup.all_of(
+            Probe(fnc=container.is_running),
+            Probe(fnc=functools.partial(container.is_port_open, 8080), pause=0.2),
+            timeout=30).run()
+
+    Conditions of all_of and any_of are evaluated concurrently and the group ends as soon
+    as the result is known: when any condition fails (all_of) or succeeds (any_of);
+    remaining probes are terminated. Conditions of a sequence are evaluated one after
+    another.
+    """
+
+    ALL_OF = "all_of"
+    ANY_OF = "any_of"
+    SEQUENCE = "sequence"
+
+    def __init__(self, mode, probes, timeout=-1, poll=0.05):
+        """
+        :param mode: str, ProbeGroup.ALL_OF, ProbeGroup.ANY_OF or ProbeGroup.SEQUENCE
+        :param probes: list of Probe instances
+        :param timeout: int or float, seconds for all the conditions, -1 means no deadline
+        :param poll: int or float, seconds between checks of concurrently running probes
+        """
+        if mode not in (self.ALL_OF, self.ANY_OF, self.SEQUENCE):
+            raise ConuException("unknown mode of probe group: %s" % mode)
+        if not probes:
+            raise ConuException("probe group needs at least one probe")
+        self.mode = mode
+        self.probes = list(probes)
+        self.timeout = timeout
+        self.poll = poll
+        # ProbeReport of every probe which finished in the last run
+        self.reports = []
+
+    @classmethod
+    def all_of(cls, *probes, **kwargs):
+        """
+        succeed when all the conditions are met
+
+        :param probes: Probe instances
+        :param kwargs: keyword arguments of ProbeGroup constructor, e.g. timeout
+        :return: instance of ProbeGroup
+        """
+        return cls(cls.ALL_OF, probes, **kwargs)
+
+    @classmethod
+    def any_of(cls, *probes, **kwargs):
+        """
+        succeed when any of the conditions is met
+
+        :param probes: Probe instances
+        :param kwargs: keyword arguments of ProbeGroup constructor, e.g. timeout
+        :return: instance of ProbeGroup
+        """
+        return cls(cls.ANY_OF, probes, **kwargs)
+
+    @classmethod
+    def sequence(cls, *probes, **kwargs):
+        """
+        succeed when the conditions are met one after another, in the given order
+
+        :param probes: Probe instances
+        :param kwargs: keyword arguments of ProbeGroup constructor, e.g. timeout
+        :return: instance of ProbeGroup
+        """
+        return cls(cls.SEQUENCE, probes, **kwargs)
+
+    def _bounded(self, probe, deadline):
+        """ copy of the probe which doesn't run past the deadline """
+        timeout = probe.timeout if probe.timeout_set else -1
+        if deadline is not None:
+            remaining = max(deadline - monotonic(), 0)
+            timeout = remaining if timeout == -1 else min(timeout, remaining)
+        return Probe(timeout=timeout, pause=probe.pause, count=probe.count,
+                     expected_exceptions=probe.expected_exceptions,
+                     expected_retval=probe.expected_retval, fnc=probe.fnc,
+                     schedule=probe.schedule, **probe.kwargs)
+
+    def _collect(self, probe):
+        if probe.report is not None:
+            self.reports.append(probe.report)
+
+    def run(self):
+        """
+        evaluate the conditions; raises ProbeTimeout when the deadline is exceeded or the
+        exception of the failed probe (all_of, sequence) or of the last failed probe
+        (any_of)
+
+        :return: True
+        """
+        self.reports = []
+        deadline = None if self.timeout == -1 else monotonic() + self.timeout
+        if self.mode == self.SEQUENCE:
+            for probe in self.probes:
+                bounded = self._bounded(probe, deadline)
+                try:
+                    bounded.run()
+                finally:
+                    self._collect(bounded)
+            return True
+
+        running = [self._bounded(probe, deadline) for probe in self.probes]
+        for probe in running:
+            probe.run_in_background()
+        errors = []
+        try:
+            while running:
+                for probe in [p for p in running if not p.is_alive()]:
+                    running.remove(probe)
+                    try:
+                        probe.join()
+                    except Exception as ex:
+                        if self.mode == self.ALL_OF:
+                            raise
+                        errors.append(ex)
+                    else:
+                        if self.mode == self.ANY_OF:
+                            return True
+                    finally:
+                        self._collect(probe)
+                if not running:
+                    break
+                if deadline is not None and monotonic() > deadline:
+                    raise ProbeTimeout("Timeout exceeded.")
+                time.sleep(self.poll)
+        finally:
+            for probe in running:
+                probe.terminate()
+                try:
+                    probe.join()
+                except Exception as ex:
+                    logger.debug("terminated probe failed: %r", ex)
+        if errors:
+            raise errors[-1]
+        return True
 
 
 class ProbeTimeout(ConuException):
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Execution of commands on the host: all processes conu spawns are started by a
+CommandRunner, which enforces timeouts, captures output into bounded buffers and reports
+every invocation to instrumentation hooks.
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import logging
+import os
+import subprocess
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from conu.exceptions import ConuException
+from conu.utils import monotonic
+from conu.utils.instrumentation import COMMAND, measure
+
+logger = logging.getLogger(__name__)
+
+# pass as stdout or stderr to capture the stream
+CAPTURE = subprocess.PIPE
+# by default, keep only this many last bytes of a captured stream
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class CommandTimeout(ConuException):
+    """
+    Command didn't finish in time and was killed; `result` is the CommandResult with the
+    output captured so far.
+    """
+
+    def __init__(self, message, result):
+        super(CommandTimeout, self).__init__(message)
+        self.result = result
+
+
+class CommandResult(collections.namedtuple("CommandResult", [
+        "cmd", "returncode", "stdout", "stderr", "duration", "truncated"])):
+    """
+    Finished command: stdout and stderr are bytes (None if not captured), duration is in
+    seconds and truncated is True if a captured stream exceeded the limit and only its end
+    was kept.
+    """
+    __slots__ = ()
+
+
+class BoundedBuffer(object):
+    """
+    Buffer keeping at most max_size last bytes written to it.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        :param max_size: int, None means unlimited
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.truncated = False
+        self._chunks = collections.deque()
+
+    def write(self, data):
+        self._chunks.append(data)
+        self.size += len(data)
+        if self.max_size is None:
+            return
+        while self.size > self.max_size:
+            self.truncated = True
+            excess = self.size - self.max_size
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self.size -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self.size -= excess
+
+    def getvalue(self):
+        return b"".join(self._chunks)
+
+
+def _pump(stream, buf):
+    # os.read returns whatever is available, stream.read would wait for READ_SIZE bytes
+    fd = stream.fileno()
+    try:
+        for chunk in iter(lambda: os.read(fd, READ_SIZE), b""):
+            buf.write(chunk)
+    finally:
+        stream.close()
+
+
+class CommandRunner(object):
+    """
+    Run commands with optional timeouts; output is read while the command runs, so
+    commands with large output don't block and only the tail of it is kept in memory.
+    Independent commands can be run concurrently using run_many.
+    """
+
+    def __init__(self, timeout=None, max_output=DEFAULT_MAX_OUTPUT, parallelism=4):
+        """
+        :param timeout: int or float, default timeout of commands in seconds, None means
+                no timeout
+        :param max_output: int, default number of bytes kept of every captured stream,
+                None means unlimited
+        :param parallelism: int, number of commands run_many executes at the same time
+        """
+        self.timeout = timeout
+        self.max_output = max_output
+        self.parallelism = parallelism
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def popen(self, cmd, **kwargs):
+        """
+        start a command and don't wait for it, e.g. a process running in background
+
+        :param cmd: list of str
+        :param kwargs: keyword arguments passed to subprocess.Popen
+        :return: instance of subprocess.Popen
+        """
+        logger.debug("starting command: %s", cmd)
+        with measure(COMMAND, cmd[0]):
+            return subprocess.Popen(cmd, **kwargs)
+
+    def run(self, cmd, check=True, timeout=None, stdout=CAPTURE, stderr=CAPTURE,
+            max_output=-1, input=None, **kwargs):
+        """
+        run a command and wait for it to finish; raises subprocess.CalledProcessError if
+        it fails and `check` is set, CommandTimeout if it doesn't finish in time
+
+        :param cmd: list of str
+        :param check: bool, raise an exception if the command fails
+        :param timeout: int or float, seconds, defaults to the runner's timeout
+        :param stdout: CAPTURE, None (inherit), file object or descriptor
+        :param stderr: CAPTURE, None (inherit), subprocess.STDOUT, file object or descriptor
+        :param max_output: int, number of bytes kept of every captured stream, None means
+                unlimited, defaults to the runner's setting
+        :param input: bytes, written to stdin of the command, can't be combined with stdin
+        :param kwargs: keyword arguments passed to subprocess.Popen
+        :return: instance of CommandResult
+        """
+        timeout = self.timeout if timeout is None else timeout
+        max_output = self.max_output if max_output == -1 else max_output
+        stdin = kwargs.pop("stdin", None)
+        if input is not None:
+            if stdin is not None:
+                raise ValueError("stdin and input arguments may not both be used")
+            stdin = subprocess.PIPE
+        logger.debug("command: %s", cmd)
+        with measure(COMMAND, cmd[0]) as info:
+            start = monotonic()
+            process = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr,
+                                       **kwargs)
+            buffers, pumps = {}, []
+            for name in ("stdout", "stderr"):
+                stream = getattr(process, name)
+                if stream is not None:
+                    buffers[name] = BoundedBuffer(max_output)
+                    t = threading.Thread(target=_pump, args=(stream, buffers[name]))
+                    t.daemon = True
+                    t.start()
+                    pumps.append(t)
+            timed_out = []
+            timer = None
+            if timeout is not None:
+                def kill():
+                    timed_out.append(True)
+                    process.kill()
+                timer = threading.Timer(timeout, kill)
+                timer.daemon = True
+                timer.start()
+            try:
+                if input is not None:
+                    try:
+                        process.stdin.write(input)
+                        process.stdin.close()
+                    except (IOError, OSError):
+                        pass  # the command doesn't read its input
+                returncode = process.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            for t in pumps:
+                # children of a killed command may keep the pipes open, don't wait for them
+                t.join(1 if timed_out else None)
+            output = {}
+            for name in ("stdout", "stderr"):
+                output[name] = buffers[name].getvalue() if name in buffers else None
+            truncated = any(b.truncated for b in buffers.values())
+            result = CommandResult(cmd, returncode, output["stdout"], output["stderr"],
+                                   monotonic() - start, truncated)
+            if result.stdout is not None:
+                info["response_size"] = len(result.stdout)
+            if result.stderr:
+                logger.debug("stderr of %s: %s", cmd[0], result.stderr)
+            if timed_out:
+                raise CommandTimeout("command %s didn't finish in %s seconds" % (cmd, timeout),
+                                     result)
+            if check and returncode:
+                logger.error("command %s failed with %s: %s", cmd, returncode, result.stderr)
+                ex = subprocess.CalledProcessError(returncode, cmd, output=result.stdout)
+                ex.stderr = result.stderr
+                raise ex
+        return result
+
+    def run_many(self, cmds, check=True, **kwargs):
+        """
+        run independent commands concurrently, at most `parallelism` at a time; raises
+        subprocess.CalledProcessError of the first failed command once all of them finish
+
+        :param cmds: list of lists of str
+        :param check: bool, raise an exception if any of the commands fails
+        :param kwargs: keyword arguments passed to run
+        :return: list of CommandResult, in the same order as cmds
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.parallelism)
+        futures = [self._executor.submit(self.run, cmd, check=check, **kwargs) for cmd in cmds]
+        errors = []
+        results = []
+        for f in futures:
+            try:
+                results.append(f.result())
+            except Exception as ex:
+                errors.append(ex)
+        if errors:
+            raise errors[0]
+        return results
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_command_runner():
+    """
+    provide process-wide CommandRunner used by conu
+
+    :return: instance of CommandRunner
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = CommandRunner()
+        return _runner
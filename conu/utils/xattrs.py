@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+SELinux labels and POSIX ACLs set directly through extended attributes, without
+spawning chcon or setfacl. Functions return False when this is not possible (python 2,
+unsupported filesystem, rule syntax not handled here) so callers can fall back to the
+utilities.
+"""
+from __future__ import print_function, unicode_literals
+
+import grp
+import logging
+import os
+import pwd
+import stat
+import struct
+
+logger = logging.getLogger(__name__)
+
+SELINUX_XATTR = "security.selinux"
+ACL_ACCESS_XATTR = "system.posix_acl_access"
+
+# see linux/posix_acl_xattr.h and linux/posix_acl.h
+ACL_VERSION = 2
+ACL_USER_OBJ = 0x01
+ACL_USER = 0x02
+ACL_GROUP_OBJ = 0x04
+ACL_GROUP = 0x08
+ACL_MASK = 0x10
+ACL_OTHER = 0x20
+ACL_UNDEFINED_ID = 0xffffffff
+
+_HEADER = struct.Struct("<I")
+_ENTRY = struct.Struct("<HHI")
+_TAGS = {
+    "u": (ACL_USER_OBJ, ACL_USER), "user": (ACL_USER_OBJ, ACL_USER),
+    "g": (ACL_GROUP_OBJ, ACL_GROUP), "group": (ACL_GROUP_OBJ, ACL_GROUP),
+    "m": (ACL_MASK, None), "mask": (ACL_MASK, None),
+    "o": (ACL_OTHER, None), "other": (ACL_OTHER, None),
+}
+
+
+def native_supported():
+    """
+    are extended attributes accessible from python? (python 3 on Linux)
+
+    :return: bool
+    """
+    return hasattr(os, "setxattr")
+
+
+def get_selinux_context(path):
+    """
+    read SELinux context of a file
+
+    :param path: str
+    :return: str, e.g. "system_u:object_r:container_file_t:s0"
+    """
+    return os.getxattr(path, SELINUX_XATTR).rstrip(b"\0").decode("utf-8")
+
+
+def set_selinux_context(path, context=None, selinux_user=None, selinux_role=None,
+                        selinux_type=None, selinux_range=None):
+    """
+    set full SELinux context of a file or some of its fields (like chcon)
+
+    :param path: str
+    :param context: str, full context
+    :param selinux_user: str, SELinux user
+    :param selinux_role: str, SELinux role
+    :param selinux_type: str, SELinux type
+    :param selinux_range: str, SELinux range, e.g. "s0:c1,c2"
+    :return: bool, False if it could not be done natively
+    """
+    if not native_supported():
+        return False
+    try:
+        if not context:
+            fields = get_selinux_context(path).split(":", 3)
+            if len(fields) < 4:
+                fields.append("")
+            for i, value in enumerate([selinux_user, selinux_role, selinux_type,
+                                       selinux_range]):
+                if value:
+                    fields[i] = value
+            context = ":".join(f for f in fields if f)
+        os.setxattr(path, SELINUX_XATTR, context.encode("utf-8") + b"\0")
+    except (OSError, IOError) as ex:
+        logger.debug("can't set SELinux context of %s natively: %r", path, ex)
+        return False
+    return True
+
+
+def _parse_perms(perms):
+    if perms.isdigit():
+        value = int(perms)
+        if value > 7:
+            raise ValueError(perms)
+        return value
+    value = 0
+    for char in perms:
+        if char == "r":
+            value |= 4
+        elif char == "w":
+            value |= 2
+        elif char in "xX":
+            value |= 1
+        elif char != "-":
+            raise ValueError(perms)
+    return value
+
+
+def _resolve_id(name, named_tag):
+    if name.isdigit():
+        return int(name)
+    if named_tag == ACL_USER:
+        return pwd.getpwnam(name).pw_uid
+    return grp.getgrnam(name).gr_gid
+
+
+def parse_acl_rule(rule):
+    """
+    parse ACL rule in setfacl format
+
+    :param rule: str, e.g. "u:26:rwx", "group:wheel:r-x", "o::r"
+    :return: tuple (tag, id, perms)
+    """
+    parts = rule.strip().split(":")
+    if len(parts) == 2 and parts[0] in ("o", "other", "m", "mask"):
+        parts = [parts[0], "", parts[1]]
+    if len(parts) != 3 or parts[0] not in _TAGS:
+        raise ValueError("unsupported ACL rule: %s" % rule)
+    tag_name, qualifier, perms = parts
+    obj_tag, named_tag = _TAGS[tag_name]
+    if qualifier:
+        if named_tag is None:
+            raise ValueError("qualifier not allowed in %s" % rule)
+        return named_tag, _resolve_id(qualifier, named_tag), _parse_perms(perms)
+    return obj_tag, ACL_UNDEFINED_ID, _parse_perms(perms)
+
+
+def decode_acl(data):
+    """
+    :param data: bytes, value of system.posix_acl_access
+    :return: dict, (tag, id) -> perms
+    """
+    version, = _HEADER.unpack_from(data)
+    if version != ACL_VERSION:
+        raise ValueError("unsupported ACL version %s" % version)
+    entries = {}
+    for offset in range(_HEADER.size, len(data), _ENTRY.size):
+        tag, perms, ident = _ENTRY.unpack_from(data, offset)
+        entries[(tag, ident)] = perms
+    return entries
+
+
+def encode_acl(entries):
+    """
+    :param entries: dict, (tag, id) -> perms
+    :return: bytes, value of system.posix_acl_access
+    """
+    # the kernel requires entries sorted by tag and id
+    return _HEADER.pack(ACL_VERSION) + b"".join(
+        _ENTRY.pack(tag, perms, ident) for (tag, ident), perms in sorted(entries.items()))
+
+
+def _current_acl(path):
+    try:
+        return decode_acl(os.getxattr(path, ACL_ACCESS_XATTR))
+    except (OSError, IOError):
+        # no extended ACL: it's equivalent to permission bits
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+        return {(ACL_USER_OBJ, ACL_UNDEFINED_ID): (mode >> 6) & 7,
+                (ACL_GROUP_OBJ, ACL_UNDEFINED_ID): (mode >> 3) & 7,
+                (ACL_OTHER, ACL_UNDEFINED_ID): mode & 7}
+
+
+def apply_acl_rules(path, rules):
+    """
+    modify ACL of a file like `setfacl -m` does: existing entries are kept, the mask is
+    recalculated unless it's set explicitly; default ACLs ("d:...") are not supported
+
+    :param path: str
+    :param rules: list of str, rules in setfacl format, e.g. ["u:26:rwx", "g:wheel:rx"]
+    :return: bool, False if it could not be done natively
+    """
+    if not native_supported():
+        return False
+    try:
+        parsed = [parse_acl_rule(r) for r in rules]
+    except (ValueError, KeyError) as ex:
+        logger.debug("can't apply ACL rules %s natively: %r", rules, ex)
+        return False
+    try:
+        entries = _current_acl(path)
+        for tag, ident, perms in parsed:
+            entries[(tag, ident)] = perms
+        if not any(tag == ACL_MASK for tag, _, _ in parsed):
+            group_class = [p for (tag, _), p in entries.items()
+                           if tag in (ACL_USER, ACL_GROUP_OBJ, ACL_GROUP)]
+            if any(tag in (ACL_USER, ACL_GROUP) for tag, _ in entries):
+                mask = 0
+                for p in group_class:
+                    mask |= p
+                entries[(ACL_MASK, ACL_UNDEFINED_ID)] = mask
+        os.setxattr(path, ACL_ACCESS_XATTR, encode_acl(entries))
+    except (OSError, IOError, ValueError) as ex:
+        logger.debug("can't apply ACL rules %s natively: %r", rules, ex)
+        return False
+    return True
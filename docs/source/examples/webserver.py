@@ -27,11 +27,8 @@ def run_container(local_dir):
     backend = DockerBackend(logging_level=logging.DEBUG)
     image = backend.ImageClass(image_name, tag=image_tag)
 
-    # is the image present?
-    try:
-        image.get_metadata()
-    except Exception:
-        image.pull()
+    # is the image present? if not, pull it
+    image.ensure_present()
 
     # helper class to create `docker run ...` -- we want test the same experience as our users
     b = DockerRunBuilder(
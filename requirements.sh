@@ -8,4 +8,5 @@ dnf install -y acl atomic docker libselinux-utils \
   python3-pyxattr pyxattr \
   python3-docker python2-docker \
   python3-six python2-six \
+  python2-futures \
   python3-pip python2-pip
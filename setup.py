@@ -54,7 +54,9 @@ setup(
     packages=find_packages(exclude=['examples']),
     include_package_data=True,
     data_files=data_files.items(),
-    entry_points={},
+    entry_points={
+        "pytest11": ["conu = conu.pytest_plugin"],
+    },
     setup_requires=[],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -0,0 +1,16 @@
+"""
+Fixtures shared by unit tests
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from conu.testing import FakeDockerBackend
+
+
+@pytest.fixture()
+def backend():
+    """ fake docker backend with fedora:27 image """
+    with FakeDockerBackend() as b:
+        b.client.add_image("fedora", "27")
+        yield b
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import csv
+import json
+
+import pytest
+
+from conu import ConuException, DockerRunSpec
+from conu.bench import READY, StartupBenchmark
+
+
+def test_startup_benchmark(backend, tmpdir):
+    image = backend.ImageClass("fedora", tag="27")
+    spec = DockerRunSpec(command=["sleep", "infinity"], ports=[8080])
+    result = StartupBenchmark(image, spec, runs=3, port=8080, pause=0.01).run()
+
+    assert len(result.runs) == 3
+    for run in result.runs:
+        for phase in ["create", "start", "port_open", "stop", "remove", READY]:
+            assert run[phase] >= 0
+        assert run["first_log"] is None
+        assert run["http_ready"] is None
+    assert not backend.client.containers(all=True)
+    summary = result.summary()
+    assert summary[READY].count == 3
+    assert "first_log" not in summary
+
+    json_path, csv_path = str(tmpdir.join("r.json")), str(tmpdir.join("r.csv"))
+    result.to_json(json_path)
+    with open(json_path) as fd:
+        data = json.load(fd)
+    assert data["image"] == "fedora:27"
+    assert data["summary"][READY]["count"] == 3
+    result.to_csv(csv_path)
+    with open(csv_path) as fd:
+        rows = list(csv.reader(fd))
+    assert rows[0][:3] == ["phase", "count", "min"]
+    assert [r[0] for r in rows[1:]] == ["create", "start", "port_open", "stop", "remove", READY]
+
+
+def test_startup_benchmark_timeout(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    benchmark = StartupBenchmark(image, runs=1, log=True, timeout=0.1, pause=0.01)
+    with pytest.raises(ConuException):
+        benchmark.run()
+    # the container is removed even if it doesn't become ready
+    assert not backend.client.containers(all=True)
+    with pytest.raises(ConuException):
+        StartupBenchmark(image, http_path="/")
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from conu import get_selinux_status
+from conu.utils import capabilities, is_selinux_disabled
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+    capabilities.refresh()
+    yield
+    capabilities.refresh()
+
+
+def test_selinux_status(monkeypatch, tmpdir):
+    monkeypatch.setattr(capabilities, "SELINUXFS", str(tmpdir))
+    assert get_selinux_status() == "Disabled"
+    assert is_selinux_disabled()
+
+    tmpdir.join("enforce").write("1")
+    # cached until refreshed
+    assert get_selinux_status() == "Disabled"
+    assert get_selinux_status(refresh=True) == "Enforcing"
+    tmpdir.join("enforce").write("0")
+    capabilities.refresh("selinux")
+    assert capabilities.selinux_status() == "Permissive"
+    assert not is_selinux_disabled()
+
+
+def test_binaries(monkeypatch):
+    assert capabilities.has_binary("sh")
+    assert not capabilities.has_binary("surely-not-a-binary")
+    monkeypatch.setattr(capabilities, "find_executable", lambda name: "/bin/" + name)
+    # cached
+    assert not capabilities.has_binary("surely-not-a-binary")
+    capabilities.refresh("binary:surely-not-a-binary")
+    assert capabilities.binary_path("surely-not-a-binary") == "/bin/surely-not-a-binary"
+
+
+@pytest.mark.parametrize("help_text,supported", [
+    ("  -e, --env stringArray\n  -l, --label stringToString\n", True),
+    ("  -e, --env stringArray\n", False),
+])
+def test_s2i_supports_labels(monkeypatch, tmpdir, help_text, supported):
+    s2i = tmpdir.join("s2i")
+    s2i.write("#!/bin/sh\nprintf '%s'\n" % help_text)
+    s2i.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmpdir))
+    assert capabilities.s2i_supports_labels() is supported
+    s2i.remove()
+    # cached
+    assert capabilities.s2i_supports_labels() is supported
+
+
+def test_docker_api_version(backend):
+    calls = []
+    version = backend.client.version
+    backend.client.version = lambda: calls.append(1) or version()
+    assert capabilities.docker_api_version() == "1.35"
+    assert capabilities.docker_api_version() == "1.35"
+    assert len(calls) == 1
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from conu import ContainerPool, ConuException
+
+
+def make_pool(backend, **kwargs):
+    image = backend.ImageClass("fedora", tag="27")
+
+    def create():
+        c = backend.create_container(image, command=["sleep", "infinity"])
+        c.start()
+        return c
+    kwargs.setdefault("size", 2)
+    return ContainerPool(image, create_fnc=create, **kwargs)
+
+
+def running(backend):
+    return len(backend.client.containers())
+
+
+def test_pool_recreate(backend):
+    pool = make_pool(backend)
+    try:
+        with pool.leased(timeout=5) as c1:
+            assert c1.is_running()
+            with pool.leased(timeout=5) as c2:
+                assert c1 is not c2
+        c3 = pool.lease(timeout=5)
+        assert c3 not in (c1, c2)
+        pool.release(c3)
+    finally:
+        pool.close()
+    assert running(backend) == 0
+
+
+def test_pool_restart(backend):
+    pool = make_pool(backend, size=1, reset=ContainerPool.RESTART)
+    try:
+        with pool.leased(timeout=5) as c1:
+            backend.client.write_logs(c1.get_id(), b"dirty")
+        with pool.leased(timeout=5) as c2:
+            assert c2 is c1
+            assert c2.is_running()
+    finally:
+        pool.close()
+    assert running(backend) == 0
+
+
+def test_pool_custom_reset_and_prepare(backend):
+    reset, prepared = [], []
+    pool = make_pool(backend, size=1, reset=reset.append, prepare_fnc=prepared.append)
+    try:
+        with pool.leased(timeout=5) as c:
+            pass
+        with pool.leased(timeout=5):
+            pass
+    finally:
+        pool.close()
+    assert reset and reset[0] is c
+    assert c in prepared
+
+
+def test_pool_failing_create(backend):
+    def create():
+        raise RuntimeError("no way")
+    pool = ContainerPool(backend.ImageClass("fedora", tag="27"), size=1, create_fnc=create)
+    try:
+        with pytest.raises(ConuException):
+            pool.lease(timeout=0.2)
+        # waiting without timeout doesn't block forever
+        with pytest.raises(ConuException) as ex:
+            with pool.leased():
+                pass
+        assert "no way" in str(ex.value)
+    finally:
+        pool.close()
+    with pytest.raises(ConuException):
+        pool.lease()
+
+
+def test_pool_transient_failure(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    calls = []
+
+    def create():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("daemon is restarting")
+        c = backend.create_container(image, command=["sleep", "infinity"])
+        c.start()
+        return c
+    pool = ContainerPool(image, size=2, create_fnc=create, parallelism=1)
+    try:
+        # the failure is neither counted as an idle container nor handed to callers
+        c1 = pool.lease(timeout=5)
+        c2 = pool.lease(timeout=5)
+        assert c1 is not c2
+        assert running(backend) == 2
+        pool.release(c1)
+        pool.release(c2)
+    finally:
+        pool.close()
+    assert running(backend) == 0
+
+
+def test_pool_release_twice(backend):
+    pool = make_pool(backend, size=1)
+    try:
+        c = pool.lease(timeout=5)
+        pool.release(c)
+        with pytest.raises(ConuException):
+            pool.release(c)
+        assert pool._pending <= 1
+    finally:
+        pool.close()
+    assert running(backend) == 0
+
+
+def test_pool_restore(backend):
+    prepared = []
+    pool = make_pool(backend, size=1, reset=ContainerPool.RESTORE, prepare_fnc=prepared.append)
+    try:
+        with pool.leased(timeout=5) as c1:
+            first_id = c1.get_id()
+        with pool.leased(timeout=5) as c2:
+            assert c2 is c1
+            assert c2.get_id() != first_id
+            assert c2.is_running()
+        assert len(prepared) >= 2
+    finally:
+        pool.close()
+    assert running(backend) == 0
+    assert len(backend.client.images()) == 1
@@ -1,6 +1,13 @@
 from __future__ import print_function, unicode_literals
 
-from conu import DockerRunBuilder, DockerImage
+import io
+import os
+import tarfile
+
+import pytest
+
+from conu import ConuException, DockerRunBuilder, DockerRunSpec, DockerImage
+from conu.utils.runner import CommandResult, CommandRunner
 
 
 def test_dr_command_class():
@@ -21,6 +28,63 @@ def test_dr_command_class():
     assert "spy" not in DockerRunBuilder().options
 
 
+def test_run_spec_cli():
+    spec = DockerRunSpec(command=["sleep", "1"], name="web", ports={"8080": 18080},
+                         volumes=[("/src", "/dst", "Z")], env={"A": "1"}, memory="64m",
+                         cpus=0.5, additional_opts=["--rm"])
+    assert spec.to_cli_options() == [
+        "--name", "web", "-p", "18080:8080", "-v", "/src:/dst:Z", "-e", "A=1",
+        "--memory", "64m", "--cpus", "0.5", "--rm"]
+    builder = spec.to_builder()
+    builder.image_name = "voodoo"
+    assert builder.build()[-3:] == ["voodoo", "sleep", "1"]
+
+    clone = spec.replace(name="web2", env={"B": "2"})
+    assert spec.name == "web" and spec.env == (("A", "1"), )
+    assert clone.name == "web2" and clone.env == (("B", "2"), )
+    assert clone.ports == spec.ports
+    with pytest.raises(AttributeError):
+        spec.name = "x"
+
+
+def test_run_via_binary_does_not_modify_builder(backend, monkeypatch):
+    calls = []
+
+    def run(self, cmd, **kwargs):
+        calls.append(cmd)
+        return CommandResult(cmd, 0, b"abcdef\n", b"", 0.1, False)
+
+    monkeypatch.setattr(CommandRunner, "run", run)
+    monkeypatch.setattr(DockerImage, "get_id", lambda self: "sha256:voodoo")
+    builder = DockerRunBuilder(command=["ls"])
+    for _ in range(2):
+        assert DockerImage("voodoo").run_via_binary(builder).get_id() == "abcdef"
+    assert builder.options == []
+    assert calls[0] == calls[1]
+    assert calls[0].count("-d") == 1
+    assert calls[0][-2:] == ["sha256:voodoo", "ls"]
+
+
+def test_run_via_api(backend):
+    image = DockerImage("fedora", tag="27")
+    spec = DockerRunSpec(command=["sleep", "infinity"], ports={8080: 18080, "53/udp": None},
+                         env={"A": "1"}, labels={"app": "x"}, memory="64m")
+    containers = [image.run_via_api(spec.replace(name="w%d" % i)) for i in range(3)]
+    assert [c.name for c in containers] == ["w0", "w1", "w2"]
+    metadata = containers[0].get_metadata()
+    assert metadata["State"]["Running"]
+    assert metadata["Config"]["Cmd"] == ["sleep", "infinity"]
+    assert "A=1" in metadata["Config"]["Env"]
+    assert metadata["Config"]["Labels"]["app"] == "x"
+    assert metadata["Config"]["Labels"]["io.github.conu.session"] == backend.get_session_id()
+    assert metadata["HostConfig"]["PortBindings"]["8080/tcp"] == [
+        {"HostIp": "", "HostPort": "18080"}]
+    assert metadata["HostConfig"]["Memory"] == 64 * 1024 * 1024
+
+    with pytest.raises(ConuException):
+        image.run_via_api(DockerRunSpec(additional_opts=["--rm"]))
+
+
 def test_get_port_mappings():
     image_name = "registry.fedoraproject.org/fedora"
     image_tag = "27"
@@ -56,3 +120,72 @@ def test_get_port_mappings():
     finally:
         container.stop()
         container.delete()
+
+
+def write_file(backend, container, path, content):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        info = tarfile.TarInfo(os.path.basename(path))
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    backend.client.put_archive(container.get_id(), os.path.dirname(path), buf.getvalue())
+
+
+def test_snapshot_restore(backend):
+    image = DockerImage("fedora", tag="27")
+    c = image.run_via_api(DockerRunSpec(command=["sleep", "infinity"], name="db",
+                                        ports={5432: 15432}))
+    write_file(backend, c, "/var/lib/db", b"warm")
+    snapshot = c.snapshot()
+    original_id = c.get_id()
+    write_file(backend, c, "/var/lib/db", b"dirty")
+
+    c.restore(snapshot)
+    assert c.get_id() != original_id
+    assert c.is_running()
+    assert c.get_metadata()["Name"] == "/db"
+    assert c.get_port_mappings(5432) == [{"HostIp": "0.0.0.0", "HostPort": "15432"}]
+    stream, _ = backend.client.get_archive(c.get_id(), "/var/lib/db")
+    with tarfile.open(fileobj=io.BytesIO(b"".join(stream))) as tar:
+        assert tar.extractfile("db").read() == b"warm"
+    assert len(backend.client.containers(all=True)) == 1
+
+    c.delete_snapshot(snapshot)
+    with pytest.raises(ConuException):
+        c.snapshot(checkpoint=True)
+
+
+def read_file(backend, container, path):
+    stream, _ = backend.client.get_archive(container.get_id(), path)
+    with tarfile.open(fileobj=io.BytesIO(b"".join(stream))) as tar:
+        return tar.extractfile(os.path.basename(path)).read()
+
+
+def test_snapshot_restore_volumes(backend):
+    backend.client.add_image("postgres", "10", config={
+        "Cmd": ["postgres"], "Env": [], "Labels": None,
+        "Volumes": {"/var/lib/postgresql/data": {}}})
+    image = DockerImage("postgres", tag="10")
+    c = image.run_via_api(DockerRunSpec(name="db"))
+    write_file(backend, c, "/var/lib/postgresql/data/PG_VERSION", b"warm")
+    write_file(backend, c, "/etc/motd", b"warm")
+    snapshot = c.snapshot()
+    assert list(snapshot.volumes) == ["/var/lib/postgresql/data"]
+    labels = backend.client.inspect_image(snapshot.image_id)["Config"]["Labels"]
+    assert labels["io.github.conu.session"] == backend.get_session_id()
+    write_file(backend, c, "/var/lib/postgresql/data/PG_VERSION", b"dirty")
+
+    c.restore(snapshot)
+    assert read_file(backend, c, "/var/lib/postgresql/data/PG_VERSION") == b"warm"
+    assert read_file(backend, c, "/etc/motd") == b"warm"
+
+    archives = list(snapshot.volumes.values())
+    c.delete_snapshot(snapshot)
+    assert not any(os.path.exists(a) for a in archives)
+    with pytest.raises(ConuException):
+        c.snapshot(checkpoint=True)
+
+    shared = image.run_via_api(DockerRunSpec(name="shared",
+                                             volumes=[("/tmp", "/srv/data")]))
+    with pytest.raises(ConuException):
+        shared.snapshot()
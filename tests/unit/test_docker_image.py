@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import gzip
+import multiprocessing
+import os
+import subprocess
+
+import pytest
+from docker.errors import NotFound
+
+from conu import DockerImage, DockerRunBuilder, DockerRunSpec, S2IDockerImage, ConuException
+from conu.backend.docker import reaper
+from conu.backend.docker.cache import (
+    get_image_metadata_cache, ImageMetadataCache, S2IBuildCache
+)
+from conu.backend.docker.container import DockerContainer
+from conu.backend.docker.reaper import reap_dead_sessions, remove_session_containers
+from conu.backend.docker.session import PID_LABEL, SESSION_LABEL, get_session_id
+
+
+class InspectCountingClient(object):
+    def __init__(self):
+        self.images = {"fedora:27": {"Id": "sha256:f27"}}
+        self.inspects = 0
+        self.pulls = 0
+
+    def inspect_image(self, ident):
+        self.inspects += 1
+        for name, metadata in self.images.items():
+            if ident in (name, metadata["Id"]):
+                return metadata
+        raise NotFound("no such image: %s" % ident)
+
+    def pull(self, repository, tag=None, **kwargs):
+        self.pulls += 1
+        self.images["%s:%s" % (repository, tag)] = {"Id": "sha256:%s" % repository}
+        return iter([])
+
+    def tag(self, image, repository, tag):
+        self.images["%s:%s" % (repository, tag)] = self.inspect_image(image)
+
+    def remove_image(self, ident, force=False):
+        for name, metadata in list(self.images.items()):
+            if ident in (name, metadata["Id"]):
+                del self.images[name]
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    c = InspectCountingClient()
+    monkeypatch.setattr("conu.backend.docker.client.client", c)
+    get_image_metadata_cache().clear()
+    yield c
+    get_image_metadata_cache().clear()
+
+
+def test_metadata_cache_shared(client):
+    for _ in range(100):
+        assert DockerImage("fedora", tag="27").get_id() == "sha256:f27"
+    assert client.inspects == 1
+    # refresh bypasses the cache
+    DockerImage("fedora", tag="27").get_metadata(refresh=True)
+    assert client.inspects == 2
+
+
+def test_metadata_cache_invalidation(client):
+    image = DockerImage("fedora", tag="27")
+    image.get_id()
+    new_image = image.tag_image(tag="test")
+    assert new_image.get_id() == "sha256:f27"
+    new_image.rmi(via_name=True)
+    assert get_image_metadata_cache().get("fedora:test") is None
+    # removing via name invalidated all names of the image
+    assert get_image_metadata_cache().get("fedora:27") is None
+
+
+def test_metadata_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("conu.backend.docker.cache.monotonic", lambda: now[0])
+    cache = ImageMetadataCache(ttl=10)
+    cache.put("fedora:27", {"Id": "sha256:f27"})
+    assert cache.get("sha256:f27") == {"Id": "sha256:f27"}
+    now[0] += 11
+    assert cache.get("fedora:27") is None
+
+
+def test_ensure_present(client):
+    DockerImage("fedora", tag="27").ensure_present()
+    DockerImage("fedora", tag="27").ensure_present()
+    assert client.pulls == 0
+    assert client.inspects == 1
+
+    image = DockerImage("centos", tag="7")
+    image.ensure_present()
+    assert client.pulls == 1
+    assert image.get_id() == "sha256:centos"
+
+
+class ArchiveClient(object):
+    def __init__(self):
+        self.loaded = b""
+
+    def get_image(self, image, chunk_size=None):
+        for i in range(10):
+            yield (b"%d" % i) * chunk_size
+
+    def load_image(self, data):
+        for chunk in data:
+            self.loaded += chunk
+        return iter([{"stream": "Loaded image: registry.local:5000/fedora:27\n"}])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_save_load(monkeypatch, tmpdir, compress):
+    c = ArchiveClient()
+    monkeypatch.setattr("conu.backend.docker.client.client", c)
+    path = str(tmpdir.join("fedora.tar"))
+    checksum = DockerImage("fedora", tag="27").save_to_file(path, compress=compress,
+                                                            chunk_size=16)
+    with open(path + ".sha256") as fd:
+        assert fd.read().split()[0] == checksum
+
+    image = DockerImage.load_from_file(path, chunk_size=16)
+    assert image.get_full_name() == "registry.local:5000/fedora:27"
+    if compress:
+        assert gzip.decompress(c.loaded) == b"".join((b"%d" % i) * 16 for i in range(10))
+    else:
+        assert c.loaded == b"".join((b"%d" % i) * 16 for i in range(10))
+
+    with open(path, "ab") as fd:
+        fd.write(b"garbage")
+    with pytest.raises(ConuException):
+        DockerImage.load_from_file(path)
+
+
+class BrokenArchiveClient(ArchiveClient):
+    def get_image(self, image, chunk_size=None):
+        yield b"0" * chunk_size
+        raise IOError("connection reset")
+
+
+def test_save_failure_keeps_previous_file(monkeypatch, tmpdir):
+    monkeypatch.setattr("conu.backend.docker.client.client", BrokenArchiveClient())
+    path = tmpdir.join("fedora.tar")
+    path.write("previous")
+    with pytest.raises(IOError):
+        DockerImage("fedora", tag="27").save_to_file(str(path), chunk_size=16)
+    assert path.read() == "previous"
+    assert sorted(p.basename for p in tmpdir.listdir()) == ["fedora.tar"]
+
+
+def test_load_without_checksum(monkeypatch, tmpdir):
+    c = ArchiveClient()
+    monkeypatch.setattr("conu.backend.docker.client.client", c)
+    path = tmpdir.join("fedora.tar")
+    path.write("content")
+    # a plain `docker save` tarball
+    image = DockerImage.load_from_file(str(path))
+    assert image.get_full_name() == "registry.local:5000/fedora:27"
+    assert c.loaded == b"content"
+    with pytest.raises(ConuException):
+        DockerImage.load_from_file(str(path), require_checksum=True)
+    assert c.loaded == b"content"
+
+
+def _fill_build_cache(path, prefix):
+    cache = S2IBuildCache(path)
+    for i in range(20):
+        cache.put("%s-%d" % (prefix, i), "sha256:%s%d" % (prefix, i))
+
+
+def test_s2i_build_cache_concurrent_processes(tmpdir):
+    path = str(tmpdir.join("cache", "s2i.json"))
+    processes = [multiprocessing.Process(target=_fill_build_cache, args=(path, p))
+                 for p in "abcd"]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    cache = S2IBuildCache(path)
+    assert all(cache.get("%s-%d" % (p, i)) == "sha256:%s%d" % (p, i)
+               for p in "abcd" for i in range(20))
+
+
+class S2IClient(InspectCountingClient):
+    def __init__(self):
+        super(S2IClient, self).__init__()
+        self.images["builder:latest"] = {"Id": "sha256:builder"}
+        self.builds = []
+
+    def build(self, cmd, stdout=None, **kwargs):
+        self.builds.append(cmd)
+        if stdout:
+            stdout.write(("building %s\n" % cmd[-1]).encode("utf-8"))
+        if cmd[-2] == "broken:latest":
+            raise subprocess.CalledProcessError(1, cmd)
+        self.images[cmd[-1]] = {"Id": "sha256:app%d" % len(self.builds)}
+
+
+@pytest.fixture()
+def s2i(monkeypatch, tmpdir):
+    c = S2IClient()
+    monkeypatch.setattr("conu.backend.docker.client.client", c)
+    monkeypatch.setattr("conu.backend.docker.image.run_cmd", c.build)
+    monkeypatch.setattr("conu.backend.docker.cache.s2i_build_cache",
+                        S2IBuildCache(str(tmpdir.join("cache", "s2i.json"))))
+    monkeypatch.setattr(S2IDockerImage, "s2i_exists", True)
+    monkeypatch.setattr("conu.backend.docker.image.s2i_supports_labels", lambda: True)
+    get_image_metadata_cache().clear()
+    yield c
+    get_image_metadata_cache().clear()
+
+
+def test_s2i_build_cache(s2i, tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("app.py").write("print('hello')")
+    builder = S2IDockerImage("builder")
+
+    builder.extend(str(source), "app:latest", cache=True)
+    builder.extend(str(source), "app:latest", cache=True)
+    assert len(s2i.builds) == 1
+    assert not [a for a in s2i.builds[0] if a.startswith(SESSION_LABEL)]
+
+    # the name was reused for something else, cached image is tagged back
+    s2i.images["<none>"] = s2i.images["app:latest"]
+    s2i.images["app:latest"] = {"Id": "sha256:other"}
+    builder.extend(str(source), "app:latest", cache=True)
+    assert len(s2i.builds) == 1
+    assert s2i.images["app:latest"]["Id"] == "sha256:app1"
+
+    source.join("app.py").write("print('hello world')")
+    builder.extend(str(source), "app:latest", cache=True)
+    assert len(s2i.builds) == 2
+
+
+def test_s2i_incremental(s2i, tmpdir):
+    builder = S2IDockerImage("builder")
+    builder.extend(str(tmpdir), "app:latest", incremental=True)
+    builder.extend(str(tmpdir), "app:latest", incremental=True)
+    assert "--incremental" not in s2i.builds[0]
+    assert "--incremental" in s2i.builds[1]
+    assert "%s=%s" % (SESSION_LABEL, get_session_id()) in s2i.builds[0]
+
+
+def test_s2i_without_label_support(s2i, monkeypatch, tmpdir):
+    monkeypatch.setattr("conu.backend.docker.image.s2i_supports_labels", lambda: False)
+    S2IDockerImage("builder").extend(str(tmpdir), "app:latest")
+    assert "--label" not in s2i.builds[0]
+
+
+def test_s2i_extend_many(s2i, tmpdir):
+    s2i.images["broken:latest"] = {"Id": "sha256:broken"}
+    builds = [(S2IDockerImage("builder"), "app-%d" % i) for i in range(5)]
+    builds.append((S2IDockerImage("broken"), "app-broken"))
+    results = S2IDockerImage.extend_many(builds, str(tmpdir), parallelism=3,
+                                         log_dir=str(tmpdir))
+    assert [r.builder for r in results] == [b for b, _ in builds]
+    for r, (_, name) in zip(results[:-1], builds):
+        assert r.error is None
+        assert r.image.name == name
+        assert r.duration >= 0
+        with open(r.log_path) as fd:
+            assert fd.read() == "building %s\n" % name
+    assert results[-1].image is None
+    assert isinstance(results[-1].error, ConuException)
+    assert os.path.basename(results[-1].log_path) == "app-broken.log"
+
+
+def test_run_or_reuse(backend, monkeypatch):
+    def run_detached(image, run_command_instance):
+        # the fake doesn't run the binary: interpret options the way docker does
+        opts = run_command_instance.options
+        labels = dict(opts[i + 1].split("=", 1) for i, o in enumerate(opts) if o == "--label")
+        name = opts[opts.index("--name") + 1]
+        response = backend.client.create_container(image.get_id(), name=name, labels=labels)
+        backend.client.start(response["Id"])
+        return DockerContainer(image, response["Id"])
+
+    monkeypatch.setattr(DockerImage, "_run_detached", run_detached)
+    image = DockerImage("fedora", tag="27")
+    builder = DockerRunBuilder(command=["sleep", "infinity"], additional_opts=["-e", "A=1"])
+    with pytest.raises(ConuException):
+        image.run_or_reuse(builder)
+
+    first = image.run_or_reuse(builder, name="dev")
+    assert first.name == "dev"
+    assert builder.options == ["-e", "A=1"]
+    assert image.run_or_reuse(builder, name="dev").get_id() == first.get_id()
+
+    changed = DockerRunBuilder(command=["sleep", "infinity"], additional_opts=["-e", "A=2"])
+    second = image.run_or_reuse(changed, name="dev")
+    assert second.get_id() != first.get_id()
+    assert len(backend.client.containers(all=True)) == 1
+
+    second.stop()
+    third = image.run_or_reuse(changed, name="dev")
+    assert third.get_id() != second.get_id()
+    assert third.is_running()
+
+    # the reusable container outlives the session and its process
+    labels = third.get_metadata()["Config"]["Labels"]
+    assert SESSION_LABEL not in labels and PID_LABEL not in labels
+    session_container = image.run_via_api(DockerRunSpec(command=["sleep", "infinity"]))
+    monkeypatch.setattr(reaper, "pid_alive", lambda pid: False)
+    assert reap_dead_sessions() == 1
+    assert remove_session_containers(get_session_id()) == 0
+    assert [c["Id"] for c in backend.client.containers(all=True)] == [third.get_id()]
+    assert session_container.get_id() != third.get_id()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import threading
+
+import pytest
+from docker.errors import NotFound
+
+from conu import DockerImage, ConuException, pull_many, PullProgress
+from conu.backend.docker.pull import MultiPullProgress
+
+
+# layer "shared" is part of both images
+REGISTRY = {
+    "fedora:27": ["shared", "fedora"],
+    "centos:7": ["shared", "centos"],
+}
+
+
+class RegistryClient(object):
+    """ stand-in for docker.APIClient pulling from a local registry """
+    def __init__(self, present=None):
+        self.present = present or {}
+        self.pulled = []
+        self.lock = threading.Lock()
+
+    def pull(self, repository, tag=None, stream=False, decode=False):
+        name = "%s:%s" % (repository, tag)
+        with self.lock:
+            self.pulled.append(name)
+        if name not in REGISTRY:
+            yield {"error": "manifest for %s not found" % name}
+            return
+        yield {"status": "Pulling from %s" % repository, "id": tag}
+        for layer in REGISTRY[name]:
+            yield {"status": "Pulling fs layer", "progressDetail": {}, "id": layer}
+        for layer in REGISTRY[name]:
+            for current in (50, 100):
+                yield {"status": "Downloading", "id": layer,
+                       "progressDetail": {"current": current, "total": 100}}
+            yield {"status": "Download complete", "progressDetail": {}, "id": layer}
+            yield {"status": "Pull complete", "progressDetail": {}, "id": layer}
+        yield {"status": "Digest: sha256:%s" % repository}
+        yield {"status": "Status: Downloaded newer image for %s" % name}
+
+    def inspect_image(self, name):
+        try:
+            return self.present[name]
+        except KeyError:
+            raise NotFound("no such image")
+
+    def inspect_distribution(self, name):
+        return {"Descriptor": {"digest": "sha256:%s" % name.split(":")[0]}}
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    c = RegistryClient()
+    monkeypatch.setattr("conu.backend.docker.client.client", c)
+    return c
+
+
+def test_pull_progress(registry):
+    seen = []
+    progress = DockerImage("fedora", tag="27").pull(progress_callback=seen.append)
+    assert seen and all(p is progress for p in seen)
+    assert progress.layer_ids == ["shared", "fedora"]
+    assert progress.downloaded_bytes == 200
+    assert progress.total_bytes == 200
+    assert progress.digest == "sha256:fedora"
+    assert progress.status == "Status: Downloaded newer image for fedora:27"
+    assert all(l.done for l in progress.layers.values())
+    assert progress.throughput > 0
+
+
+def test_pull_progress_cached_layer():
+    progress = PullProgress("fedora:27")
+    progress.update(b'{"status": "Already exists", "progressDetail": {}, "id": "abc"}')
+    assert progress.layers["abc"].cached
+    assert progress.downloaded_bytes == 0
+    assert progress.total_bytes == 0
+
+
+def test_multi_pull_progress_shared_layers():
+    multi = MultiPullProgress()
+    pulls = [multi.add("fedora:27"), multi.add("centos:7")]
+
+    def download(progress):
+        for current in range(1, 501):
+            progress.update({"status": "Downloading", "id": "shared",
+                             "progressDetail": {"current": current, "total": 500}})
+
+    threads = [threading.Thread(target=download, args=(p, )) for p in pulls]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert list(multi.layers) == ["shared"]
+    assert multi.downloaded_bytes == 500
+    assert [p.total_bytes for p in pulls] == [500, 500]
+
+
+def test_pull_error(registry):
+    with pytest.raises(ConuException):
+        DockerImage("waldo").pull()
+
+
+def test_pull_skip_present(registry):
+    registry.present["fedora:27"] = {"RepoDigests": ["fedora@sha256:fedora"]}
+    registry.present["centos:7"] = {"RepoDigests": ["centos@sha256:outdated"]}
+    assert DockerImage("fedora", tag="27").pull(skip_present=True).skipped
+    assert not DockerImage("centos", tag="7").pull(skip_present=True).skipped
+    assert registry.pulled == ["centos:7"]
+
+
+def test_pull_many(registry):
+    images = [DockerImage("fedora", tag="27"), DockerImage("centos", tag="7"),
+              DockerImage("fedora", tag="27")]
+    calls = []
+    multi = pull_many(images, parallelism=2,
+                      progress_callback=lambda p, m: calls.append((p.image_name, m)))
+    assert sorted(registry.pulled) == ["centos:7", "fedora:27"]
+    assert len(multi.pulls) == 2
+    assert all(m is multi for _, m in calls)
+    # the shared layer is accounted once
+    assert sorted(multi.layers) == ["centos", "fedora", "shared"]
+    assert multi.downloaded_bytes == 300
+    assert sum(p.downloaded_bytes for p in multi.pulls) == 400
+
+
+def test_pull_many_failure(registry):
+    with pytest.raises(ConuException):
+        pull_many([DockerImage("fedora", tag="27"), DockerImage("waldo")])
+    assert "fedora:27" in registry.pulled
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import datetime
+
+from conu.backend.docker.session import (
+    SESSION_LABEL, get_session_id, label_options, session_labels
+)
+
+
+def test_label_options():
+    labels = session_labels("s1")
+    assert labels[SESSION_LABEL] == "s1"
+    options = label_options(labels)
+    assert options[0] == "--label"
+    assert "%s=s1" % SESSION_LABEL in options
+    assert session_labels()[SESSION_LABEL] == get_session_id()
+
+
+def test_cleanup_session(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    mine = [backend.create_container(image) for _ in range(3)]
+    mine[0].start()
+    other = backend.create_container(image, labels=session_labels("other"))
+    backend.client.add_image("built", config={"Labels": session_labels()})
+    backend.client.add_image("foreign")
+
+    summary = backend.cleanup()
+    assert sorted(summary.containers) == sorted(c.get_id() for c in mine)
+    assert len(summary.images) == 1
+    assert not summary.errors
+    assert str(summary) == "removed 3 containers and 1 images, 0 failures"
+    assert [c["Id"] for c in backend.client.containers(all=True)] == [other.get_id()]
+    assert len(backend.client.images()) == 2
+
+
+def test_cleanup_older_than(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    old = backend.create_container(image)
+    backend.client._containers[old.get_id()].created -= 3600
+    new = backend.create_container(image, labels=session_labels("other"))
+
+    summary = backend.cleanup(older_than=datetime.timedelta(minutes=30), all_sessions=True,
+                              images=False)
+    assert summary.containers == [old.get_id()]
+    assert [c["Id"] for c in backend.client.containers(all=True)] == [new.get_id()]
+    assert backend.cleanup(images=False).containers == []
+    assert backend.cleanup(all_sessions=True, images=False).containers == [new.get_id()]
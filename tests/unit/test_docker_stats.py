@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import time
+
+import pytest
+
+from conu import ResourceSampler
+from conu.backend.docker.stats import (
+    SAMPLE_FIELDS, ResourceSample, parse_stats, percentile, summarize
+)
+
+
+def test_parse_stats():
+    stats = {
+        "cpu_stats": {"cpu_usage": {"total_usage": 300, "percpu_usage": [150, 150]},
+                      "system_cpu_usage": 2000},
+        "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+        "memory_stats": {"usage": 5000, "limit": 10000, "stats": {"total_inactive_file": 1000}},
+        "blkio_stats": {"io_service_bytes_recursive": [
+            {"op": "Read", "value": 10}, {"op": "Write", "value": 20},
+            {"op": "Read", "value": 5}, {"op": "Total", "value": 35}]},
+        "networks": {"eth0": {"rx_bytes": 1, "tx_bytes": 2},
+                     "eth1": {"rx_bytes": 3, "tx_bytes": 4}},
+        "pids_stats": {"current": 3},
+    }
+    sample = parse_stats(stats, timestamp=1.0)
+    assert sample.cpu_percent == pytest.approx(40.0)
+    assert sample.memory_usage == 4000
+    assert sample.memory_limit == 10000
+    assert (sample.block_read, sample.block_write) == (15, 20)
+    assert (sample.net_rx, sample.net_tx) == (4, 6)
+    assert sample.pids == 3
+
+    # first sample of a stream doesn't have previous CPU counters
+    del stats["precpu_stats"]
+    assert parse_stats(stats).cpu_percent == 0.0
+
+
+def test_percentiles():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5.0
+    s = summarize(range(1, 101))
+    assert (s.count, s.min, s.max, s.mean) == (100, 1.0, 100.0, 50.5)
+    assert s.p90 == pytest.approx(90.1)
+
+
+def test_sampler_max_samples():
+    sampler = ResourceSampler(None, max_samples=3)
+    for i in range(10):
+        sampler.record(ResourceSample(i, *([i] * len(SAMPLE_FIELDS))))
+    assert len(sampler) == 3
+    assert [s.pids for s in sampler.samples()] == [7, 8, 9]
+    assert sampler.summary()["net_rx"].min == 7
+
+
+def test_sampler(backend):
+    backend.client.stats_interval = 0.01
+    c = backend.create_container(backend.ImageClass("fedora", tag="27"))
+    c.start()
+    backend.client.set_usage(c.get_id(), cpu_percent=25.0, memory_usage=1024)
+    assert c.stats(stream=False).memory_usage == 1024
+
+    with ResourceSampler(c, interval=0, max_samples=5) as sampler:
+        deadline = time.time() + 10
+        while len(sampler) < 5:
+            assert time.time() < deadline, "the sampler didn't record 5 samples"
+            time.sleep(0.01)
+        backend.client.set_usage(c.get_id(), memory_usage=4096)
+        time.sleep(0.1)
+    assert len(sampler) == 5
+    summary = sampler.summary()
+    assert summary["memory_usage"].max == 4096
+    assert summary["cpu_percent"].p50 == pytest.approx(25.0)
+    assert sampler.samples()[-1].memory_usage == 4096
+    assert sampler.error is None
+
+    c.stop()
+    assert list(c.stats()) == []
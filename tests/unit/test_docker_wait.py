@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import threading
+import time
+
+import pytest
+
+from conu import (ConuException, DockerImage, DockerRunSpec, as_completed, wait_all,
+                  wait_any)
+from conu.backend.docker import wait
+
+
+def _run(backend, count):
+    image = DockerImage("fedora", tag="27")
+    spec = DockerRunSpec(command=["sleep", "infinity"])
+    return [image.run_via_api(spec.replace(name="job-%d" % i)) for i in range(count)]
+
+
+def _exit_later(backend, container, delay, exit_code):
+    t = threading.Timer(delay, backend.client.exit_container, args=(container.get_id(),),
+                        kwargs={"exit_code": exit_code})
+    t.daemon = True
+    t.start()
+
+
+def test_wait_all(backend):
+    containers = _run(backend, 5)
+    for i, c in enumerate(containers):
+        _exit_later(backend, c, 0.05 * (5 - i), i)
+    assert wait_all(containers, timeout=10, parallelism=2) == [0, 1, 2, 3, 4]
+
+
+def test_as_completed(backend, monkeypatch):
+    monkeypatch.setattr(wait, "ROTATE_CHUNK", 0.05)
+    containers = _run(backend, 4)
+    for delay, i in [(0.1, 3), (0.4, 1), (0.7, 0), (1.0, 2)]:
+        _exit_later(backend, containers[i], delay, 10 + i)
+    # the containers are rotated, so the order is right with fewer parallel waits too
+    completed = list(as_completed(containers, timeout=10, parallelism=2))
+    assert [(c.name, code) for c, code in completed] == [
+        ("job-3", 13), ("job-1", 11), ("job-0", 10), ("job-2", 12)]
+
+
+def test_wait_any_and_timeout(backend):
+    containers = _run(backend, 3)
+    _exit_later(backend, containers[2], 0.1, 7)
+    container, exit_code = wait_any(containers, timeout=10)
+    assert container is containers[2]
+    assert exit_code == 7
+
+    start = time.time()
+    with pytest.raises(ConuException):
+        wait_all(containers, timeout=0.5)
+    assert time.time() - start < 2
+
+
+def test_wait_for_no_containers():
+    assert wait_all([]) == []
+    assert list(as_completed([])) == []
+    with pytest.raises(ConuException):
+        wait_any([])
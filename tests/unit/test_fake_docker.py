@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import io
+import tarfile
+
+import pytest
+from docker.errors import APIError, NotFound
+
+from conu import ConuException, ProbeTimeout
+from conu.testing import FakeDockerBackend, FakeExecResult
+
+
+def handler(metadata, command):
+    if command[0] == "false":
+        return FakeExecResult(exit_code=1)
+    return " ".join(command[1:]).encode("utf-8")
+
+
+@pytest.fixture()
+def backend():
+    with FakeDockerBackend(exec_handler=handler) as b:
+        b.client.add_image("fedora", "27")
+        yield b
+
+
+def test_container_lifecycle(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    c = backend.create_container(image, command=["sleep", "infinity"], name="sleeper")
+    assert c.get_status() == "created"
+    assert not c.is_running()
+    c.start()
+    assert c.is_running()
+    assert c.get_IPv4s()
+    assert c.execute(["echo", "hello"]) == b"hello"
+    with pytest.raises(ConuException):
+        c.execute(["false"])
+    with pytest.raises(APIError):
+        c.delete()
+    c.stop()
+    assert c.get_status() == "exited"
+    assert c.exit_code() == 0
+    c.delete()
+    assert not c.is_running()
+    with pytest.raises(NotFound):
+        c.get_metadata()
+
+
+def test_exit_and_logs(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    c = backend.create_container(image, command=["echo", "hi"])
+    c.start()
+    backend.client.exit_container(c.get_id(), exit_code=42, logs=b"hi\n")
+    assert c.wait()["StatusCode"] == 42
+    assert c.exit_code() == 42
+    assert c.logs() == b"hi\n"
+    actions = [e["Action"] for e in backend.client.events(decode=True)]
+    assert actions == ["create", "start", "die"]
+
+
+def test_port_readiness(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    c = backend.create_container(image, ports=[8080], name="web",
+                                 host_config=backend.client.create_host_config(
+                                     port_bindings={8080: 18080}))
+    c.start()
+    assert c.get_ports() == ["8080"]
+    assert c.get_port_mappings(8080) == [{"HostIp": "0.0.0.0", "HostPort": "18080"}]
+    backend.client.set_port_delay("web", 8080, 0.3)
+    assert not c.is_port_open(8080)
+    c.wait_for_port(8080, timeout=2, pause=0.1)
+    assert not c.is_port_open(1234)
+    with pytest.raises(ProbeTimeout):
+        c.wait_for_port(1234, timeout=0.3, pause=0.1)
+    c.kill()
+    assert c.exit_code() == 137
+    assert not c.is_port_open(8080)
+
+
+def test_images(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    new_image = image.tag_image(tag="test")
+    assert new_image.get_id() == image.get_id()
+    new_image.rmi(via_name=True)
+    assert image.get_metadata()
+
+    with pytest.raises(ConuException):
+        backend.ImageClass("centos", tag="7").pull()
+    backend.client.registry["centos:7"] = {"Cmd": ["bash"]}
+    centos = backend.ImageClass("centos", tag="7")
+    centos.ensure_present()
+    assert centos.get_metadata()["Config"]["Cmd"] == ["bash"]
+
+
+def test_archive(backend):
+    c = backend.create_container(backend.ImageClass("fedora", tag="27"))
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        info = tarfile.TarInfo("secret")
+        info.size = 3
+        tar.addfile(info, io.BytesIO(b"abc"))
+    backend.client.put_archive(c.get_id(), "/tmp", buf.getvalue())
+    stream, stat = backend.client.get_archive(c.get_id(), "/tmp/secret")
+    assert stat["size"] == 3
+    with tarfile.open(fileobj=io.BytesIO(b"".join(stream))) as tar:
+        assert tar.extractfile("secret").read() == b"abc"
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import json
+import logging
+import subprocess
+
+import pytest
+
+from conu import run_cmd
+from conu.utils.instrumentation import (
+    COMMAND, DOCKER_API, HistogramHook, InMemorySpanExporter, LoggingHook, SpanHook,
+    measure_decoded_payloads, register_hook, unregister_hook
+)
+
+
+@pytest.fixture()
+def hook():
+    events = []
+    register_hook(events.append)
+    yield events
+    unregister_hook(events.append)
+
+
+def test_docker_calls(backend, hook):
+    image = backend.ImageClass("fedora", tag="27")
+    c = backend.create_container(image)
+    c.start()
+    c.get_metadata()
+    with pytest.raises(Exception):
+        backend.ContainerClass(image, "missing").get_metadata()
+    calls = [(e.kind, e.name) for e in hook]
+    assert (DOCKER_API, "start") in calls
+    assert calls.count((DOCKER_API, "inspect_container")) == 2
+    assert hook[-1].error is not None
+    assert all(e.duration >= 0 for e in hook)
+    inspect = [e for e in hook if e.name == "inspect_container"][0]
+    # decoded responses are not serialized just to get their size by default
+    assert inspect.response_size is None
+
+    measure_decoded_payloads()
+    try:
+        metadata = c.get_metadata()
+    finally:
+        measure_decoded_payloads(False)
+    assert hook[-1].response_size == len(json.dumps(metadata))
+
+
+def test_commands(hook):
+    assert run_cmd(["echo", "hello"], return_output=True) == "hello\n"
+    with pytest.raises(subprocess.CalledProcessError):
+        run_cmd(["false"])
+    assert [(e.kind, e.name, e.response_size) for e in hook] == [
+        (COMMAND, "echo", 6), (COMMAND, "false", None)]
+    assert hook[1].error is not None
+
+
+def test_histogram_and_spans(caplog):
+    histogram = HistogramHook()
+    exporter = InMemorySpanExporter()
+    spans = SpanHook(exporter, batch_size=2)
+    hooks = [histogram, spans, LoggingHook(level=logging.INFO)]
+    for h in hooks:
+        register_hook(h)
+    try:
+        with caplog.at_level(logging.INFO):
+            for _ in range(3):
+                run_cmd(["true"])
+            run_cmd(["echo", "x"], return_output=True)
+    finally:
+        for h in hooks:
+            unregister_hook(h)
+    assert "cmd true took" in caplog.text
+
+    rows = dict((r.name, r) for r in histogram.report())
+    assert rows["true"].count == 3
+    assert rows["echo"].bytes == 2
+    assert rows["true"].p50 <= rows["true"].p99
+
+    assert len(exporter.spans) == 4
+    spans.flush()
+    assert len(exporter.spans) == 4
+    span = exporter.spans[0]
+    assert span["name"] == "cmd true"
+    assert len(span["traceId"]) == 32 and len(span["spanId"]) == 16
+    assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
+    assert span["status"]["code"] == 1
+
+
+def test_span_hook_flushed_on_unregister():
+    exporter = InMemorySpanExporter()
+    spans = SpanHook(exporter, batch_size=10)
+    register_hook(spans)
+    try:
+        run_cmd(["true"])
+        assert exporter.spans == []
+    finally:
+        unregister_hook(spans)
+    assert len(exporter.spans) == 1
@@ -1,6 +1,9 @@
+import multiprocessing
+import threading
 import time
 
-from conu import Probe, ProbeTimeout, CountExceeded
+from conu import (Probe, ProbeGroup, ProbeTimeout, CountExceeded, get_probe_registry,
+                  ExponentialBackoff, FastThenSlow)
 
 import pytest
 
@@ -17,6 +20,10 @@ def value_err_raise():
     raise ValueError
 
 
+def say_no():
+    return False
+
+
 class TestProbe(object):
     def test_in_backgroud(self):
         probe = Probe(timeout=5, pause=0.5, fnc=snoozer, seconds=2)
@@ -169,3 +176,152 @@ class TestProbe(object):
 
         for p in pool:
             assert not p.is_alive()
+
+    def test_report(self):
+        probe = Probe(timeout=5, count=3, pause=0.1, fnc=say_no)
+        with pytest.raises(CountExceeded):
+            probe.run()
+        report = probe.report
+        assert report.name == "say_no"
+        assert not report.success
+        assert "CountExceeded" in report.error
+        assert [a.number for a in report.attempts] == [1, 2, 3]
+        assert all(a.result is False and a.exception is None for a in report.attempts)
+        assert report.duration >= report.function_time + report.startup_time
+        assert report.wait_time >= 0
+
+        probe = Probe(timeout=5, pause=0.1, expected_exceptions=ValueError,
+                      fnc=value_err_raise, count=1)
+        with pytest.raises(CountExceeded):
+            probe.run()
+        assert probe.report.attempts[0].exception == "ValueError()"
+
+    def test_report_in_background(self):
+        probe = Probe(timeout=5, pause=0.1, fnc=snoozer, seconds=0.2)
+        probe.run_in_background()
+        probe.join()
+        assert probe.report.success
+        assert len(probe.report.attempts) == 1
+        assert probe.report.attempts[0].duration >= 0.2
+
+    def test_registry(self):
+        registry = get_probe_registry()
+        registry.clear()
+        Probe(timeout=5, pause=0.1, fnc=snoozer, seconds=0.3).run()
+        Probe(timeout=5, pause=0.1, fnc=snoozer, seconds=0).run()
+        slowest = registry.slowest(1)
+        assert slowest[0].attempts[0].duration >= 0.3
+        summary = registry.summary()
+        assert summary["snoozer"]["runs"] == 2
+        assert summary["snoozer"]["attempts"] == 2
+        assert summary["snoozer"]["max"] >= 0.3
+
+
+class TestProbeGroup(object):
+    def test_all_of(self):
+        start = time.time()
+        group = ProbeGroup.all_of(Probe(fnc=snoozer, seconds=1, pause=0.1),
+                                  Probe(fnc=snoozer, seconds=1, pause=0.1), timeout=5)
+        assert group.run()
+        assert (time.time() - start) < 1.9, "Conditions should be evaluated concurrently"
+        assert len(group.reports) == 2
+
+        # the first failure ends the group
+        start = time.time()
+        group = ProbeGroup.all_of(Probe(fnc=snoozer, seconds=10, timeout=-1),
+                                  Probe(fnc=say_no, count=1, pause=0.1), timeout=20)
+        with pytest.raises(CountExceeded):
+            group.run()
+        assert (time.time() - start) < 3, "Group should end once a condition fails"
+
+    def test_any_of(self):
+        start = time.time()
+        group = ProbeGroup.any_of(Probe(fnc=say_no, pause=0.1, timeout=-1),
+                                  Probe(fnc=snoozer, seconds=0.5, timeout=-1), timeout=10)
+        assert group.run()
+        assert (time.time() - start) < 3, "Group should end once a condition is met"
+
+        group = ProbeGroup.any_of(Probe(fnc=say_no, pause=0.1, count=1),
+                                  Probe(fnc=say_no, pause=0.1, count=2), timeout=10)
+        with pytest.raises(CountExceeded):
+            group.run()
+
+    def test_default_timeout(self):
+        # members without explicit timeout run until the deadline of the group
+        group = ProbeGroup.all_of(Probe(fnc=snoozer, seconds=1.5, pause=0.1), timeout=5)
+        assert group.run()
+
+        # explicit timeouts still apply
+        group = ProbeGroup.all_of(Probe(fnc=snoozer, seconds=1.5, pause=0.1, timeout=0.5),
+                                  timeout=5)
+        with pytest.raises(ProbeTimeout):
+            group.run()
+
+    def test_sequence(self):
+        start = time.time()
+        group = ProbeGroup.sequence(Probe(fnc=snoozer, seconds=0.5, timeout=-1),
+                                    Probe(fnc=snoozer, seconds=0.5, timeout=-1), timeout=5)
+        assert group.run()
+        assert (time.time() - start) > 1
+
+        # the deadline is shared by all the conditions
+        start = time.time()
+        group = ProbeGroup.sequence(*[Probe(fnc=snoozer, seconds=1, pause=0.1, timeout=5)
+                                      for _ in range(4)], timeout=2)
+        with pytest.raises(ProbeTimeout):
+            group.run()
+        assert (time.time() - start) < 3.5, "Deadline of the group should be respected"
+
+
+def test_schedules():
+    backoff = ExponentialBackoff(initial=0.1, factor=2, cap=1, jitter=0)
+    assert [backoff.delay(i) for i in range(1, 7)] == [0.1, 0.2, 0.4, 0.8, 1, 1]
+    assert backoff.delay(10 ** 6) == 1
+
+    backoff = ExponentialBackoff(initial=0.1, factor=2, cap=1, jitter=0.5)
+    for i in range(1, 10):
+        assert min(0.1 * 2 ** (i - 1), 1) * 0.5 <= backoff.delay(i) <= 1
+
+    schedule = FastThenSlow(fast=0.1, slow=2, fast_attempts=3)
+    assert [schedule.delay(i) for i in range(1, 6)] == [0.1, 0.1, 2, 2, 2]
+
+
+def test_probe_schedule():
+    def slow_no():
+        time.sleep(0.5)
+        return False
+
+    start = time.time()
+    probe = Probe(timeout=5, count=4, fnc=say_no,
+                  schedule=ExponentialBackoff(initial=0.1, factor=2, jitter=0))
+    with pytest.raises(CountExceeded):
+        probe.run()
+    # 0.1 + 0.2 + 0.4
+    assert 0.7 <= time.time() - start < 2
+    assert len(probe.report.attempts) == 4
+
+    # the final attempt is moved earlier, so it can finish before the deadline
+    probe = Probe(timeout=2, pause=5, fnc=slow_no)
+    with pytest.raises(ProbeTimeout):
+        probe.run()
+    assert len(probe.report.attempts) >= 2
+
+
+def test_many_background_probes():
+    ready_at = time.time() + 0.5
+
+    def ready():
+        return time.time() >= ready_at
+
+    threads_before = threading.active_count()
+    probes = [Probe(timeout=10, pause=0.1, fnc=ready) for _ in range(500)]
+    for probe in probes:
+        probe.run_in_background()
+    assert all(probe.is_alive() for probe in probes)
+    # attempts are executed by a shared pool of threads, no processes are spawned
+    assert threading.active_count() - threads_before <= 33
+    assert not multiprocessing.active_children()
+    for probe in probes:
+        probe.join()
+        assert probe.report.success
+    assert not any(probe.is_alive() for probe in probes)
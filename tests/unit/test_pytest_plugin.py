@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import socket
+import threading
+import time
+
+from conu.backend.docker.reaper import reap_dead_sessions, remove_session_containers
+from conu.backend.docker.session import (
+    HOST_LABEL, PID_LABEL, get_session_id, session_labels, set_session_id
+)
+from conu import pytest_plugin
+from conu.pytest_plugin import prepare_images, pytest_configure
+
+
+def test_remove_session_containers(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    for session in ["a", "a", "b"]:
+        backend.create_container(image, labels=session_labels(session)).start()
+    backend.create_container(image)
+    assert remove_session_containers("a") == 2
+    assert len(backend.client.containers(all=True)) == 2
+
+
+def test_reap_dead_sessions(backend):
+    image = backend.ImageClass("fedora", tag="27")
+    dead = session_labels("dead")
+    dead[PID_LABEL] = "999999999"
+    elsewhere = dict(dead, **{HOST_LABEL: socket.gethostname() + "-other"})
+    # e.g. a container with --net=host: the same hostname, but other PIDs
+    other_namespace = dict(dead, **{HOST_LABEL: socket.gethostname() + "/1"})
+    for labels in [session_labels("alive"), dead, elsewhere, other_namespace]:
+        backend.create_container(image, labels=labels)
+    assert reap_dead_sessions() == 1
+    remaining = [c["Labels"] for c in backend.client.containers(all=True)]
+    assert session_labels("alive") in remaining
+    assert elsewhere in remaining
+    assert other_namespace in remaining
+
+
+def test_prepare_images(backend):
+    backend.client.registry["centos:7"] = {}
+    prepare_images(["fedora:27", "centos:7"], [])
+    assert backend.ImageClass("centos", tag="7").get_id()
+
+
+def test_prepare_images_parallelism(backend, monkeypatch):
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def build(name, path):
+        with lock:
+            running.append(name)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(name)
+        backend.client.add_image(name)
+
+    monkeypatch.setattr(pytest_plugin, "_build_image", build)
+    backend.client.registry["centos:7"] = {}
+    builds = [("app-%d" % i, "/tmp") for i in range(6)]
+    prepare_images(["centos:7"], builds, parallelism=2)
+    assert len(peak) == 6
+    assert max(peak) == 2
+    assert backend.ImageClass("centos", tag="7").get_id()
+
+
+def test_session_id_per_worker():
+    class Config(object):
+        pass
+    original = get_session_id()
+    try:
+        controller = Config()
+        pytest_configure(controller)
+        worker = Config()
+        worker.workerinput = {"conu_session_id": controller._conu_session_id,
+                              "workerid": "gw1"}
+        pytest_configure(worker)
+        assert worker._conu_session_id == controller._conu_session_id + "-gw1"
+        assert get_session_id() == worker._conu_session_id
+    finally:
+        set_session_id(original)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import subprocess
+import time
+
+import pytest
+
+from conu import run_cmd
+from conu.utils.runner import BoundedBuffer, CommandRunner, CommandTimeout
+
+
+def test_bounded_buffer():
+    buf = BoundedBuffer(5)
+    for chunk in [b"abc", b"def", b"ghijkl"]:
+        buf.write(chunk)
+    assert buf.getvalue() == b"hijkl"
+    assert buf.truncated
+    unlimited = BoundedBuffer()
+    unlimited.write(b"x" * 100)
+    assert unlimited.getvalue() == b"x" * 100 and not unlimited.truncated
+
+
+def test_run():
+    runner = CommandRunner(max_output=10)
+    result = runner.run(["sh", "-c", "seq 1 100; echo oops >&2"])
+    assert result.returncode == 0
+    assert result.stdout == b"98\n99\n100\n"
+    assert result.truncated
+    assert result.stderr == b"oops\n"
+    assert result.duration > 0
+    assert runner.run(["cat"], input=b"hello").stdout == b"hello"
+    with pytest.raises(ValueError):
+        runner.run(["cat"], input=b"hello", stdin=subprocess.PIPE)
+
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        runner.run(["sh", "-c", "echo broken >&2; exit 3"])
+    assert ex.value.returncode == 3
+    assert ex.value.stderr == b"broken\n"
+    assert runner.run(["false"], check=False).returncode == 1
+
+
+def test_timeout():
+    with pytest.raises(CommandTimeout) as ex:
+        CommandRunner(timeout=0.2).run(["sh", "-c", "echo started; sleep 10"])
+    assert ex.value.result.stdout == b"started\n"
+    with pytest.raises(CommandTimeout):
+        run_cmd(["sleep", "10"], timeout=0.2)
+
+
+def test_run_many():
+    runner = CommandRunner(parallelism=4)
+    start = time.time()
+    results = runner.run_many([["sh", "-c", "sleep 0.3; echo %d" % i] for i in range(4)])
+    assert [r.stdout for r in results] == [b"0\n", b"1\n", b"2\n", b"3\n"]
+    # ran concurrently
+    assert time.time() - start < 1.0
+    with pytest.raises(subprocess.CalledProcessError):
+        runner.run_many([["true"], ["false"]])
+
+
+def test_run_cmd(capfd):
+    assert run_cmd(["echo", "hi"], return_output=True) == "hi\n"
+    assert run_cmd(["true"]) is None
+    # stderr is passed through unless it's captured explicitly
+    run_cmd(["sh", "-c", "echo warning >&2"])
+    assert capfd.readouterr().err == "warning\n"
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        run_cmd(["sh", "-c", "echo broken >&2; exit 1"], stderr=subprocess.PIPE)
+    assert ex.value.stderr == b"broken\n"
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, unicode_literals
 
+import errno
 import os
+import shutil
 import subprocess
 
 import pytest
 
-from conu import ConuException, random_str, Directory
+from conu import ConuException, random_str, Directory, DirectorySet
+from conu.utils import filesystem, xattrs
 
 
 def test_random_str():
@@ -75,6 +78,182 @@ def test_directory_acl():
     assert not os.path.isdir(str(d))
 
 
+@pytest.mark.skipif(not xattrs.native_supported(), reason="needs os.setxattr")
+def test_directory_acl_native():
+    p = os.path.join("/tmp/", random_str())
+    with Directory(p, mode=0o0700, facl_rules=["u:26:rwx", "group:26:r-x"]) as d:
+        acl = xattrs.decode_acl(os.getxattr(str(d), xattrs.ACL_ACCESS_XATTR))
+        assert acl[(xattrs.ACL_USER, 26)] == 7
+        assert acl[(xattrs.ACL_GROUP, 26)] == 5
+        assert acl[(xattrs.ACL_USER_OBJ, xattrs.ACL_UNDEFINED_ID)] == 7
+        assert acl[(xattrs.ACL_MASK, xattrs.ACL_UNDEFINED_ID)] == 7
+        # group permission bits show the mask
+        assert oct(os.stat(p).st_mode)[-3:] == "770"
+
+
+def test_directory_acl_fallback(monkeypatch):
+    commands = []
+    monkeypatch.setattr(filesystem, "run_cmd", commands.append)
+    p = os.path.join("/tmp/", random_str())
+    # default ACLs are not handled natively
+    with Directory(p, facl_rules=["d:u:26:rwx"]):
+        pass
+    assert commands == [["setfacl", "-m", "d:u:26:rwx", p]]
+
+
+def test_directory_set():
+    root = os.path.join("/tmp/", random_str())
+    spec = {
+        "a": {"mode": 0o0700},
+        "a/b": {"mode": 0o0750},
+        "c": None,
+    }
+    with DirectorySet(spec, root=root) as volumes:
+        assert len(volumes) == 3
+        assert volumes["a/b"].path == os.path.join(root, "a/b")
+        assert oct(os.stat(volumes["a"].path).st_mode)[-3:] == "700"
+        assert oct(os.stat(volumes["a/b"].path).st_mode)[-3:] == "750"
+        assert os.path.isdir(volumes["c"].path)
+    assert not os.path.exists(os.path.join(root, "a"))
+    assert not os.path.exists(os.path.join(root, "c"))
+    os.rmdir(root)
+
+
+def test_directory_set_nested_with_similar_sibling():
+    root = os.path.join("/tmp/", random_str())
+    # "a-b" sorts between "a" and "a/c"
+    volumes = DirectorySet({"a": None, "a-b": None, "a/c": None}, root=root)
+    volumes.initialize()
+    assert sorted(d.path for d in volumes._top_level()) == [
+        os.path.join(root, "a"), os.path.join(root, "a-b")]
+    volumes.clean()
+    assert os.listdir(root) == []
+    os.rmdir(root)
+
+
+def test_directory_set_groups_fallback(monkeypatch):
+    commands = []
+    monkeypatch.setattr(filesystem, "run_cmd", commands.append)
+    monkeypatch.setattr(xattrs, "native_supported", lambda: False)
+    paths = [os.path.join("/tmp/", random_str()) for _ in range(3)]
+    directories = [Directory(paths[0], facl_rules=["u:26:rwx"]),
+                   Directory(paths[1], facl_rules=["u:26:rwx"]),
+                   Directory(paths[2], facl_rules=["u:27:rwx"])]
+    directory_set = Directory.initialize_many(directories)
+    try:
+        assert commands == [["setfacl", "-m", "u:26:rwx", paths[0], paths[1]],
+                            ["setfacl", "-m", "u:27:rwx", paths[2]]]
+    finally:
+        directory_set.clean()
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_directory_set_tmpfs(monkeypatch):
+    commands = []
+
+    def run_cmd(cmd):
+        commands.append(cmd)
+        if cmd[0] == "umount":
+            # nothing was mounted for real, pretend the content is gone
+            shutil.rmtree(os.path.join(cmd[1], "data"))
+    monkeypatch.setattr(filesystem, "run_cmd", run_cmd)
+    directory_set = DirectorySet({"data": None}, tmpfs=True, tmpfs_size="64m")
+    root = directory_set.root
+    directory_set.initialize()
+    assert os.path.isdir(os.path.join(root, "data"))
+    directory_set.clean()
+    assert commands == [["mount", "-t", "tmpfs", "-o", "size=64m", "tmpfs", root],
+                        ["umount", root]]
+    assert not os.path.exists(root)
+
+
+def test_directory_set_tmpfs_existing_root(monkeypatch, tmpdir):
+    monkeypatch.setattr(filesystem, "run_cmd", lambda cmd: None)
+    tmpdir.join("keep").write("content")
+    directory_set = DirectorySet({}, root=str(tmpdir), tmpfs=True)
+    directory_set.initialize()
+    directory_set.clean()
+    # the root wasn't created by the set, it's left untouched
+    assert tmpdir.join("keep").read() == "content"
+
+
+def _populate(path, width=3, depth=3):
+    for i in range(width):
+        with open(os.path.join(path, "file-%d" % i), "w") as fd:
+            fd.write("data")
+        if depth:
+            sub = os.path.join(path, "dir-%d" % i)
+            os.mkdir(sub)
+            _populate(sub, width, depth - 1)
+
+
+def _trash(path):
+    prefix = filesystem.TRASH_PREFIX + os.path.basename(path)
+    return [n for n in os.listdir(os.path.dirname(path)) if n.startswith(prefix)]
+
+
+def test_directory_clean_background():
+    p = os.path.join("/tmp/", random_str())
+    d = Directory(p)
+    d.initialize()
+    _populate(p)
+    d.clean(background=True)
+    # the path can be reused right away
+    assert not os.path.exists(p)
+    filesystem.get_tree_remover().wait()
+    assert not _trash(p)
+
+
+def test_tree_remover_permission_denied(monkeypatch):
+    p = os.path.join("/tmp/", random_str())
+    os.makedirs(os.path.join(p, "owned-by-container"))
+    _populate(os.path.join(p, "owned-by-container"), width=2, depth=1)
+    unlink = os.unlink
+
+    def denying_unlink(path, *args, **kwargs):
+        if "owned-by-container" in path:
+            raise OSError(errno.EACCES, "Permission denied", path)
+        return unlink(path, *args, **kwargs)
+
+    commands = []
+
+    def run_cmd(cmd):
+        commands.append(cmd)
+        host_path = cmd[cmd.index("-v") + 1].split(":")[0]
+        for name in os.listdir(host_path):
+            shutil.rmtree(os.path.join(host_path, name))
+    monkeypatch.setattr(os, "unlink", denying_unlink)
+    monkeypatch.setattr(filesystem, "run_cmd", run_cmd)
+
+    remover = filesystem.TreeRemover(parallelism=2, cleanup_image="fedora-minimal")
+    remover.remove(p).result(timeout=10)
+    assert len(commands) == 1
+    assert commands[0][:2] == ["docker", "run"]
+    assert "fedora-minimal" in commands[0]
+    assert not _trash(p)
+
+    os.makedirs(os.path.join(p, "owned-by-container"))
+    _populate(os.path.join(p, "owned-by-container"), width=1, depth=0)
+    remover = filesystem.TreeRemover(cleanup_image=None)
+    with pytest.raises(ConuException):
+        remover.remove(p).result(timeout=10)
+    monkeypatch.undo()
+    for name in _trash(p):
+        shutil.rmtree(os.path.join("/tmp/", name))
+
+
+def test_parse_acl_rule():
+    assert xattrs.parse_acl_rule("u:26:rwx") == (xattrs.ACL_USER, 26, 7)
+    assert xattrs.parse_acl_rule("u::r") == (xattrs.ACL_USER_OBJ, xattrs.ACL_UNDEFINED_ID, 4)
+    assert xattrs.parse_acl_rule("g:root:5") == (xattrs.ACL_GROUP, 0, 5)
+    assert xattrs.parse_acl_rule("o::-w-") == (xattrs.ACL_OTHER, xattrs.ACL_UNDEFINED_ID, 2)
+    for rule in ["d:u:26:rwx", "o:1:r", "u:26:rwz"]:
+        with pytest.raises(ValueError):
+            xattrs.parse_acl_rule(rule)
+    entries = {(xattrs.ACL_USER_OBJ, xattrs.ACL_UNDEFINED_ID): 7, (xattrs.ACL_USER, 26): 5}
+    assert xattrs.decode_acl(xattrs.encode_acl(entries)) == entries
+
+
 def test_user_ownership_int():
     p = os.path.join("/tmp/", random_str())
     with Directory(p, user_owner=99) as d: